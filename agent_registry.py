@@ -0,0 +1,147 @@
+import time
+from typing import Optional
+from state_store import MemoryStateStore
+
+
+class AgentRegistry:
+    """Agent status map with an index of available agents, kept in a state store.
+
+    Available agents sit in ranked sets (overall and per skill) scored by the
+    time they became idle, so the longest-idle agent is popped first in
+    O(log n). A claim is only granted to whoever creates the agent's "claim"
+    key, so concurrent webhook threads, workers or nodes sharing the store can
+    never claim the same agent twice.
+    """
+
+    AGENTS = "agent"
+    CLAIMS = "claim"
+    AVAILABLE = "available"
+
+    def __init__(self, store=None):
+        self.store = store or MemoryStateStore()
+
+    def __contains__(self, agent_id):
+        return self.store.get(self.AGENTS, agent_id) is not None
+
+    def _pools(self, agent):
+        return [self.AVAILABLE] + [f"{self.AVAILABLE}:{skill}" for skill in agent["skills"]]
+
+    def _save(self, agent_id, agent, **changes):
+        agent = {**agent, **changes}
+        self.store.set(self.AGENTS, agent_id, agent)
+        return agent
+
+    def _set_status(self, agent_id, agent, status):
+        if status == "available":
+            if agent["status"] != "available":
+                agent = self._save(agent_id, agent, status=status, idle_since=time.time())
+                self.store.delete(self.CLAIMS, agent_id)
+                for pool in self._pools(agent):
+                    self.store.rank_add(pool, agent_id, agent["idle_since"])
+            return
+        for pool in self._pools(agent):
+            self.store.rank_remove(pool, agent_id)
+        if status == "busy":
+            self.store.set(self.CLAIMS, agent_id, True)
+        else:
+            self.store.delete(self.CLAIMS, agent_id)
+        self._save(agent_id, agent, status=status)
+
+    def register(self, agent_id: str, identity: str, skills=None, status: Optional[str] = None):
+        """Add or update an agent; new agents start available, known agents keep their status and skills"""
+        agent = self.store.get(self.AGENTS, agent_id)
+        if agent is None:
+            agent = {"identity": identity, "status": None, "skills": sorted(skills or ()), "idle_since": None}
+            self._set_status(agent_id, agent, status or "available")
+            return
+        if skills is not None and sorted(skills) != agent["skills"]:
+            # Re-index under the new skills
+            for pool in self._pools(agent):
+                self.store.rank_remove(pool, agent_id)
+            status = status or agent["status"]
+            agent = self._save(agent_id, agent, identity=identity, skills=sorted(skills), status=None)
+            self._set_status(agent_id, agent, status)
+            return
+        agent = self._save(agent_id, agent, identity=identity)
+        if status:
+            self._set_status(agent_id, agent, status)
+
+    def unregister(self, agent_id: str):
+        agent = self.store.get(self.AGENTS, agent_id)
+        if agent:
+            for pool in self._pools(agent):
+                self.store.rank_remove(pool, agent_id)
+            self.store.delete(self.CLAIMS, agent_id)
+            self.store.delete(self.AGENTS, agent_id)
+
+    def get(self, agent_id: str) -> Optional[dict]:
+        return self.store.get(self.AGENTS, agent_id)
+
+    def status(self, agent_id: str) -> Optional[str]:
+        agent = self.store.get(self.AGENTS, agent_id)
+        return agent["status"] if agent else None
+
+    def set_status(self, agent_id: str, status: str) -> bool:
+        agent = self.store.get(self.AGENTS, agent_id)
+        if agent is None:
+            return False
+        self._set_status(agent_id, agent, status)
+        return True
+
+    def _take(self, agent_id):
+        """Finish claiming an agent; None if another claimer won it or the index entry was stale"""
+        if not self.store.add(self.CLAIMS, agent_id, True):
+            return None
+        agent = self.store.get(self.AGENTS, agent_id)
+        if agent is None or agent["status"] != "available":
+            self.store.delete(self.CLAIMS, agent_id)
+            return None
+        for pool in self._pools(agent):
+            self.store.rank_remove(pool, agent_id)
+        self._save(agent_id, agent, status="busy")
+        return agent_id, agent["identity"]
+
+    def claim(self, skill: Optional[str] = None, agent_ids=None) -> Optional[tuple]:
+        """Atomically mark the longest-idle available agent busy; returns (agent_id, identity)
+
+        With `agent_ids`, only those agents are considered (O(len(agent_ids))).
+        """
+        pool = f"{self.AVAILABLE}:{skill}" if skill else self.AVAILABLE
+        while True:
+            if agent_ids is None:
+                agent_id = self.store.rank_pop(pool)
+            else:
+                scored = sorted((score, aid) for aid in agent_ids
+                                for score in [self.store.rank_score(pool, aid)] if score is not None)
+                agent_id = next((aid for _, aid in scored if self.store.rank_remove(pool, aid)), None)
+            if agent_id is None:
+                return None
+            claimed = self._take(agent_id)
+            if claimed:
+                return claimed
+
+    def claim_agent(self, agent_id: str) -> bool:
+        """Atomically mark a specific agent busy if it is available"""
+        if self.status(agent_id) != "available":
+            return False
+        return self._take(agent_id) is not None
+
+    def release(self, agent_id: str) -> bool:
+        """Busy -> available; agents in any other status (e.g. offline) are left alone"""
+        agent = self.store.get(self.AGENTS, agent_id)
+        if agent is None or agent["status"] != "busy":
+            return False
+        self._set_status(agent_id, agent, "available")
+        return True
+
+    def peek(self, skill: Optional[str] = None) -> Optional[tuple]:
+        agent_id = self.store.rank_first(f"{self.AVAILABLE}:{skill}" if skill else self.AVAILABLE)
+        agent = self.store.get(self.AGENTS, agent_id) if agent_id else None
+        return (agent_id, agent["identity"]) if agent else None
+
+    def counts(self, agent_ids=None) -> tuple:
+        """(available, busy) counts, overall or among the given agents"""
+        if agent_ids is None:
+            return self.store.rank_count(self.AVAILABLE), self.store.count(self.CLAIMS)
+        statuses = [self.status(aid) for aid in agent_ids]
+        return statuses.count("available"), statuses.count("busy")
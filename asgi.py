@@ -0,0 +1,68 @@
+"""Async serving mode: `uvicorn asgi:app --host 0.0.0.0 --port 8080`
+
+Twilio voice webhooks are answered on the event loop; their REST calls run on
+a background pool after the TwiML is sent. Every other route is served by the
+Flask app through asgiref's WSGI adapter.
+"""
+import time
+from urllib.parse import parse_qsl
+from asgiref.wsgi import WsgiToAsgi
+from webhooks import WebhookHandlers, WebhookError
+from services import ServiceConfigError
+from metrics import HTTP_REQUEST_SECONDS
+from main import create_app
+
+
+class TwilioWebhookApp:
+    def __init__(self, services, fallback):
+        self.services = services
+        self.fallback = fallback
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        name = WebhookHandlers.ROUTES.get(scope["path"]) if scope["type"] == "http" else None
+        if name is None:
+            return await self.fallback(scope, receive, send)
+
+        started = time.perf_counter()
+        body, more_body = b"", True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+        # Same precedence as Flask's request.values: query string over form body
+        params = dict(parse_qsl(body.decode()))
+        params.update(parse_qsl(scope["query_string"].decode()))
+
+        try:
+            handlers = self.services.webhook_handlers
+            twiml, tasks = await handlers.handle_async(name, params)
+            status, content_type = 200, b"text/xml; charset=utf-8"
+        except WebhookError as e:
+            twiml, tasks = str(e), []
+            status, content_type = e.status, b"text/plain; charset=utf-8"
+        except ServiceConfigError as e:
+            twiml, tasks = str(e), []
+            status, content_type = 503, b"text/plain; charset=utf-8"
+        payload = twiml.encode()
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", content_type),
+                                (b"content-length", str(len(payload)).encode())]})
+        await send({"type": "http.response.body", "body": payload})
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, scope["path"], scope["method"], str(status))
+        if tasks:
+            handlers.run_background(tasks)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+flask_app = create_app()
+app = TwilioWebhookApp(flask_app.extensions["services"], WsgiToAsgi(flask_app))
@@ -0,0 +1,64 @@
+"""Worker cold start: import time, create_app() time and first-request latency.
+
+    python benchmarks/bench_startup.py [runs]
+
+Each run is a fresh interpreter on a throwaway SQLite database (migrated
+before timing starts). Dummy Twilio credentials are used when none are set;
+no request below reaches Twilio or Gemini.
+"""
+import os
+import sys
+import json
+import statistics
+import subprocess
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r'''
+import sys, time, json
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+app = main.create_app({"SQLALCHEMY_DATABASE_URI": sys.argv[1]}, warm_up=False)
+created = time.perf_counter()
+from migrations import migrate
+migrate(app)
+client = app.test_client()
+timings = {"import_ms": (imported - started) * 1000, "create_app_ms": (created - imported) * 1000}
+for name, path in (("stats", "/api/stats/summary"), ("calls", "/api/calls?limit=10"),
+                   ("token", "/token?agent_id=AG001"), ("token_again", "/token?agent_id=AG001")):
+    t = time.perf_counter()
+    status = client.get(path).status_code
+    timings[name + "_first_request_ms"] = (time.perf_counter() - t) * 1000
+    assert status == 200, (path, status)
+print(json.dumps(timings))
+'''
+
+
+def run_once(database):
+    env = dict(os.environ)
+    for name in ("TWILIO_ACCOUNT_SID", "TWILIO_API_KEY_SID", "TWILIO_API_SECRET", "TWILIO_AUTH_TOKEN",
+                 "TWILIO_TWIML_APP_SID", "TWILIO_CALLER_ID"):
+        env.setdefault(name, "AC" + "0" * 32)
+    env.setdefault("PUBLIC_URL", "https://example.com")
+    env.update(STATE_BACKEND="memory", PYTHONDONTWRITEBYTECODE="1")
+    output = subprocess.run([sys.executable, "-c", CHILD, f"sqlite:///{database}"], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(runs):
+            results.append(run_once(os.path.join(tmp, f"bench_{i}.db")))
+    print(f"median of {runs} cold starts")
+    for key in results[0]:
+        values = [r[key] for r in results]
+        print(f"  {key:<32} {statistics.median(values):8.1f} ms   (min {min(values):.1f}, max {max(values):.1f})")
+
+
+if __name__ == "__main__":
+    main()
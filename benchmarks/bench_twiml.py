@@ -0,0 +1,66 @@
+"""Per-webhook TwiML rendering cost: VoiceResponse serialization vs precompiled templates.
+
+    python benchmarks/bench_twiml.py [iterations]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from twilio.twiml.voice_response import VoiceResponse  # noqa: E402
+import twiml_templates as twiml  # noqa: E402
+
+ROOM = "conf_AG001_1760000000"
+VM_URL = "https://example.com/ai_voice/male_voice.wav?v=1&lang=en"
+
+
+def join_voice_response():
+    resp = VoiceResponse()
+    resp.dial().conference(ROOM, start_conference_on_enter=True, end_conference_on_exit=True, record=False)
+    return str(resp)
+
+
+def join_template():
+    return twiml.JOIN_CONFERENCE.render(room=ROOM)
+
+
+def hold_voice_response():
+    resp = VoiceResponse()
+    resp.dial().conference(ROOM, start_conference_on_enter=True, wait_url=twiml.HOLD_MUSIC_URL)
+    return str(resp)
+
+
+def hold_template():
+    return twiml.HOLD_CONFERENCE.render(room=ROOM)
+
+
+def voicemail_voice_response():
+    resp = VoiceResponse()
+    resp.play(VM_URL)
+    resp.hangup()
+    return str(resp)
+
+
+def voicemail_template():
+    return twiml.PLAY_HANGUP.render(url=VM_URL)
+
+
+CASES = [
+    ("join", join_voice_response, join_template),
+    ("incoming hold", hold_voice_response, hold_template),
+    ("voicemail drop", voicemail_voice_response, voicemail_template),
+]
+
+
+def main(iterations):
+    print(f"{'response':<16}{'VoiceResponse us':>18}{'template us':>14}{'speedup':>10}")
+    for name, baseline, template in CASES:
+        assert baseline() == template(), name
+        base = min(timeit.repeat(baseline, number=iterations, repeat=5)) / iterations * 1e6
+        fast = min(timeit.repeat(template, number=iterations, repeat=5)) / iterations * 1e6
+        print(f"{name:<16}{base:>18.2f}{fast:>14.2f}{base / fast:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,202 @@
+"""Local stand-ins for Twilio, Gemini and speech recognition, for load tests.
+
+FakeTwilio is a requests transport adapter mounted on the shared Twilio
+session (twilio_client.get_http_session), so the real Twilio client, its
+connection pool and its metrics all run and only the network is replaced.
+It answers calls.create / calls.update / recordings.list / recordings.fetch
+and recording downloads after a fixed latency, and plays Twilio's part of a
+call by posting the status callbacks each call asked for back to the app.
+
+Gemini is the app's own stub (GEMINI_MODEL_CLIENT=stub); StubRecognizer
+replaces the Google speech recognizer. `create_fake_app()` is the app
+factory the load test serves:
+
+    gunicorn -w 4 'benchmarks.fakes:create_fake_app()'
+"""
+import os
+import io
+import json
+import time
+import wave
+import heapq
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+import requests
+from requests.adapters import BaseAdapter
+
+API_ROOT = "https://api.twilio.com"
+# StatusCallbackEvent -> the CallStatus Twilio reports for it
+CALLBACK_STATUSES = {"initiated": "initiated", "ringing": "ringing", "answered": "in-progress",
+                     "completed": "completed"}
+TRANSCRIPT = "hi this is a quick call about your account can we talk tomorrow"
+
+
+def fake_sid(prefix):
+    return prefix + "%032x" % random.getrandbits(128)
+
+
+def fake_recording_wav(sid, seconds=2.0, rate=8000):
+    """Mono 16-bit noise, different per recording so the transcript cache can't short-circuit it"""
+    noise = random.Random(sid)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(noise.randbytes(int(seconds * rate) * 2))
+    return buffer.getvalue()
+
+
+class StubRecognizer:
+    """Stands in for speech_recognition.Recognizer: fixed text after `delay` seconds"""
+
+    def __init__(self, delay=0.2):
+        self.delay = delay
+        self.calls = 0
+
+    def recognize_google(self, audio_data, *args, **kwargs):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        return TRANSCRIPT
+
+    def record(self, source, *args, **kwargs):
+        return source
+
+
+class FakeTwilio(BaseAdapter):
+    """Answers Twilio REST requests locally after `latency` seconds.
+
+    Calls created with a StatusCallback get the events they asked for posted
+    back: the early ones right away, "completed" after `hold_seconds`.
+    """
+
+    def __init__(self, latency=0.05, hold_seconds=1.0, callback_workers=8):
+        super().__init__()
+        self.latency = latency
+        self.hold_seconds = hold_seconds
+        self.calls_created = 0
+        self.callbacks_sent = 0
+        self.callbacks_failed = 0
+        self._due = []  # heap of (due time, seq, url, values)
+        self._seq = 0
+        self._wakeup = threading.Condition()
+        self._senders = ThreadPoolExecutor(callback_workers, thread_name_prefix="fake-twilio-callback")
+        self._callback_session = requests.Session()
+        threading.Thread(target=self._run, name="fake-twilio", daemon=True).start()
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        if self.latency:
+            time.sleep(self.latency)
+        url = urlsplit(request.url)
+        segments = url.path.split("/")
+        name = segments[-1]
+        body = request.body.decode() if isinstance(request.body, bytes) else request.body or ""
+
+        if name.endswith(".wav"):
+            return self._response(request, 200, fake_recording_wav(name[:-4]), "audio/x-wav")
+        if request.method == "POST" and name == "Calls.json":
+            return self._json(request, 201, self._create_call(url.path, parse_qs(body)))
+        if request.method == "POST" and segments[-2] == "Calls":
+            return self._json(request, 200, {"sid": name[:-5], "status": "in-progress"})
+        if request.method == "GET" and name == "Recordings.json":
+            call_sid = parse_qs(url.query).get("CallSid", [fake_sid("CA")])[0]
+            recordings = [self._recording(url.path[:-5], "RE" + call_sid[2:], call_sid)]
+            return self._json(request, 200, {
+                "recordings": recordings, "start": 0, "end": 0, "page": 0, "page_size": 50,
+                "uri": url.path, "first_page_uri": url.path, "next_page_uri": None, "previous_page_uri": None})
+        if request.method == "GET" and segments[-2] == "Recordings":
+            return self._json(request, 200, self._recording("/".join(segments[:-1]), name[:-5]))
+        return self._json(request, 404, {"code": 20404, "status": 404,
+                                         "message": f"Not faked: {request.method} {url.path}"})
+
+    def _recording(self, base_path, sid, call_sid=None):
+        return {"sid": sid, "call_sid": call_sid, "duration": "2", "status": "completed",
+                "uri": f"{base_path}/{sid}.json"}
+
+    def _create_call(self, path, params):
+        sid = fake_sid("CA")
+        to = params.get("To", [""])[0]
+        self.calls_created += 1
+        callback = params.get("StatusCallback", [None])[0]
+        if callback:
+            now = time.time()
+            for event in params.get("StatusCallbackEvent", ["completed"]):
+                values = {"CallSid": sid, "CallStatus": CALLBACK_STATUSES.get(event, event), "To": to}
+                due = now
+                if event == "completed":
+                    due += self.hold_seconds
+                    values["CallDuration"] = str(int(self.hold_seconds))
+                self._schedule(due, callback, values)
+        return {"sid": sid, "status": "queued", "to": to, "from": params.get("From", [""])[0],
+                "uri": f"{path[:-5]}/{sid}.json"}
+
+    def _schedule(self, due, url, values):
+        with self._wakeup:
+            self._seq += 1
+            heapq.heappush(self._due, (due, self._seq, url, values))
+            self._wakeup.notify()
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                while not self._due or self._due[0][0] > time.time():
+                    self._wakeup.wait(self._due[0][0] - time.time() if self._due else None)
+                _, _, url, values = heapq.heappop(self._due)
+            self._senders.submit(self._post_callback, url, values)
+
+    def _post_callback(self, url, values):
+        try:
+            self._callback_session.post(url, data=values, timeout=30).raise_for_status()
+            self.callbacks_sent += 1
+        except requests.RequestException as e:
+            self.callbacks_failed += 1
+            print("Fake Twilio callback failed:", e)
+
+    def _json(self, request, status, payload):
+        return self._response(request, status, json.dumps(payload).encode(), "application/json")
+
+    def _response(self, request, status, content, content_type):
+        response = requests.Response()
+        response.status_code = status
+        response._content = content
+        response._content_consumed = True  # iter_content() serves the body from _content
+        response.headers["Content-Type"] = content_type
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        pass
+
+
+def install_fake_twilio(latency=0.05, hold_seconds=1.0):
+    """Route this process's Twilio REST traffic to a FakeTwilio; returns it"""
+    from twilio_client import get_http_session
+    fake = FakeTwilio(latency=latency, hold_seconds=hold_seconds)
+    get_http_session().mount(API_ROOT, fake)
+    return fake
+
+
+def create_fake_app():
+    """App factory for load tests: the real app with Twilio, Gemini and STT faked.
+
+    LOADTEST_DATABASE_URI picks the database; LOADTEST_TWILIO_LATENCY_SECONDS,
+    LOADTEST_CALL_HOLD_SECONDS and LOADTEST_STT_DELAY_SECONDS shape the fakes.
+    """
+    os.environ["GEMINI_MODEL_CLIENT"] = "stub"
+    from main import create_app
+    install_fake_twilio(latency=float(os.getenv("LOADTEST_TWILIO_LATENCY_SECONDS", 0.05)),
+                        hold_seconds=float(os.getenv("LOADTEST_CALL_HOLD_SECONDS", 1.0)))
+    config = {"SQLALCHEMY_ENGINE_OPTIONS": {"connect_args": {"timeout": 30}}}
+    if os.getenv("LOADTEST_DATABASE_URI"):
+        config["SQLALCHEMY_DATABASE_URI"] = os.environ["LOADTEST_DATABASE_URI"]
+    app = create_app(config, warm_up=False)
+    services = app.extensions["services"]
+    services.warm_up()
+    services.transcription_queue.converter.recognizer = StubRecognizer(
+        delay=float(os.getenv("LOADTEST_STT_DELAY_SECONDS", 0.2)))
+    return app
@@ -0,0 +1,290 @@
+"""Offline load test: campaign traffic against gunicorn with Twilio, Gemini and STT faked.
+
+    python benchmarks/loadtest.py [--rows 0,100000] [--workers 1,4] [--clients 16] [--duration 20]
+
+For every (phone_calls rows, gunicorn workers) pair it seeds a throwaway
+SQLite database, serves `benchmarks.fakes:create_fake_app()` and has
+--clients threads replay a campaign mix until --duration runs out:
+
+    /make_call + /handle_machine_detection   an agent's call and its AMD webhook
+    /incoming_call                           an inbound call routed to an agent
+    /api/calls                               dashboards polling the call list (ETag)
+    /get_transcript/<sid>                    transcripts of earlier calls
+    /api/gemini_rating                       rating a transcript
+
+Twilio answers every REST call after --twilio-latency and posts each call's
+status callbacks back (completed after --hold), so agents get claimed and
+released and phone_calls rows get written as in production. Reported per
+run: throughput, p50/p99 latency per endpoint, errors, and the server's
+peak RSS (master + workers). Nothing leaves the machine.
+"""
+import os
+import sys
+import time
+import random
+import socket
+import argparse
+import datetime
+import tempfile
+import threading
+import subprocess
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+AGENT_IDS = [f"AG{i:03d}" for i in range(1, 11)]
+STATUSES = ["completed", "completed", "completed", "no-answer", "busy", "failed", "canceled"]
+SEED_CHUNK_SIZE = 5000
+# Share of iterations per scenario; the rest is /make_call + /handle_machine_detection
+MIX = (("dashboard", 0.30), ("incoming", 0.15), ("transcript", 0.10), ("rating", 0.05))
+# Dummy credentials: FakeTwilio never checks them
+TWILIO_ENV = ("TWILIO_ACCOUNT_SID", "TWILIO_API_KEY_SID", "TWILIO_API_SECRET", "TWILIO_AUTH_TOKEN",
+              "TWILIO_TWIML_APP_SID", "TWILIO_CALLER_ID")
+
+
+def seed_database(uri, rows):
+    """Create the schema and fill phone_calls with `rows` calls spread over the last 90 days"""
+    from main import create_app
+    from migrations import migrate
+    from database.lead_database import db, PhoneCall, rebuild_call_rollups
+    app = create_app({"SQLALCHEMY_DATABASE_URI": uri}, warm_up=False)
+    migrate(app)
+    rng = random.Random(rows)
+    now = datetime.datetime.utcnow()
+    with app.app_context():
+        for start in range(0, rows, SEED_CHUNK_SIZE):
+            db.session.execute(db.insert(PhoneCall), [{
+                "caller_number": f"+1555{rng.randrange(10 ** 7):07d}",
+                "use_name": f"Lead {i}",
+                "status": rng.choice(STATUSES),
+                "call_duration_seconds": rng.randrange(600),
+                "call_timestamp": now - datetime.timedelta(seconds=rng.randrange(90 * 24 * 3600)),
+                "call_sid": "CA%032x" % rng.getrandbits(128),
+                "agent_id": rng.choice(AGENT_IDS),
+            } for i in range(start, min(start + SEED_CHUNK_SIZE, rows))])
+            db.session.commit()
+        rebuild_call_rollups()
+        db.engine.dispose()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def process_tree(pid):
+    """pid and all its descendants (Linux /proc)"""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    parent = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(parent, []).append(int(entry))
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children.get(current, []))
+    return tree
+
+
+def peak_rss_mb(pid):
+    """Summed peak resident memory (VmHWM) of a process tree, in MB"""
+    total = 0
+    for p in process_tree(pid):
+        try:
+            with open(f"/proc/{p}/status") as f:
+                total += next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+        except (OSError, StopIteration):
+            continue
+    return total / 1024
+
+
+class Server:
+    """gunicorn serving the faked app on a free local port"""
+
+    def __init__(self, workers, threads, database_uri, workdir, args):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        env = dict(os.environ)
+        for name in TWILIO_ENV:
+            env.setdefault(name, "AC" + "0" * 32)
+        env.update(PUBLIC_URL=self.url, PRIVATE_KEY="loadtest", PYTHONDONTWRITEBYTECODE="1",
+                   STATE_BACKEND="sqlite", STATE_SQLITE_PATH=os.path.join(workdir, "state.db"),
+                   LOADTEST_DATABASE_URI=database_uri,
+                   LOADTEST_TWILIO_LATENCY_SECONDS=str(args.twilio_latency),
+                   LOADTEST_CALL_HOLD_SECONDS=str(args.hold),
+                   LOADTEST_STT_DELAY_SECONDS=str(args.stt_delay),
+                   GEMINI_STUB_DELAY_SECONDS=str(args.gemini_delay))
+        self.log_path = os.path.join(workdir, "server.log")
+        self.log = open(self.log_path, "w")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-w", str(workers), "--threads", str(threads),
+             "-b", f"127.0.0.1:{self.port}", "--timeout", "120", "benchmarks.fakes:create_fake_app()"],
+            cwd=ROOT, env=env, stdout=self.log, stderr=subprocess.STDOUT)
+
+    def wait_ready(self, workers, timeout=60):
+        # Every worker has to be up (each builds its services on start), not just the first
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                break
+            try:
+                requests.get(f"{self.url}/api/stats/summary", timeout=5).raise_for_status()
+                if len(process_tree(self.process.pid)) > workers:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        with open(self.log_path) as f:
+            raise RuntimeError("Server did not start:\n" + f.read()[-3000:])
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.log.close()
+
+
+class Client(threading.Thread):
+    """One simulated user looping over the scenario mix; records (endpoint, seconds, ok)"""
+
+    def __init__(self, index, url, deadline, call_sids):
+        super().__init__(daemon=True)
+        self.url = url
+        self.deadline = deadline
+        self.rng = random.Random(index)
+        self.agent_id = AGENT_IDS[index % len(AGENT_IDS)]
+        self.call_sids = call_sids  # shared: sids of calls placed so far
+        self.session = requests.Session()
+        self.etag = None
+        self.samples = []
+
+    def request(self, endpoint, method, path, ok=(200,), **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.url + path, timeout=60, **kwargs)
+        except requests.RequestException:
+            self.samples.append((endpoint, time.perf_counter() - started, False))
+            return None
+        self.samples.append((endpoint, time.perf_counter() - started, response.status_code in ok))
+        return response
+
+    def run(self):
+        while time.time() < self.deadline:
+            roll, scenario = self.rng.random(), "campaign"
+            for name, share in MIX:
+                if roll < share:
+                    scenario = name
+                    break
+                roll -= share
+            getattr(self, scenario)()
+
+    def campaign(self):
+        to = f"+1555{self.rng.randrange(10 ** 7):07d}"
+        response = self.request("/make_call", "POST", "/make_call", json={"agent_id": self.agent_id, "to": to})
+        if response is None or response.status_code != 200:
+            return
+        body = response.json()
+        self.call_sids.append(body["customer_call_sid"])
+        self.request("/handle_machine_detection", "POST", "/handle_machine_detection", data={
+            "CallSid": body["customer_call_sid"], "Room": body["conference"],
+            "AnsweredBy": self.rng.choice(["human", "human", "machine_end_beep", "machine", "unknown"]),
+            "vm_audio_url": "https://example.com/ai_voice/male_voice.wav"})
+
+    def incoming(self):
+        self.request("/incoming_call", "POST", "/incoming_call", data={
+            "CallSid": "CA%032x" % self.rng.getrandbits(128), "From": "+15550100000", "To": "+15550109999"})
+
+    def dashboard(self):
+        headers = {"If-None-Match": self.etag} if self.etag else {}
+        response = self.request("/api/calls", "GET", "/api/calls?limit=100", ok=(200, 304), headers=headers)
+        if response is not None and response.status_code == 200:
+            self.etag = response.headers.get("ETag")
+
+    def transcript(self):
+        if not self.call_sids:
+            return self.campaign()
+        call_sid = self.rng.choice(self.call_sids[-500:])
+        self.request("/get_transcript", "GET", f"/get_transcript/{call_sid}", ok=(200, 202))
+
+    def rating(self):
+        transcript = f"customer {self.rng.randrange(1000)} asked for a callback about pricing"
+        self.request("/api/gemini_rating", "POST", "/api/gemini_rating", json={"transcript": transcript})
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def run(rows, workers, args):
+    with tempfile.TemporaryDirectory() as workdir:
+        database_uri = f"sqlite:///{os.path.join(workdir, 'calls.db')}"
+        seed_database(database_uri, rows)
+        server = Server(workers, args.threads, database_uri, workdir, args)
+        try:
+            server.wait_ready(workers)
+            for agent_id in AGENT_IDS:
+                # Softphones come online; the agent state is shared by all workers
+                requests.get(f"{server.url}/token", params={"agent_id": agent_id}, timeout=30).raise_for_status()
+            call_sids = []
+            started = time.time()
+            clients = [Client(i, server.url, started + args.duration, call_sids) for i in range(args.clients)]
+            for client in clients:
+                client.start()
+            for client in clients:
+                client.join()
+            elapsed = time.time() - started
+            time.sleep(args.hold + 1)  # let the last status callbacks land
+            rss = peak_rss_mb(server.process.pid)
+        finally:
+            server.stop()
+    samples = [sample for client in clients for sample in client.samples]
+    return {"rows": rows, "workers": workers, "elapsed": elapsed, "samples": samples, "rss_mb": rss}
+
+
+def report(result):
+    samples = result["samples"]
+    print(f"\n{result['rows']:,} rows, {result['workers']} worker(s): {len(samples)} requests in "
+          f"{result['elapsed']:.1f}s = {len(samples) / result['elapsed']:.0f} req/s, "
+          f"peak RSS {result['rss_mb']:.0f} MB")
+    print(f"  {'endpoint':<28}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    by_endpoint = {}
+    for endpoint, seconds, ok in samples:
+        by_endpoint.setdefault(endpoint, []).append((seconds, ok))
+    for endpoint, values in sorted(by_endpoint.items()):
+        latencies = sorted(seconds for seconds, _ in values)
+        errors = sum(1 for _, ok in values if not ok)
+        print(f"  {endpoint:<28}{len(values):>8}{errors:>8}"
+              f"{percentile(latencies, 0.5) * 1000:>10.1f}{percentile(latencies, 0.99) * 1000:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", 1)[0])
+    parser.add_argument("--rows", default="0,100000", help="phone_calls table sizes, comma separated")
+    parser.add_argument("--workers", default="1,4", help="gunicorn worker counts, comma separated")
+    parser.add_argument("--threads", type=int, default=8, help="threads per gunicorn worker")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent simulated users")
+    parser.add_argument("--duration", type=float, default=20, help="seconds of traffic per run")
+    parser.add_argument("--twilio-latency", type=float, default=0.05, help="fake Twilio REST latency, seconds")
+    parser.add_argument("--hold", type=float, default=1.0, help="seconds from answer to the completed callback")
+    parser.add_argument("--stt-delay", type=float, default=0.2, help="stub speech recognizer time per segment")
+    parser.add_argument("--gemini-delay", type=float, default=0.1, help="stub Gemini time per rating")
+    args = parser.parse_args()
+    for name in TWILIO_ENV:
+        os.environ.setdefault(name, "AC" + "0" * 32)
+    for rows in (int(r) for r in args.rows.split(",")):
+        for workers in (int(w) for w in args.workers.split(",")):
+            report(run(rows, workers, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+import os
+import math
+import time
+import uuid
+import random
+import threading
+import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from twilio.base.exceptions import TwilioRestException
+from predictive import DialingStats, PREDICTIVE_SETTINGS, FINAL_CALL_STATUSES, predictive_target
+
+
+DEFAULT_SETTINGS = {
+    # Hard cap on calls being dialed at the same time
+    "max_concurrency": int(os.getenv("CAMPAIGN_MAX_CONCURRENCY", 10)),
+    # Lines dialed per agent; concurrency is min(max_concurrency, ceil(agents * calls_per_agent))
+    "calls_per_agent": float(os.getenv("CAMPAIGN_CALLS_PER_AGENT", 1)),
+    # Token-bucket pacing applied to every caller ID
+    "calls_per_second_per_caller_id": float(os.getenv("CAMPAIGN_CPS_PER_CALLER_ID", 1)),
+    "burst_per_caller_id": int(os.getenv("CAMPAIGN_BURST_PER_CALLER_ID", 1)),
+    # Retry/backoff for Twilio rate-limit (HTTP 429 / error 20429) responses
+    "max_retries": int(os.getenv("CAMPAIGN_MAX_RETRIES", 5)),
+    "backoff_base_seconds": float(os.getenv("CAMPAIGN_BACKOFF_BASE_SECONDS", 1)),
+    "backoff_max_seconds": float(os.getenv("CAMPAIGN_BACKOFF_MAX_SECONDS", 30)),
+    # Used by mode="predictive" only
+    **PREDICTIVE_SETTINGS,
+}
+CAMPAIGN_MODES = ("progressive", "predictive")
+# Unanswered calls whose status callback never arrived stop counting against pacing after this
+PENDING_CALL_TIMEOUT_SECONDS = 120
+MAX_TRACKED_CALLS = 10000
+# Finished campaigns (and their per-lead results) are forgotten after this long, oldest first past the cap
+FINISHED_CAMPAIGN_TTL_SECONDS = int(os.getenv("CAMPAIGN_RETENTION_SECONDS", 24 * 3600))
+MAX_FINISHED_CAMPAIGNS = int(os.getenv("CAMPAIGN_MAX_FINISHED", 100))
+
+
+def is_rate_limited(error):
+    return isinstance(error, TwilioRestException) and (error.status == 429 or error.code == 20429)
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, up to `capacity` saved up"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _try_take(self):
+        """Take a token if one is available; otherwise return seconds until the next one"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self, stop_event=None):
+        """Block until a token is available; returns False if stop_event was set meanwhile"""
+        while True:
+            wait = self._try_take()
+            if not wait:
+                return True
+            if stop_event is not None:
+                if stop_event.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
+
+
+class Campaign:
+    """A lead list dialed in the background.
+
+    In "progressive" mode a fixed number of lines (agents * calls_per_agent)
+    is dialed at once. In "predictive" mode the number of unanswered calls
+    kept up follows the live answer-rate statistics and agent availability.
+    """
+
+    def __init__(self, manager, leads, agent_ids, caller_ids, voicemail_audio_url="", settings=None,
+                 mode="progressive"):
+        self.id = uuid.uuid4().hex
+        self.manager = manager
+        self.dialer = manager.dialer
+        self.agent_ids = list(agent_ids)
+        self.caller_ids = list(caller_ids)
+        self.voicemail_audio_url = voicemail_audio_url
+        self.mode = mode
+        self.settings = {**DEFAULT_SETTINGS, **(settings or {})}
+        if mode == "predictive":
+            self.concurrency = int(self.settings["max_concurrency"])
+        else:
+            self.concurrency = max(1, min(
+                self.settings["max_concurrency"],
+                math.ceil(len(self.agent_ids) * self.settings["calls_per_agent"]),
+            ))
+
+        self._leads = deque(leads)
+        self.total = len(self._leads)
+        self.status = "pending"
+        self.created_at = datetime.datetime.utcnow()
+        self.finished_at = None
+        self.dialed = 0
+        self.failed = 0
+        self.retries = 0
+        self.in_flight = 0
+        self.results = []
+        # Dialed calls not yet answered or finished: call_sid -> dialed at
+        self.pending_calls = {}
+        self.predictive_target = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self._pool = ThreadPoolExecutor(self.concurrency, thread_name_prefix=f"campaign-{self.id[:8]}")
+        self._next_agent = 0
+        self._next_caller_id = 0
+
+    def start(self):
+        self.status = "running"
+        threading.Thread(target=self._dispatch, name=f"campaign-{self.id[:8]}-dispatch", daemon=True).start()
+
+    def stop(self):
+        if self.status in ("pending", "running"):
+            self.status = "stopping"
+        self._stop.set()
+
+    def _round_robin(self, items, attr):
+        index = getattr(self, attr)
+        setattr(self, attr, index + 1)
+        return items[index % len(items)]
+
+    def _acquire_slot(self):
+        # A free slot bounds the number of calls in flight to self.concurrency
+        while not self._slots.acquire(timeout=0.5):
+            if self._stop.is_set():
+                return False
+        return True
+
+    def _wait_for_predictive_capacity(self):
+        """Block until fewer calls are pending than the predictive pacer allows"""
+        while not self._stop.is_set():
+            available, busy = self.dialer.count_agents(self.agent_ids)
+            target = min(self.concurrency, predictive_target(
+                self.manager.stats.snapshot(), available, busy, self.settings))
+            with self._lock:
+                pending = list(self.pending_calls.items())
+            expired = time.time() - PENDING_CALL_TIMEOUT_SECONDS
+            # Webhooks for our calls may have landed on another worker
+            done = [sid for sid, at in pending
+                    if at < expired or self.dialer.get_call_metadata(sid).get("progressed")]
+            with self._lock:
+                for call_sid in done:
+                    self.pending_calls.pop(call_sid, None)
+                self.predictive_target = target
+                if len(self.pending_calls) + self.in_flight < target:
+                    return True
+            self._stop.wait(0.2)
+        return False
+
+    def _next_agent_id(self):
+        if self.mode == "predictive":
+            # Prefer agents that are free right now
+            available = [aid for aid in self.agent_ids
+                         if self.dialer.agents.status(aid) == "available"]
+            if available:
+                return self._round_robin(available, "_next_agent")
+        return self._round_robin(self.agent_ids, "_next_agent")
+
+    def _dispatch(self):
+        while self._leads and not self._stop.is_set():
+            if self.mode == "predictive" and not self._wait_for_predictive_capacity():
+                break
+            if not self._acquire_slot():
+                break
+            caller_id = self._round_robin(self.caller_ids, "_next_caller_id")
+            if not self.manager.bucket_for(caller_id, self.settings).acquire(self._stop):
+                self._slots.release()
+                break
+            lead = self._leads.popleft()
+            agent_id = self._next_agent_id()
+            with self._lock:
+                self.in_flight += 1
+            self._pool.submit(self._dial, lead, agent_id, caller_id)
+        self._pool.shutdown(wait=True)
+        self.finished_at = datetime.datetime.utcnow()
+        self.status = "stopped" if self._stop.is_set() else "completed"
+
+    def _dial(self, lead, agent_id, caller_id):
+        result = {"to": lead["to"], "agent_id": agent_id, "caller_id": caller_id, "attempts": 0}
+        try:
+            for attempt in range(self.settings["max_retries"] + 1):
+                result["attempts"] = attempt + 1
+                try:
+                    result["call_sid"], _ = self.dialer.place_call(
+                        agent_id, lead["to"], lead.get("voicemail_audio_url") or self.voicemail_audio_url,
+                        caller_id=caller_id,
+                    )
+                    self.manager.track_call(result["call_sid"], self)
+                    break
+                except Exception as e:
+                    if not is_rate_limited(e) or attempt == self.settings["max_retries"]:
+                        result["error"] = str(e)
+                        break
+                    with self._lock:
+                        self.retries += 1
+                    # Exponential backoff with full jitter
+                    delay = min(self.settings["backoff_max_seconds"],
+                                self.settings["backoff_base_seconds"] * 2 ** attempt)
+                    if self._stop.wait(random.uniform(0, delay)):
+                        result["error"] = "Campaign stopped"
+                        break
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                if "call_sid" in result:
+                    self.pending_calls[result["call_sid"]] = time.time()
+                    self.dialed += 1
+                else:
+                    self.failed += 1
+                self.results.append(result)
+            self._slots.release()
+
+    def call_progressed(self, call_sid):
+        """The call was answered (AMD result) or finished"""
+        with self._lock:
+            self.pending_calls.pop(call_sid, None)
+
+    def progress(self, include_results=False):
+        with self._lock:
+            body = {
+                "campaign_id": self.id,
+                "mode": self.mode,
+                "status": self.status,
+                "total": self.total,
+                "remaining": len(self._leads),
+                "in_flight": self.in_flight,
+                "pending_calls": len(self.pending_calls),
+                "predictive_target": self.predictive_target,
+                "dialed": self.dialed,
+                "failed": self.failed,
+                "rate_limit_retries": self.retries,
+                "concurrency": self.concurrency,
+                "agent_ids": self.agent_ids,
+                "caller_ids": self.caller_ids,
+                "settings": self.settings,
+                "created_at": self.created_at.isoformat(),
+                "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            }
+            if include_results:
+                body["results"] = list(self.results)
+            else:
+                body["recent_errors"] = [r for r in self.results if "error" in r][-20:]
+        return body
+
+
+class CampaignManager:
+    """Runs dialing campaigns on top of a DialerEngineDev.
+
+    Caller-ID token buckets are shared by all campaigns, so running several
+    campaigns at once never exceeds the configured pace of any caller ID.
+    """
+
+    def __init__(self, dialer, stats=None):
+        self.dialer = dialer
+        self.stats = stats or DialingStats()
+        self.campaigns = {}
+        self._buckets = {}
+        # call_sid -> campaign, for calls that haven't finished yet
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def default_caller_ids(self):
+        caller_ids = [c.strip() for c in os.getenv("TWILIO_CALLER_IDS", "").split(",") if c.strip()]
+        return caller_ids or [self.dialer.caller_id]
+
+    def bucket_for(self, caller_id, settings):
+        with self._lock:
+            bucket = self._buckets.get(caller_id)
+            if bucket is None:
+                bucket = self._buckets[caller_id] = TokenBucket(
+                    settings["calls_per_second_per_caller_id"], settings["burst_per_caller_id"])
+            return bucket
+
+    def track_call(self, call_sid, campaign):
+        self.stats.record_placed(call_sid)
+        with self._lock:
+            self._calls[call_sid] = campaign
+            # Final callbacks handled by other workers never pop their call here
+            while len(self._calls) > MAX_TRACKED_CALLS:
+                del self._calls[next(iter(self._calls))]
+
+    def record_amd(self, call_sid, answered_by):
+        """Feed an AMD result; returns True if a human answered while the call's agent was busy"""
+        agent_id = self.dialer.get_call_metadata(call_sid).get("agent_id")
+        abandoned = answered_by == "human" and \
+            self.dialer.agents.status(agent_id) not in (None, "available")
+        self.stats.record_amd(call_sid, answered_by, abandoned)
+        self._call_progressed(call_sid)
+        return abandoned
+
+    def _call_progressed(self, call_sid, finished=False):
+        with self._lock:
+            campaign = self._calls.pop(call_sid, None) if finished else self._calls.get(call_sid)
+        if campaign:
+            campaign.call_progressed(call_sid)
+        elif self.dialer.get_call_metadata(call_sid):
+            # Possibly another worker's campaign call; it polls this flag
+            self.dialer.update_call_metadata(call_sid, progressed=True)
+
+    def record_status(self, call_sid, status, duration=None):
+        """Feed a Twilio status callback"""
+        self.stats.record_status(call_sid, status, duration)
+        if status == "in-progress" or status in FINAL_CALL_STATUSES:
+            self._call_progressed(call_sid, finished=status in FINAL_CALL_STATUSES)
+
+    def validate(self, agent_ids, settings=None, mode="progressive"):
+        """Check everything but the leads; returns the typed settings, raises ValueError on bad input"""
+        if mode not in CAMPAIGN_MODES:
+            raise ValueError(f"'mode' must be one of: {', '.join(CAMPAIGN_MODES)}")
+        if not isinstance(agent_ids, list) or not agent_ids or \
+                not all(isinstance(agent_id, str) and agent_id for agent_id in agent_ids):
+            raise ValueError("'agent_ids' must be a non-empty list of agent ids")
+        if settings is not None and not isinstance(settings, dict):
+            raise ValueError("'settings' must be an object")
+        settings = settings or {}
+        unknown = set(settings) - set(DEFAULT_SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown settings: {', '.join(sorted(unknown))}")
+        try:
+            settings = {key: type(DEFAULT_SETTINGS[key])(value) for key, value in settings.items()}
+        except (TypeError, ValueError):
+            raise ValueError("Campaign settings must be numbers")
+        if any(value <= 0 for key, value in settings.items() if key not in ("max_retries", "min_samples")):
+            raise ValueError("Campaign settings must be positive")
+        return settings
+
+    def create(self, leads, agent_ids, caller_ids=None, voicemail_audio_url="", settings=None,
+               mode="progressive"):
+        """Validate and start a campaign; raises ValueError on bad input"""
+        settings = self.validate(agent_ids, settings, mode)
+        if not isinstance(leads, list) or not leads:
+            raise ValueError("'leads' must be a non-empty list")
+        if caller_ids is not None and not (isinstance(caller_ids, list) and
+                                           all(isinstance(c, str) and c for c in caller_ids)):
+            raise ValueError("'caller_ids' must be a list of phone numbers")
+        normalized = []
+        for lead in leads:
+            lead = {"to": lead} if isinstance(lead, str) else lead
+            if not isinstance(lead, dict) or not lead.get("to"):
+                raise ValueError("Each lead must be a phone number or an object with 'to'")
+            normalized.append(lead)
+
+        campaign = Campaign(self, normalized, agent_ids, caller_ids or self.default_caller_ids(),
+                            voicemail_audio_url, settings, mode)
+        with self._lock:
+            self._evict_finished()
+            self.campaigns[campaign.id] = campaign
+        campaign.start()
+        return campaign
+
+    def _evict_finished(self):
+        # Caller holds self._lock
+        now = datetime.datetime.utcnow()
+        finished = sorted((c for c in self.campaigns.values() if c.finished_at), key=lambda c: c.finished_at)
+        expired = [c for c in finished if (now - c.finished_at).total_seconds() > FINISHED_CAMPAIGN_TTL_SECONDS]
+        kept = finished[len(expired):]
+        for campaign in expired + kept[:max(len(kept) - MAX_FINISHED_CAMPAIGNS, 0)]:
+            del self.campaigns[campaign.id]
+
+    def get(self, campaign_id):
+        return self.campaigns.get(campaign_id)
+
+    def list(self):
+        with self._lock:
+            self._evict_finished()
+            campaigns = list(self.campaigns.values())
+        return [c.progress() for c in campaigns]
@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import queue
+import threading
+from database.lead_database import db, PhoneCall, CallChange, latest_call_change
+
+# Largest gap a reconnecting client may replay from the log before it gets a fresh snapshot
+MAX_REPLAY = 1000
+# Most log entries one poll fans out; the rest follow on the next poll
+MAX_POLL_CHANGES = 5000
+RECONNECT_MILLISECONDS = 3000
+# On PostgreSQL a sequence number is taken at insert but becomes visible at commit, so a
+# slow transaction can show up below seqs already sent; each poll re-reads this many
+# seqs below the newest one and sends only those not sent before
+POLL_LOOKBACK = int(os.getenv("CHANGE_FEED_LOOKBACK", 1000))
+
+
+def sse_event(event, data, event_id=None):
+    """Encode one server-sent event"""
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+
+class Subscriber:
+    def __init__(self, max_queue):
+        self.queue = queue.Queue(maxsize=max_queue)
+        # Set when the client fell too far behind; it is sent a new snapshot instead
+        self.resync = False
+
+
+class ChangeFeed:
+    """Pushes phone_calls changes to every open dashboard.
+
+    Every write to phone_calls appends the call id to the call_changes log in
+    the same transaction. While anyone is subscribed, one thread per process
+    polls the log, loads the changed calls once and hands the same encoded
+    event to all subscribers, so the database load follows how often calls
+    change, not how many dashboards are open. Workers share the log, so a
+    change made on any worker reaches subscribers on all of them.
+    """
+
+    PRUNE_INTERVAL_SECONDS = 60
+
+    def __init__(self, app, poll_interval=None, retention=None, max_queue=None):
+        self.app = app
+        self.poll_interval = poll_interval or float(os.getenv("CHANGE_FEED_POLL_SECONDS", 0.5))
+        # Log entries kept for clients resuming with Last-Event-ID
+        self.retention = retention or int(os.getenv("CHANGE_LOG_RETENTION", 10000))
+        self.max_queue = max_queue or 100
+        self.heartbeat = float(os.getenv("CHANGE_FEED_HEARTBEAT_SECONDS", 15))
+        # A stream holds a worker thread while open; it is closed after this long and the
+        # browser reconnects with Last-Event-ID, so a thread is never tied up for good
+        self.max_stream_seconds = float(os.getenv("CHANGE_FEED_MAX_STREAM_SECONDS", 300))
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._last_seq = 0
+        # Log entries not to fan out again: everything up to _floor, and _sent above it
+        self._floor = 0
+        self._sent = set()
+        self._last_prune = 0.0
+        self.events_sent = 0
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="change-feed", daemon=True)
+                    self._thread.start()
+
+    def subscribe(self):
+        """Register a subscriber; take the snapshot after this so no change is missed"""
+        with self.app.app_context():
+            latest = latest_call_change()
+        subscriber = Subscriber(self.max_queue)
+        with self._lock:
+            if not self._subscribers:
+                # Nobody was listening, so nothing before now needs to be fanned out
+                self._last_seq = self._floor = latest
+                self._sent.clear()
+            self._subscribers.add(subscriber)
+        self._ensure_started()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def changes_since(self, seq, limit=MAX_REPLAY):
+        """(latest seq, [call dicts]) changed after seq, or None if the log can't cover the gap"""
+        oldest = db.session.query(db.func.min(CallChange.seq)).scalar()
+        if oldest is None or oldest > seq + 1:
+            return None
+        rows = (db.session.query(CallChange.seq, CallChange.call_id)
+                .filter(CallChange.seq > seq).order_by(CallChange.seq).limit(limit + 1).all())
+        if len(rows) > limit:
+            return None
+        if not rows:
+            return seq, []
+        return rows[-1].seq, self._load_calls([row.call_id for row in rows])
+
+    def _load_calls(self, call_ids):
+        call_ids = list(dict.fromkeys(call_ids))
+        calls = {call.id: call.to_dict() for call in PhoneCall.query.filter(PhoneCall.id.in_(call_ids))}
+        return [calls[call_id] for call_id in call_ids if call_id in calls]
+
+    def snapshot(self, limit):
+        """SSE snapshot event: the newest `limit` calls, tagged with the log position they reflect"""
+        with self.app.app_context():
+            # Read the position first: a change committed in between is then replayed, not lost
+            seq = latest_call_change()
+            calls = (PhoneCall.query.order_by(PhoneCall.call_timestamp.desc(), PhoneCall.id.desc())
+                     .limit(limit).all())
+            return sse_event("snapshot", {"seq": seq, "calls": [call.to_dict() for call in calls]}, seq)
+
+    def stream(self, limit, last_event_id=None):
+        """Generator of SSE text for one client: a snapshot (or the replayed gap), then changes.
+
+        Ends after max_stream_seconds; EventSource reconnects and resumes from the last event id.
+        """
+        deadline = time.monotonic() + self.max_stream_seconds
+        subscriber = self.subscribe()
+        try:
+            yield f"retry: {RECONNECT_MILLISECONDS}\n\n"
+            replay = None
+            if last_event_id and last_event_id.isdigit():
+                with self.app.app_context():
+                    replay = self.changes_since(int(last_event_id))
+            if replay is None:
+                yield self.snapshot(limit)
+            elif replay[1]:
+                yield sse_event("changes", {"seq": replay[0], "calls": replay[1]}, replay[0])
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                if subscriber.resync:
+                    subscriber.resync = False
+                    while not subscriber.queue.empty():
+                        subscriber.queue.get_nowait()
+                    yield self.snapshot(limit)
+                    continue
+                try:
+                    yield subscriber.queue.get(timeout=min(self.heartbeat, remaining))
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_interval)
+            if not self.subscriber_count():
+                continue
+            try:
+                with self.app.app_context():
+                    self.poll()
+            except Exception as e:
+                print("Change feed poll failed:", e)
+
+    def poll(self):
+        """Fan out changes logged since the last poll; returns how many calls changed"""
+        floor = max(self._last_seq - POLL_LOOKBACK, self._floor)
+        rows = (db.session.query(CallChange.seq, CallChange.call_id)
+                .filter(CallChange.seq > floor).order_by(CallChange.seq)
+                .limit(MAX_POLL_CHANGES + POLL_LOOKBACK).all())
+        now = time.time()
+        if now - self._last_prune >= self.PRUNE_INTERVAL_SECONDS:
+            self._last_prune = now
+            self._prune()
+        self._floor = floor
+        self._sent = {seq for seq in self._sent if seq > floor}
+        rows = [row for row in rows if row.seq not in self._sent]
+        if not rows:
+            return 0
+        self._sent.update(row.seq for row in rows)
+        self._last_seq = max(self._last_seq, rows[-1].seq)
+        calls = self._load_calls([row.call_id for row in rows])
+        message = sse_event("changes", {"seq": self._last_seq, "calls": calls}, self._last_seq)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.queue.put_nowait(message)
+            except queue.Full:
+                subscriber.resync = True
+        self.events_sent += len(subscribers)
+        return len(calls)
+
+    def _prune(self):
+        cutoff = self._last_seq - self.retention
+        if cutoff > 0:
+            db.session.execute(db.delete(CallChange).where(CallChange.seq <= cutoff))
+        db.session.commit()
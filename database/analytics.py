@@ -0,0 +1,91 @@
+import datetime
+from flask import Blueprint, request, jsonify
+from database.lead_database import db, CallRollup
+
+# Dashboard statistics, read only from the call_rollups table so their cost
+# depends on days x agents x statuses, never on the number of calls
+stats_bp = Blueprint("stats", __name__, url_prefix="/api/stats")
+
+# Statuses that count as a customer having answered
+ANSWERED_STATUSES = ("completed", "in-progress", "answered")
+
+
+def _parse_day(value, name):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid '{name}' date (YYYY-MM-DD): {value}")
+
+
+def _rollup_totals(group_by):
+    """Sum rollups per (group_by, status) for the from / to (inclusive) / agent_id request filters"""
+    column = getattr(CallRollup, group_by)
+    query = (db.select(column, CallRollup.status, db.func.sum(CallRollup.calls),
+                       db.func.sum(CallRollup.duration_seconds))
+             .group_by(column, CallRollup.status))
+    if request.args.get('from'):
+        query = query.where(CallRollup.day >= _parse_day(request.args['from'], 'from'))
+    if request.args.get('to'):
+        query = query.where(CallRollup.day <= _parse_day(request.args['to'], 'to'))
+    if request.args.get('agent_id'):
+        query = query.where(CallRollup.agent_id == request.args['agent_id'])
+    return db.session.execute(query).all()
+
+
+def _kpis(calls, answered, duration):
+    return {
+        "calls": calls,
+        "answered": answered,
+        "answer_rate": answered / calls if calls else None,
+        "talk_time_seconds": duration,
+        "average_talk_seconds": duration / answered if answered else None,
+    }
+
+
+def _fold(rows):
+    """{key: [calls, answered, talk time, {status: calls}]} from (key, status, calls, duration) rows"""
+    groups = {}
+    for key, status, calls, duration in rows:
+        group = groups.setdefault(key, [0, 0, 0, {}])
+        group[0] += calls
+        if status.lower() in ANSWERED_STATUSES:
+            group[1] += calls
+            group[2] += duration
+        if calls:
+            group[3][status or "unknown"] = group[3].get(status or "unknown", 0) + calls
+    return groups
+
+
+@stats_bp.route('/summary', methods=['GET'])
+def stats_summary():
+    try:
+        rows = _rollup_totals('status')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    calls, answered, duration, by_status = _fold((None, status, c, d) for _, status, c, d in rows).get(
+        None, [0, 0, 0, {}])
+    return jsonify({**_kpis(calls, answered, duration), "by_status": by_status})
+
+
+@stats_bp.route('/daily', methods=['GET'])
+def stats_daily():
+    try:
+        groups = _fold(_rollup_totals('day'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({"days": [
+        {"day": day.isoformat(), **_kpis(calls, answered, duration), "by_status": by_status}
+        for day, (calls, answered, duration, by_status) in sorted(groups.items())
+    ]})
+
+
+@stats_bp.route('/agents', methods=['GET'])
+def stats_agents():
+    try:
+        groups = _fold(_rollup_totals('agent_id'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({"agents": [
+        {"agent_id": agent_id or None, **_kpis(calls, answered, duration), "by_status": by_status}
+        for agent_id, (calls, answered, duration, by_status) in sorted(groups.items())
+    ]})
@@ -1,6 +1,10 @@
-from flask import Blueprint, request, jsonify
-from flask_sqlalchemy import SQLAlchemy
+import base64
+import csv
 import datetime
+import io
+import json
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
+from flask_sqlalchemy import SQLAlchemy
 
 # Create the Blueprint
 calls_bp = Blueprint("calls", __name__, url_prefix="/api")
@@ -19,6 +23,18 @@ class PhoneCall(db.Model):
     call_duration_seconds = db.Column(db.Integer, nullable=True)
     call_timestamp = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     note = db.Column(db.String(200), nullable=True)  
+    call_sid = db.Column(db.String(34), nullable=True, index=True)  # set for calls tracked via status callbacks
+    rating = db.Column(db.Integer, nullable=True)  # 1-10 call quality rating from the LLM
+    agent_id = db.Column(db.String(20), nullable=True)  # agent the call was placed for or connected to
+
+    # Composite indexes backing the keyset pagination on (call_timestamp, id)
+    # and the status / caller_number / user_id filters of /api/calls
+    __table_args__ = (
+        db.Index('ix_phone_calls_ts_id', 'call_timestamp', 'id'),
+        db.Index('ix_phone_calls_status_ts_id', 'status', 'call_timestamp', 'id'),
+        db.Index('ix_phone_calls_caller_ts_id', 'caller_number', 'call_timestamp', 'id'),
+        db.Index('ix_phone_calls_user_ts_id', 'user_id', 'call_timestamp', 'id'),
+    )
 
     def to_dict(self):
         return {
@@ -29,7 +45,10 @@ class PhoneCall(db.Model):
             "call_duration_seconds": self.call_duration_seconds,
             "call_timestamp": self.call_timestamp.isoformat(),
             "note": self.note,
-            "name":self.use_name
+            "name":self.use_name,
+            "call_sid": self.call_sid,
+            "rating": self.rating,
+            "agent_id": self.agent_id
         }
 
 class Agent(db.Model):
@@ -42,12 +61,370 @@ class Agent(db.Model):
     responsibility = db.Column(db.String(100), nullable=True)  # Role/responsibility
 
 
+# Jobs still to finish; a call has at most one of them
+PENDING_JOB_WHERE = db.text("status IN ('queued', 'running')")
+
+
+class TranscriptionJob(db.Model):
+    __tablename__ = 'transcription_jobs'
+    __table_args__ = (
+        db.Index('uq_transcription_jobs_pending_call', 'call_sid', unique=True,
+                 sqlite_where=PENDING_JOB_WHERE, postgresql_where=PENDING_JOB_WHERE),
+    )
+
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    call_sid = db.Column(db.String(34), nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued / running / completed / failed
+    result = db.Column(db.Text, nullable=True)  # JSON list of transcribed recordings
+    error = db.Column(db.String(500), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "call_sid": self.call_sid,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class TranscriptCacheEntry(db.Model):
+    __tablename__ = 'transcript_cache'
+
+    recording_sid = db.Column(db.String(34), primary_key=True)
+    call_sid = db.Column(db.String(34), nullable=True, index=True)
+    audio_hash = db.Column(db.String(64), nullable=False, index=True)  # sha256 of the recording audio
+    url = db.Column(db.String(300), nullable=True)
+    transcript = db.Column(db.Text, nullable=False)
+    segments = db.Column(db.Text, nullable=True)  # JSON list of {start, end, text}, offsets in seconds
+    # Set once a job has transcribed all of the call's recordings: how many it has
+    call_recordings = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+    def result(self):
+        return {"transcript": self.transcript, "segments": json.loads(self.segments or "[]")}
+
+    def to_dict(self):
+        return {
+            "recording_sid": self.recording_sid,
+            "url": self.url,
+            **self.result(),
+        }
+
+
+class CallRating(db.Model):
+    __tablename__ = 'call_ratings'
+
+    transcript_hash = db.Column(db.String(64), primary_key=True)  # sha256 of the rated transcript
+    rating = db.Column(db.Integer, nullable=False)  # 1-10, or 0 when the model's answer was not a number
+    model = db.Column(db.String(50), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+
+class Lead(db.Model):
+    __tablename__ = 'leads'
+
+    id = db.Column(db.Integer, primary_key=True)
+    phone_number = db.Column(db.String(16), nullable=False, unique=True)  # normalized E.164, e.g. +15550100001
+    name = db.Column(db.String(100), nullable=True)
+    priority = db.Column(db.Integer, nullable=False, default=0)  # higher is dialed first
+    dnc = db.Column(db.Boolean, nullable=False, default=False)  # on the do-not-call list
+    dial_count = db.Column(db.Integer, nullable=False, default=0)
+    last_dialed_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+    # Rebuilding the in-memory lead queue reads callable leads in priority order
+    __table_args__ = (
+        db.Index('ix_leads_dnc_priority_id', 'dnc', 'priority', 'id'),
+    )
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "phone_number": self.phone_number,
+            "name": self.name,
+            "priority": self.priority,
+            "dnc": self.dnc,
+            "dial_count": self.dial_count,
+            "last_dialed_at": self.last_dialed_at.isoformat() if self.last_dialed_at else None,
+        }
+
+
+class CallRollup(db.Model):
+    """Running call counts and talk time per day, agent and status, kept in step with phone_calls"""
+    __tablename__ = 'call_rollups'
+
+    day = db.Column(db.Date, primary_key=True)
+    agent_id = db.Column(db.String(20), primary_key=True, default='')  # '' for calls without an agent
+    status = db.Column(db.String(20), primary_key=True, default='')
+    calls = db.Column(db.Integer, nullable=False, default=0)
+    duration_seconds = db.Column(db.Integer, nullable=False, default=0)
+
+
+class CallChange(db.Model):
+    """Append-only log of changed phone_calls rows, read by the live call feed"""
+    __tablename__ = 'call_changes'
+
+    seq = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    call_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+
+def dialect_insert():
+    """INSERT construct with ON CONFLICT support for the configured database"""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+def call_snapshot(call):
+    """The fields of a PhoneCall (model or row dict) that the rollups are keyed and summed on"""
+    get = call.get if isinstance(call, dict) else lambda name: getattr(call, name)
+    timestamp = get('call_timestamp') or datetime.datetime.utcnow()
+    return (timestamp.date(), get('agent_id') or '', get('status') or '', get('call_duration_seconds') or 0)
+
+
+def record_call_changes(changes):
+    """Apply (before, after) call snapshots to the rollups in the current transaction.
+
+    `before` is None for inserted calls. Every write to phone_calls must call
+    this before committing so the rollups stay exact.
+    """
+    deltas = {}
+    for before, after in changes:
+        for snapshot, sign in ((before, -1), (after, 1)):
+            if snapshot is None:
+                continue
+            day, agent_id, status, duration = snapshot
+            delta = deltas.setdefault((day, agent_id, status), [0, 0])
+            delta[0] += sign
+            delta[1] += sign * duration
+    rows = [{'day': day, 'agent_id': agent_id, 'status': status, 'calls': calls, 'duration_seconds': duration}
+            for (day, agent_id, status), (calls, duration) in deltas.items() if calls or duration]
+    if not rows:
+        return
+    insert = dialect_insert()
+    statement = insert(CallRollup)
+    statement = statement.on_conflict_do_update(
+        index_elements=['day', 'agent_id', 'status'],
+        set_={'calls': CallRollup.calls + statement.excluded.calls,
+              'duration_seconds': CallRollup.duration_seconds + statement.excluded.duration_seconds},
+    )
+    db.session.execute(statement, rows)
+
+
+def log_call_changes(call_ids):
+    """Append changed call ids to the call_changes log in the current transaction.
+
+    Like record_call_changes, every write to phone_calls must call this before
+    committing; it drives the live feed and the /api/calls ETag.
+    """
+    rows = [{'call_id': call_id} for call_id in dict.fromkeys(call_ids) if call_id is not None]
+    if rows:
+        db.session.execute(db.insert(CallChange), rows)
+
+
+def latest_call_change():
+    """Sequence number of the newest logged change (0 when the log is empty)"""
+    return db.session.query(db.func.max(CallChange.seq)).scalar() or 0
+
+
+def rebuild_call_rollups():
+    """Recompute every rollup from phone_calls (backfill, or repair after manual edits)"""
+    day = db.func.date(PhoneCall.call_timestamp)
+    agent_id = db.func.coalesce(PhoneCall.agent_id, '')
+    status = db.func.coalesce(PhoneCall.status, '')
+    totals = (db.select(day, agent_id, status, db.func.count(),
+                        db.func.coalesce(db.func.sum(PhoneCall.call_duration_seconds), 0))
+              .group_by(day, agent_id, status))
+    db.session.execute(db.delete(CallRollup))
+    db.session.execute(db.insert(CallRollup).from_select(
+        ['day', 'agent_id', 'status', 'calls', 'duration_seconds'], totals))
+    db.session.commit()
 
-# Route: get all calls
+
+def ensure_call_rollups():
+    """Backfill the rollups once, when calls exist but no rollups do (e.g. right after upgrading)"""
+    if db.session.query(CallRollup.day).first() is None and db.session.query(PhoneCall.id).first() is not None:
+        rebuild_call_rollups()
+
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+DEFAULT_BULK_CHUNK_SIZE = 500
+MAX_BULK_CHUNK_SIZE = 5000
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FIELDS = ["id", "user_id", "caller_number", "status", "call_duration_seconds",
+                 "call_timestamp", "note", "name", "call_sid", "rating", "agent_id"]
+
+
+def ensure_schema():
+    """Create missing tables, columns and indexes (safe to run on an existing database)"""
+    db.create_all()
+    inspector = db.inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                # Columns added after a table was first created; new columns are always nullable
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                with db.engine.begin() as conn:
+                    conn.execute(db.text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+        if table.name == TranscriptionJob.__tablename__:
+            fail_duplicate_pending_jobs()
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+
+def fail_duplicate_pending_jobs():
+    """Keep one pending transcription job per call, so the unique index can be built on old databases"""
+    keep = (db.select(db.func.max(TranscriptionJob.id)).where(PENDING_JOB_WHERE)
+            .group_by(TranscriptionJob.call_sid))
+    with db.engine.begin() as conn:
+        conn.execute(db.update(TranscriptionJob)
+                     .where(PENDING_JOB_WHERE, TranscriptionJob.id.not_in(keep))
+                     .values(status='failed', error='Duplicate of another pending job'))
+
+
+def encode_cursor(call):
+    raw = f"{call.call_timestamp.isoformat()}|{call.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Turn an opaque cursor back into (call_timestamp, id); raises ValueError if malformed"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, call_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        return datetime.datetime.fromisoformat(timestamp), int(call_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _parse_datetime(value, name):
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid '{name}' datetime: {value}")
+
+
+def filter_calls_query(query, args):
+    """Apply the status / caller_number / user_id / date range filters from request args"""
+    status = args.get('status')
+    if status:
+        statuses = [s for s in status.split(',') if s]
+        query = query.filter(PhoneCall.status.in_(statuses)) if len(statuses) > 1 \
+            else query.filter(PhoneCall.status == statuses[0])
+    caller_number = args.get('caller_number')
+    if caller_number:
+        query = query.filter(PhoneCall.caller_number == caller_number)
+    user_id = args.get('user_id')
+    if user_id:
+        try:
+            query = query.filter(PhoneCall.user_id == int(user_id))
+        except ValueError:
+            raise ValueError(f"Invalid 'user_id': {user_id}")
+    date_from = args.get('from')
+    if date_from:
+        query = query.filter(PhoneCall.call_timestamp >= _parse_datetime(date_from, 'from'))
+    date_to = args.get('to')
+    if date_to:
+        query = query.filter(PhoneCall.call_timestamp < _parse_datetime(date_to, 'to'))
+    return query
+
+
+# Route: list calls, newest first, one keyset page at a time
 @calls_bp.route('/calls', methods=['GET'])
 def get_all_calls_api():
-    calls = PhoneCall.query.order_by(PhoneCall.call_timestamp.desc()).all()
-    return jsonify([call.to_dict() for call in calls])
+    # Every phone_calls write appends to call_changes, so the newest sequence
+    # number identifies the listing; pollers holding it get a 304 without a query
+    etag = f'calls-{latest_call_change()}'
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+        return response
+
+    try:
+        limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        query = filter_calls_query(PhoneCall.query, request.args)
+        cursor = request.args.get('cursor')
+        if cursor:
+            cursor_ts, cursor_id = decode_cursor(cursor)
+            query = query.filter(db.or_(
+                PhoneCall.call_timestamp < cursor_ts,
+                db.and_(PhoneCall.call_timestamp == cursor_ts, PhoneCall.id < cursor_id),
+            ))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Fetch one extra row to know whether another page exists
+    calls = query.order_by(PhoneCall.call_timestamp.desc(), PhoneCall.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(calls[limit - 1]) if len(calls) > limit else None
+    response = jsonify({
+        "calls": [call.to_dict() for call in calls[:limit]],
+        "next_cursor": next_cursor,
+    })
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def _export_csv(calls):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    for i, call in enumerate(calls, 1):
+        writer.writerow(call.to_dict())
+        if i % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _export_ndjson(calls):
+    lines = []
+    for call in calls:
+        lines.append(json.dumps(call.to_dict()))
+        if len(lines) >= EXPORT_BATCH_SIZE:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+# Route: stream the (filtered) call history as CSV or NDJSON
+@calls_bp.route('/calls/export', methods=['GET'])
+def export_calls_api():
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify({'error': "'format' must be 'csv' or 'ndjson'"}), 400
+    try:
+        query = filter_calls_query(PhoneCall.query, request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Server-side cursor: rows are fetched and converted EXPORT_BATCH_SIZE at a time
+    calls = (query.order_by(PhoneCall.call_timestamp.desc(), PhoneCall.id.desc())
+             .execution_options(stream_results=True)
+             .yield_per(EXPORT_BATCH_SIZE))
+
+    if export_format == 'csv':
+        body, mimetype = _export_csv(calls), 'text/csv'
+    else:
+        body, mimetype = _export_ndjson(calls), 'application/x-ndjson'
+    filename = f"calls_{datetime.datetime.now():%Y%m%d_%H%M%S}.{export_format}"
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
 
 # Route: add a new call
 @calls_bp.route('/add_call_record', methods=['POST'])
@@ -64,10 +441,15 @@ def add_call_record_api():
         new_call = PhoneCall(
             caller_number=caller_number,
             status=status,
+            use_name=data.get('name') or '',
             call_duration_seconds=duration,
-            call_timestamp=datetime.datetime.now()
+            call_timestamp=datetime.datetime.now(),
+            agent_id=data.get('agent_id')
         )
         db.session.add(new_call)
+        db.session.flush()
+        record_call_changes([(None, call_snapshot(new_call))])
+        log_call_changes([new_call.id])
         db.session.commit()
 
         return jsonify({'message': 'Call record added successfully'}), 201
@@ -75,6 +457,130 @@ def add_call_record_api():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+def validate_call_record(data):
+    """Turn one posted call record into a phone_calls row dict; raises ValueError if invalid"""
+    if not isinstance(data, dict):
+        raise ValueError('Record must be a JSON object')
+    caller_number = data.get('caller_number')
+    status = data.get('status')
+    if not caller_number or not status:
+        raise ValueError('Missing required fields')
+    if len(str(caller_number)) > 20 or len(str(status)) > 20:
+        raise ValueError("'caller_number' and 'status' must be at most 20 characters")
+
+    duration = data.get('duration')
+    if duration is not None:
+        if isinstance(duration, bool) or not isinstance(duration, (int, float)) or duration < 0:
+            raise ValueError("'duration' must be a non-negative number")
+        duration = int(duration)
+
+    agent_id = data.get('agent_id')
+    if agent_id is not None and len(str(agent_id)) > 20:
+        raise ValueError("'agent_id' must be at most 20 characters")
+
+    user_id = data.get('user_id')
+    if user_id is not None:
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            raise ValueError("'user_id' must be an integer")
+
+    name = str(data.get('name') or '')
+    note = data.get('note')
+    note = str(note) if note is not None else None
+    if len(name) > 20 or (note and len(note) > 200):
+        raise ValueError("'name' must be at most 20 and 'note' at most 200 characters")
+
+    timestamp = data.get('timestamp')
+    timestamp = _parse_datetime(timestamp, 'timestamp') if timestamp else datetime.datetime.now()
+
+    return {
+        'user_id': user_id,
+        'caller_number': str(caller_number),
+        'status': str(status),
+        'use_name': name,
+        'call_duration_seconds': duration,
+        'call_timestamp': timestamp,
+        'note': note,
+        'agent_id': str(agent_id) if agent_id is not None else None,
+    }
+
+
+def _iter_posted_records():
+    """Yield (index, record) from a JSON array body or, line by line, from an NDJSON stream"""
+    content_type = request.content_type or ''
+    if 'ndjson' in content_type or 'jsonlines' in content_type:
+        index = 0
+        for line in request.stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield index, json.loads(line)
+            except ValueError as e:
+                yield index, ValueError(f'Invalid JSON: {e}')
+            index += 1
+        return
+
+    records = request.get_json(silent=True)
+    if not isinstance(records, list):
+        raise ValueError('Body must be a JSON array or an NDJSON stream')
+    yield from enumerate(records)
+
+
+def _insert_chunk(rows, indexes, errors):
+    """Insert one chunk with a single executemany in its own transaction"""
+    try:
+        call_ids = db.session.execute(db.insert(PhoneCall).returning(PhoneCall.id), rows).scalars().all()
+        record_call_changes((None, call_snapshot(row)) for row in rows)
+        log_call_changes(call_ids)
+        db.session.commit()
+        return len(rows)
+    except Exception as e:
+        db.session.rollback()
+        errors.extend({'index': i, 'error': f'Insert failed: {e}'} for i in indexes)
+        return 0
+
+
+# Route: add many calls at once (JSON array or NDJSON), one transaction per chunk
+@calls_bp.route('/add_call_records', methods=['POST'])
+def add_call_records_bulk_api():
+    try:
+        chunk_size = int(request.args.get('chunk_size') or
+                         current_app.config.get('BULK_INSERT_CHUNK_SIZE', DEFAULT_BULK_CHUNK_SIZE))
+    except ValueError:
+        return jsonify({'error': "'chunk_size' must be an integer"}), 400
+    chunk_size = min(max(chunk_size, 1), MAX_BULK_CHUNK_SIZE)
+
+    inserted, received = 0, 0
+    errors, rows, indexes = [], [], []
+    try:
+        for index, record in _iter_posted_records():
+            received += 1
+            try:
+                if isinstance(record, ValueError):
+                    raise record
+                rows.append(validate_call_record(record))
+                indexes.append(index)
+            except ValueError as e:
+                errors.append({'index': index, 'error': str(e)})
+                continue
+            if len(rows) >= chunk_size:
+                inserted += _insert_chunk(rows, indexes, errors)
+                rows, indexes = [], []
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if rows:
+        inserted += _insert_chunk(rows, indexes, errors)
+
+    status_code = 201 if inserted else (400 if errors else 200)
+    return jsonify({
+        'received': received,
+        'inserted': inserted,
+        'failed': len(errors),
+        'errors': errors,
+    }), status_code
+
 @calls_bp.route('/add_note', methods=['POST'])
 def add_note_to_user():
     try:
@@ -85,13 +591,15 @@ def add_note_to_user():
         if not lead_id or not note:
             return jsonify({'error': 'user_id and note are required'}), 400
 
-        # Fetch the PhoneCall entry
-        user_instance = PhoneCall.query.filter_by(user_id=lead_id).first()
+        # Fetch the latest PhoneCall entry of the lead (through ix_phone_calls_user_ts_id)
+        user_instance = (PhoneCall.query.filter_by(user_id=lead_id)
+                         .order_by(PhoneCall.call_timestamp.desc(), PhoneCall.id.desc()).first())
         if not user_instance:
             return jsonify({'error': f'No record found for user_id {lead_id}'}), 404
 
         # Update note
         user_instance.note = note
+        log_call_changes([user_instance.id])
         db.session.commit()
 
         return jsonify({'message': 'Note added successfully', 'call': user_instance.to_dict()}), 200
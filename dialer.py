@@ -1,32 +1,41 @@
 import os
 import time
+import uuid
 import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 from urllib.parse import quote
-from twilio.rest import Client
+from twilio_client import get_twilio_client
+from agent_registry import AgentRegistry
+from voicemail_audio import voicemail_url
+from state_store import create_state_store
 from twilio.jwt.access_token import AccessToken
 from twilio.jwt.access_token.grants import VoiceGrant
-from twilio.twiml.voice_response import VoiceResponse, Dial, Play
+import twiml_templates as twiml
 from twilio.base.exceptions import TwilioRestException
 from dotenv import load_dotenv
 from flask import jsonify
 load_dotenv()
 
 
-VOICEMAIL_URLS = {
-    "male": "http://127.0.0.1:8080/ai_voice/male_voice.wav",
-    "female": "http://127.0.0.1:8080/ai_voice/female_voice.wav"
-}   
+# Call state lives this long after the call was placed, and this long after its final status callback
+CALL_STATE_TTL_SECONDS = int(os.getenv("CALL_STATE_TTL_SECONDS", 4 * 3600))
+FINISHED_CALL_TTL_SECONDS = int(os.getenv("FINISHED_CALL_TTL_SECONDS", 600))
+
+# Bulk voicemail drops in flight at once, per process
+VOICEMAIL_BATCH_CONCURRENCY = int(os.getenv("VOICEMAIL_BATCH_CONCURRENCY", 8))
+MAX_TRACKED_VOICEMAIL_BATCHES = 100
 
 
 class DialerEngineDev:
-    def __init__(self):
+    def __init__(self, state_store=None):
         self.account_sid = os.getenv("TWILIO_ACCOUNT_SID")
         self.api_key_sid = os.getenv("TWILIO_API_KEY_SID")
         self.api_key_secret = os.getenv("TWILIO_API_SECRET")
         self.auth_token = os.getenv("TWILIO_AUTH_TOKEN")
         self.twiml_app_sid = os.getenv("TWILIO_TWIML_APP_SID")
-        self.client = Client(self.account_sid, self.auth_token)
+        self.client = get_twilio_client()
         self.caller_id = os.getenv("TWILIO_CALLER_ID")
         self.base_url = os.getenv("PUBLIC_URL")
         self.private_key = os.getenv("PRIVATE_KEY")
@@ -38,72 +47,117 @@ class DialerEngineDev:
             raise ValueError("Missing one or more required Twilio environment variables.")
 
         
-        self.conferences = {}
-        # Stores conference name associated with a customer call SID for AMD handling
-        self.call_metadata = {}
+        # Agent statuses and per-call metadata live in a store that can be shared
+        # across workers and nodes (see STATE_BACKEND in state_store.py)
+        self.state = state_store or create_state_store()
+        self.agents = AgentRegistry(self.state)
+        self._voicemail_pool = ThreadPoolExecutor(VOICEMAIL_BATCH_CONCURRENCY, thread_name_prefix="voicemail")
+        self._voicemail_batches = OrderedDict()  # batch id -> futures, oldest evicted first
+        self._voicemail_lock = threading.Lock()
+
+    def get_call_metadata(self, call_sid: str) -> dict:
+        """Conference name, agent and progress of a customer call SID ({} once evicted)"""
+        if not call_sid:
+            return {}
+        return self.state.get("call", call_sid) or {}
+
+    def update_call_metadata(self, call_sid: str, **fields) -> dict:
+        metadata = {**self.get_call_metadata(call_sid), **fields}
+        self.state.set("call", call_sid, metadata, ttl=CALL_STATE_TTL_SECONDS)
+        return metadata
+
+    def finish_call(self, call_sid: str):
+        """Keep a finished call's metadata only long enough for late webhooks"""
+        self.state.expire("call", call_sid, FINISHED_CALL_TTL_SECONDS)
+        self.state.delete("active_call", call_sid)
 
-    def register_agent(self, agent_id: str, client_identity: str):
-        self.agents[agent_id] = {"identity": client_identity, "status": "available"}
+    def mark_call_active(self, call_sid: str):
+        """Count a customer call as in flight until finish_call (or CALL_STATE_TTL_SECONDS)"""
+        self.state.set("active_call", call_sid, True, ttl=CALL_STATE_TTL_SECONDS)
+
+    def active_calls(self) -> int:
+        return self.state.count("active_call")
+
+    def register_agent(self, agent_id: str, client_identity: str, skills=None):
+        self.agents.register(agent_id, client_identity, skills)
         return {"registered": agent_id, "identity": client_identity}
 
+    def agent_online(self, agent_id: str):
+        """A softphone came online: register unknown agents, make offline ones available (disabled ones stay disabled)"""
+        if agent_id not in self.agents:
+            self.agents.register(agent_id, agent_id)
+        elif self.agents.status(agent_id) == "offline":
+            self.agents.set_status(agent_id, "available")
+
     def get_agent_status(self, agent_id: str):
-        agent = self.agents.get(agent_id)
-        if not agent:
+        status = self.agents.status(agent_id)
+        if not status:
             return {"error": "unknown agent"}, 404
-        return {"agent_id": agent_id, "status": agent["status"]}
+        return {"agent_id": agent_id, "status": status}
 
     def set_agent_status(self, agent_id: str, status: str):
-        if agent_id not in self.agents:
+        if not self.agents.set_status(agent_id, status):
             return {"error": "unknown agent"}, 404
-        self.agents[agent_id]["status"] = status
         return {"agent_id": agent_id, "status": status}
 
+    def count_agents(self, agent_ids=None) -> tuple:
+        """(available, busy) counts, overall or among the given agents"""
+        return self.agents.counts(agent_ids)
+
+    def _claim_available_agent(self, skill: Optional[str] = None, agent_ids=None) -> Optional[tuple]:
+        """Atomically pick the longest-idle available agent and mark it busy"""
+        return self.agents.claim(skill, agent_ids)
+
     def _find_available_agent(self) -> Optional[tuple]:
-        for aid, meta in self.agents.items():
-            if meta.get("status") == "available":
-                return aid, meta["identity"]
-        return None
+        # Does not reserve the agent; routing should use _claim_available_agent
+        return self.agents.peek()
 
     def _mark_agent_busy(self, agent_id: str):
-        if agent_id in self.agents:
-            self.agents[agent_id]["status"] = "busy"
+        self.agents.set_status(agent_id, "busy")
 
     def _mark_agent_available(self, agent_id: str):
-        if agent_id in self.agents:
-            self.agents[agent_id]["status"] = "available"
+        self.agents.release(agent_id)
 
-    def get_token(self, identity="web_user"):
-        token = AccessToken(self.account_sid, self.api_key_sid, self.api_key_secret, identity=identity)
+    def sign_token(self, identity="web_user", ttl: int = 3600) -> str:
+        """Build and sign a Voice access token JWT for a softphone identity"""
+        token = AccessToken(self.account_sid, self.api_key_sid, self.api_key_secret, identity=identity, ttl=ttl)
         voice_grant = VoiceGrant(
             outgoing_application_sid=self.twiml_app_sid,
             incoming_allow=True
         )
         token.add_grant(voice_grant)
-        return jsonify(token=token.to_jwt())
+        return token.to_jwt()
 
-    def make_call_from_agent(self, agent_id: str, customer_number: str, voicemail_audio_url: str):        
+    def get_token(self, identity="web_user"):
+        return jsonify(token=self.sign_token(identity))
+
+    def place_call(self, agent_id: str, customer_number: str, voicemail_audio_url: str, caller_id: Optional[str] = None):
+        """Dial a customer for an agent with AMD; returns (call_sid, conference_name), raises on Twilio errors"""
         conference_name = f"conf_{agent_id}_{int(time.time())}"
-        
+        # Create the outbound call to the customer with Answering Machine Detection (AMD)
+        customer_call = self.client.calls.create(
+            to=customer_number,
+            from_=caller_id or self.caller_id,
+            # AMD runs before this TwiML is fetched: /join connects a human and plays the voicemail to a machine
+            url=f"{self.base_url}/join?Room={quote(conference_name)}&vm_audio_url={quote(voicemail_audio_url)}",
+            # The machineDetection parameter is key for detecting voicemails
+            machine_detection='DetectMessageEnd',
+            # This webhook is triggered by Twilio after AMD completes
+            # It will have a CallStatus of `completed` and a `AnsweredBy` parameter
+            fallback_url=f"{self.base_url}/handle_machine_detection?vm_audio_url={quote(voicemail_audio_url)}&Room={quote(conference_name)}",
+            status_callback=f"{self.base_url}/call_status",
+            status_callback_event=['initiated', 'ringing', 'answered', 'completed'],
+            status_callback_method="POST",
+            record=True
+        )
+        self.update_call_metadata(customer_call.sid, conference_name=conference_name, agent_id=agent_id)
+        self.mark_call_active(customer_call.sid)
+        return customer_call.sid, conference_name
+
+    def make_call_from_agent(self, agent_id: str, customer_number: str, voicemail_audio_url: str):        
         try:
-            # Create the outbound call to the customer with Answering Machine Detection (AMD)
-            customer_call = self.client.calls.create(
-                to=customer_number,
-                from_=self.caller_id,
-                # This TwiML URL will be used if a human answers
-                url=f"{self.base_url}/join?Room={quote(conference_name)}",
-                # The machineDetection parameter is key for detecting voicemails
-                machine_detection='DetectMessageEnd',
-                # This webhook is triggered by Twilio after AMD completes
-                # It will have a CallStatus of `completed` and a `AnsweredBy` parameter
-                fallback_url=f"{self.base_url}/handle_machine_detection?vm_audio_url={quote(voicemail_audio_url)}&Room={quote(conference_name)}",
-                status_callback=f"{self.base_url}/call_status",
-                status_callback_event=['initiated', 'ringing', 'answered', 'completed'],
-                status_callback_method="POST",
-                record=True
-            )
-            self.call_metadata[customer_call.sid] = {'conference_name': conference_name, 'agent_id': agent_id}
-            
-            return jsonify({"conference": conference_name, "customer_call_sid": customer_call.sid}),200
+            call_sid, conference_name = self.place_call(agent_id, customer_number, voicemail_audio_url)
+            return jsonify({"conference": conference_name, "customer_call_sid": call_sid}),200
         except Exception as e:
             print("errror is",e)
             return jsonify({"error": str(e)}), 500
@@ -118,86 +172,132 @@ class DialerEngineDev:
             })
         return {"call_sid": call_sid, "recordings": transcript_data}
     
-    def generate_twiml_for_agent_softphone(self, to: str):
-        resp = VoiceResponse()
+    def dial_agent_into_conference(self, agent_id: str, client_identity: str, conference_name: str,
+                                   customer_call_sid: Optional[str] = None):
+        """Ring an agent's softphone into a conference the customer is already waiting in.
+
+        Meant to run after the customer's TwiML was returned. If the agent can't
+        be dialed the agent is released and the waiting customer is told so.
+        """
+        try:
+            agent_call = self.client.calls.create(
+                to=f"client:{client_identity}",
+                from_=self.caller_id,
+                url=f"{self.base_url}/join?Room={quote(conference_name)}",
+                status_callback=f"{self.base_url}/call_status",
+                status_callback_event=['answered', 'completed'],
+                status_callback_method="POST"
+            )
+            # Released by /call_status when the agent leg ends
+            self.update_call_metadata(agent_call.sid, connected_agent=agent_id)
+        except Exception as e:
+            self._mark_agent_available(agent_id)
+            print(f"Error calling agent: {e}")
+            if customer_call_sid:
+                try:
+                    self.client.calls(customer_call_sid).update(
+                        twiml=twiml.SAY_HANGUP.render(message="Sorry, we couldn't connect you to an agent."))
+                except Exception as e:
+                    print(f"Error updating call {customer_call_sid}: {e}")
+
+    def softphone_twiml(self, to: str, call_sid: Optional[str] = None):
+        """TwiML for the softphone app; returns (twiml, tasks) where tasks are REST calls to run afterwards"""
+        tasks = []
         if to and to.startswith("room:"):
             # Outbound call: Agent joining the conference
             room_name = to.replace("room:", "")
-            resp.dial().conference(
-                room_name,
-                start_conference_on_enter=True,
-                end_conference_on_exit=True
-            )
+            return twiml.AGENT_CONFERENCE.render(room=room_name), tasks
         else:
             # Incoming call: Route to an available agent
-            available_agent = self._find_available_agent()
+            available_agent = self._claim_available_agent()
             if available_agent:
                 agent_id, client_identity = available_agent
                 
                 # Create a unique conference for the incoming call
-                conference_name = f"incoming_conf_{int(time.time())}"
-                
-                # Dial the agent's softphone and place them in the conference
-                resp.dial().conference(
-                    conference_name,
-                    start_conference_on_enter=True,
-                    end_conference_on_exit=True,
-                    wait_url="http://twimlets.com/holdmusic?Bucket=com.twilio.music.classical"
-                )
-                
-                # The customer is placed in the conference via a separate call. We need to tell the customer to wait.
-                # However, Twilio routes the call directly to the TwiML response. So the agent is called first.
+                conference_name = f"incoming_conf_{call_sid or int(time.time())}"
                 
-                # Dial the agent's softphone using a separate call.
-                try:
-                    self.client.calls.create(
-                        to=f"client:{client_identity}",
-                        from_=self.caller_id,
-                        url=f"{self.base_url}/join?Room={quote(conference_name)}",
-                        status_callback=f"{self.base_url}/call_status",
-                        status_callback_event=['answered', 'completed'],
-                        status_callback_method="POST"
-                    )
-                    self._mark_agent_busy(agent_id)
-                except Exception as e:
-                    print(f"Error calling agent: {e}")
-                    resp.say("Sorry, we couldn't connect you to an agent.")
+                # The customer waits in the conference while the agent's softphone is dialed separately
+                tasks.append(lambda: self.dial_agent_into_conference(agent_id, client_identity, conference_name,
+                                                                     customer_call_sid=call_sid))
+                return twiml.HOLD_CONFERENCE_UNTIL_EXIT.render(room=conference_name), tasks
             else:
-                resp.say("Thank you for calling. All of our agents are currently busy. Please try again later.")
-        return str(resp)
+                return twiml.SAY.render(
+                    message="Thank you for calling. All of our agents are currently busy. Please try again later."), tasks
+
+    def generate_twiml_for_agent_softphone(self, to: str, call_sid: Optional[str] = None):
+        response_xml, tasks = self.softphone_twiml(to, call_sid)
+        for task in tasks:
+            task()
+        return response_xml
 
     def generate_join_twiml(self, room: str):
-        resp = VoiceResponse()
-        dial = Dial()
-        dial.conference(room, start_conference_on_enter=True, end_conference_on_exit=True, record=False)
-        resp.append(dial)
-        return str(resp)
+        return twiml.JOIN_CONFERENCE.render(room=room)
     
     def handle_amd_result(self, answered_by: str, vm_audio_url: str, conference_name: str, call_sid: str):
-        resp = VoiceResponse()
         if answered_by == "human":
             # A human answered, connect to the conference
-            resp.dial().conference(conference_name)
-        elif answered_by == "machine":
-            # A machine/voicemail answered, drop the pre-recorded message
-            resp.say("Playing the voicemail message now.")
-            resp.play(vm_audio_url)
-            # Hang up the call after the message
-            resp.hangup()
+            return twiml.CONFERENCE.render(room=conference_name)
+        elif answered_by and answered_by.startswith("machine"):
+            # A machine/voicemail answered, drop the pre-recorded message and hang up
+            return twiml.SAY_PLAY_HANGUP.render(message="Playing the voicemail message now.", url=vm_audio_url)
         else:
             # The call was not answered or an error occurred
-            resp.say("The call could not be completed.")
-            resp.hangup()
-        return str(resp)
+            return twiml.SAY_HANGUP.render(message="The call could not be completed.")
     
+    def send_voicemail(self, to_number: str, voice: str, caller_id: Optional[str] = None) -> str:
+        """Call a number and play a voicemail recording; returns the call SID, raises on errors"""
+        call = self.client.calls.create(
+            to=to_number,
+            from_=caller_id or self.caller_id,
+            twiml=twiml.PLAY.render(url=voicemail_url(voice, self.base_url))
+        )
+        return call.sid
+
     def drop_voice_mail(self,to_number,voice):
         try:
-            call = self.client.calls.create(
-                to=to_number,
-                from_=self.caller_id,
-                twiml=f'<Response><Play>{VOICEMAIL_URLS[voice]}</Play></Response>'
-            )
-            return jsonify({"message": "Voicemail call initiated", "call_sid": call.sid})
+            call_sid = self.send_voicemail(to_number, voice)
+            return jsonify({"message": "Voicemail call initiated", "call_sid": call_sid})
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         except Exception as e:
             return jsonify({"error": str(e)}), 500
-        
\ No newline at end of file
+
+    def drop_voice_mails(self, numbers, voice: str, caller_id: Optional[str] = None, bucket=None) -> str:
+        """Start dropping a voicemail on many numbers, VOICEMAIL_BATCH_CONCURRENCY calls at a time.
+
+        `bucket` (a campaign TokenBucket) paces call creation for the caller ID.
+        Returns a batch id for voicemail_batch(); raises ValueError for unknown voices.
+        """
+        voicemail_url(voice, self.base_url)  # unknown voice: reject the whole batch up front
+
+        def drop(number):
+            if bucket is not None:
+                bucket.acquire()
+            try:
+                return {"to": number, "call_sid": self.send_voicemail(number, voice, caller_id)}
+            except Exception as e:
+                return {"to": number, "error": str(e)}
+
+        batch_id = uuid.uuid4().hex
+        futures = [self._voicemail_pool.submit(drop, number) for number in numbers]
+        with self._voicemail_lock:
+            self._voicemail_batches[batch_id] = futures
+            while len(self._voicemail_batches) > MAX_TRACKED_VOICEMAIL_BATCHES:
+                self._voicemail_batches.popitem(last=False)
+        return batch_id
+
+    def voicemail_batch(self, batch_id: str) -> Optional[dict]:
+        """Progress of a voicemail batch with one {"to", "call_sid"} or {"to", "error"} per finished number"""
+        with self._voicemail_lock:
+            futures = self._voicemail_batches.get(batch_id)
+        if futures is None:
+            return None
+        results = [future.result() if future.done() else None for future in futures]
+        return {
+            "batch_id": batch_id,
+            "status": "completed" if all(results) else "running",
+            "total": len(results),
+            "sent": sum(1 for r in results if r and "call_sid" in r),
+            "failed": sum(1 for r in results if r and "error" in r),
+            "results": results,
+        }
@@ -0,0 +1,25 @@
+"""gunicorn settings, picked up by `gunicorn wsgi:app` from the working directory.
+
+Threaded workers: every open /api/calls/stream holds a thread, so sync
+workers (one thread each) would be taken up by a few dashboards and stall
+the Twilio webhooks. Streams are also closed every few minutes
+(CHANGE_FEED_MAX_STREAM_SECONDS) and resumed by the browser.
+
+One worker by default. Agents and call metadata are only shared between
+workers with STATE_BACKEND=sqlite or redis; with the default memory backend
+each worker would route calls on its own copy, so WEB_CONCURRENCY is ignored
+there. Campaigns and voicemail batches always live in the worker that
+created them: with several workers, polling /api/campaigns/<id> or
+/api/send_voicemail/batch/<id> needs sticky sessions.
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', 8080)}"
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", 1))
+if workers > 1 and os.getenv("STATE_BACKEND", "memory").lower() == "memory":
+    print(f"WEB_CONCURRENCY={workers} needs a shared STATE_BACKEND (sqlite or redis); running 1 worker")
+    workers = 1
+threads = int(os.getenv("GUNICORN_THREADS", 32))
+# Keepalive comments go out every CHANGE_FEED_HEARTBEAT_SECONDS, well inside this
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
@@ -0,0 +1,264 @@
+import io
+import os
+import re
+import csv
+import time
+import heapq
+import datetime
+import threading
+from database.lead_database import db, Lead, dialect_insert
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# National numbers (no + or 00 prefix) are assumed to be in this country
+DEFAULT_COUNTRY_CODE = os.getenv("LEADS_DEFAULT_COUNTRY_CODE", "1")
+# A dialed lead is not handed out (or dialed by a campaign) again for this long
+REDIAL_COOLDOWN_SECONDS = int(os.getenv("LEADS_REDIAL_COOLDOWN_SECONDS", 24 * 3600))
+# Leads dialed this many times leave the queue
+MAX_DIALS_PER_LEAD = int(os.getenv("LEADS_MAX_DIALS", 3))
+IMPORT_CHUNK_SIZE = 1000
+MAX_IMPORT_ERRORS = 100
+PHONE_COLUMNS = ("phone_number", "phone", "number", "to")
+TRUE_VALUES = ("1", "true", "yes", "y")
+
+
+def normalize_e164(number, default_country_code=DEFAULT_COUNTRY_CODE):
+    """'(555) 010-0001' -> '+15550100001'; None if it can't be an E.164 number"""
+    if number is None:
+        return None
+    number = str(number).strip()
+    digits = re.sub(r"\D", "", number)
+    if number.startswith("+"):
+        pass
+    elif number.startswith("00"):
+        digits = digits[2:]
+    elif not (default_country_code == "1" and len(digits) == 11 and digits.startswith("1")):
+        # National format, possibly with a trunk prefix 0
+        digits = default_country_code + digits.lstrip("0")
+    if not 8 <= len(digits) <= 15 or digits[0] == "0":
+        return None
+    return "+" + digits
+
+
+def _epoch(value):
+    return value.replace(tzinfo=datetime.timezone.utc).timestamp() if value else 0.0
+
+
+def _naive_utc(epoch):
+    # Stored like datetime.utcnow(): naive UTC
+    return datetime.datetime.fromtimestamp(epoch, datetime.timezone.utc).replace(tzinfo=None)
+
+
+class LeadQueue:
+    """Picks the next leads to dial from memory instead of querying per call.
+
+    Callable leads sit in a heap ordered by priority (highest first), then
+    fewest dials, then age. Do-not-call numbers and recently dialed numbers are
+    kept in hash sets, so any number can be checked in O(1). A lead handed out
+    is claimed with one conditional UPDATE, so workers sharing the database
+    never hand out the same lead twice; call rebuild() to pick up changes made
+    by other workers.
+    """
+
+    PRUNE_INTERVAL_SECONDS = 60
+
+    def __init__(self, app, cooldown=None, max_dials=None):
+        self.app = app
+        self.cooldown = cooldown or REDIAL_COOLDOWN_SECONDS
+        self.max_dials = max_dials or MAX_DIALS_PER_LEAD
+        self._heap = []  # (-priority, dial_count, id, phone_number)
+        self._cooling = []  # (ready_at, -priority, dial_count, id, phone_number)
+        self._dnc = set()
+        self._recent = {}  # phone_number -> dialed at (epoch seconds)
+        self._lock = threading.Lock()
+        self._last_prune = time.time()
+
+    def rebuild(self):
+        """Reload the queue and the filters from the leads table"""
+        now = time.time()
+        heap, cooling, dnc, recent = [], [], set(), {}
+        rows = (db.session.query(Lead.id, Lead.phone_number, Lead.priority, Lead.dnc,
+                                 Lead.dial_count, Lead.last_dialed_at)
+                .execution_options(yield_per=5000))
+        for lead_id, phone, priority, is_dnc, dial_count, last_dialed_at in rows:
+            if is_dnc:
+                dnc.add(phone)
+                continue
+            dialed_at = _epoch(last_dialed_at)
+            if dialed_at > now - self.cooldown:
+                recent[phone] = dialed_at
+            if dial_count >= self.max_dials:
+                continue
+            if phone in recent:
+                cooling.append((dialed_at + self.cooldown, -priority, dial_count, lead_id, phone))
+            else:
+                heap.append((-priority, dial_count, lead_id, phone))
+        heapq.heapify(heap)
+        heapq.heapify(cooling)
+        with self._lock:
+            self._heap, self._cooling, self._dnc, self._recent = heap, cooling, dnc, recent
+            self._last_prune = now
+        return len(heap) + len(cooling)
+
+    def add(self, leads):
+        """Queue freshly imported leads: [(id, phone_number, priority, dnc), ...]"""
+        with self._lock:
+            for lead_id, phone, priority, is_dnc in leads:
+                if is_dnc:
+                    self._dnc.add(phone)
+                else:
+                    heapq.heappush(self._heap, (-priority, 0, lead_id, phone))
+
+    def is_blocked(self, number):
+        """True for do-not-call numbers and numbers dialed within the cooldown"""
+        phone = normalize_e164(number) or number
+        with self._lock:
+            return phone in self._dnc or self._recent.get(phone, 0) > time.time() - self.cooldown
+
+    def mark_dialed(self, numbers):
+        now = time.time()
+        with self._lock:
+            for number in numbers:
+                self._recent[normalize_e164(number) or number] = now
+
+    def _prune(self, now):
+        if now - self._last_prune >= self.PRUNE_INTERVAL_SECONDS:
+            self._last_prune = now
+            cutoff = now - self.cooldown
+            self._recent = {phone: at for phone, at in self._recent.items() if at > cutoff}
+        while self._cooling and self._cooling[0][0] <= now:
+            _, priority, dial_count, lead_id, phone = heapq.heappop(self._cooling)
+            heapq.heappush(self._heap, (priority, dial_count, lead_id, phone))
+
+    def next(self, count=1):
+        """Claim up to `count` leads to dial now, best first; returns Lead dicts"""
+        now = time.time()
+        picked = []
+        with self._lock:
+            self._prune(now)
+            while self._heap and len(picked) < count:
+                entry = heapq.heappop(self._heap)
+                phone = entry[3]
+                if phone in self._dnc:
+                    continue
+                if self._recent.get(phone, 0) > now - self.cooldown:
+                    # Dialed outside the queue (e.g. by a campaign); retry after the cooldown
+                    heapq.heappush(self._cooling, (self._recent[phone] + self.cooldown,) + entry)
+                    continue
+                picked.append(entry)
+        if not picked:
+            return []
+
+        claimed = self._claim([entry[2] for entry in picked], now)
+        with self._lock:
+            for priority, dial_count, lead_id, phone in picked:
+                if lead_id not in claimed:
+                    continue  # taken by another worker or changed in the database
+                self._recent[phone] = now
+                if dial_count + 1 < self.max_dials:
+                    heapq.heappush(self._cooling, (now + self.cooldown, priority, dial_count + 1, lead_id, phone))
+        return [claimed[entry[2]] for entry in picked if entry[2] in claimed]
+
+    def _claim(self, lead_ids, now):
+        dialed_at = _naive_utc(now)
+        cutoff = _naive_utc(now - self.cooldown)
+        statement = (db.update(Lead)
+                     .where(Lead.id.in_(lead_ids), Lead.dnc.is_(False),
+                            db.or_(Lead.last_dialed_at.is_(None), Lead.last_dialed_at < cutoff))
+                     .values(last_dialed_at=dialed_at, dial_count=Lead.dial_count + 1)
+                     .returning(Lead.id, Lead.phone_number, Lead.name, Lead.priority, Lead.dial_count))
+        rows = db.session.execute(statement).all()
+        db.session.commit()
+        return {
+            row.id: {"id": row.id, "phone_number": row.phone_number, "name": row.name,
+                     "priority": row.priority, "dial_count": row.dial_count}
+            for row in rows
+        }
+
+    def add_dnc(self, numbers):
+        """Put numbers on the do-not-call list (creating leads for unknown numbers).
+
+        Returns (added, invalid) where invalid lists the numbers that couldn't be normalized.
+        """
+        phones, invalid = [], []
+        for number in numbers:
+            phone = normalize_e164(number)
+            if phone:
+                phones.append(phone)
+            else:
+                invalid.append(number)
+        phones = list(dict.fromkeys(phones))
+        if phones:
+            insert = dialect_insert()
+            statement = insert(Lead).on_conflict_do_update(index_elements=["phone_number"], set_={"dnc": True})
+            db.session.execute(statement, [{"phone_number": phone, "dnc": True, "priority": 0, "dial_count": 0}
+                                           for phone in phones])
+            db.session.commit()
+            with self._lock:
+                self._dnc.update(phones)
+        return len(phones), invalid
+
+    def import_csv(self, stream):
+        """Import leads from a CSV with a header row, deduplicating in a single pass.
+
+        Needs a phone column (phone_number, phone, number or to); name, priority
+        and dnc are optional. Numbers repeated in the file or already in the
+        table are skipped. Raises ValueError if the file has no phone column.
+        """
+        reader = csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
+        columns = {(name or "").strip().lower() for name in reader.fieldnames or ()}
+        if not columns & set(PHONE_COLUMNS):
+            raise ValueError(f"CSV needs a phone column: one of {', '.join(PHONE_COLUMNS)}")
+
+        summary = {"received": 0, "imported": 0, "duplicates_in_file": 0, "already_present": 0,
+                   "invalid": 0, "errors": []}
+        seen, chunk = set(), []
+        for line, row in enumerate(reader, start=2):
+            summary["received"] += 1
+            row = {(key or "").strip().lower(): (value or "").strip() for key, value in row.items()
+                   if isinstance(value, str)}
+            raw = next((row[c] for c in PHONE_COLUMNS if row.get(c)), None)
+            try:
+                phone = normalize_e164(raw)
+                if not phone:
+                    raise ValueError(f"Invalid phone number: {raw!r}")
+                priority = int(row.get("priority") or 0)
+            except ValueError as e:
+                summary["invalid"] += 1
+                if len(summary["errors"]) < MAX_IMPORT_ERRORS:
+                    summary["errors"].append({"line": line, "error": str(e)})
+                continue
+            if phone in seen:
+                summary["duplicates_in_file"] += 1
+                continue
+            seen.add(phone)
+            chunk.append({"phone_number": phone, "name": row.get("name", "")[:100] or None,
+                          "priority": priority, "dnc": row.get("dnc", "").lower() in TRUE_VALUES,
+                          "dial_count": 0})
+            if len(chunk) >= IMPORT_CHUNK_SIZE:
+                self._import_chunk(chunk, summary)
+                chunk = []
+        if chunk:
+            self._import_chunk(chunk, summary)
+        return summary
+
+    def _import_chunk(self, rows, summary):
+        # ON CONFLICT DO NOTHING dedupes against the table in the same statement
+        insert = dialect_insert()
+        statement = (insert(Lead).on_conflict_do_nothing(index_elements=["phone_number"])
+                     .returning(Lead.id, Lead.phone_number, Lead.priority, Lead.dnc))
+        inserted = db.session.execute(statement, rows).all()
+        db.session.commit()
+        self.add([tuple(row) for row in inserted])
+        summary["imported"] += len(inserted)
+        summary["already_present"] += len(rows) - len(inserted)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queued": len(self._heap),
+                "cooling_down": len(self._cooling),
+                "do_not_call": len(self._dnc),
+                "recently_dialed": len(self._recent),
+            }
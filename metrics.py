@@ -0,0 +1,274 @@
+"""In-process metrics in the Prometheus text format, served at /metrics.
+
+Every metric is a dict of label values -> numbers behind one lock, so
+recording costs a dict update (about a microsecond) and is safe to
+leave on. Each process (worker) keeps and reports its own numbers.
+"""
+import re
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# Seconds; covers in-memory work (sub-millisecond) up to slow Twilio / Gemini / STT calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines += self._samples()
+        return "\n".join(lines)
+
+    def _samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+                for key, value in sorted(values)]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+
+class Gauge(Metric):
+    """A settable value, or one read from `callback` at scrape time.
+
+    The callback returns a number, or {label values tuple: number} for a
+    labelled gauge; if it raises, the gauge is left out of that scrape.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labels=(), registry=None, callback=None):
+        super().__init__(name, documentation, labels, registry)
+        self.callback = callback
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def _samples(self):
+        if self.callback is not None:
+            try:
+                values = self.callback()
+            except Exception:
+                return []
+            if values is None:
+                return []
+            if not isinstance(values, dict):
+                values = {(): values}
+            with self._lock:
+                self._values = dict(values)
+        return super()._samples()
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), registry=None, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                # Per-bucket (not cumulative) counts, then sum and count
+                series = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def count(self, *labels):
+        series = self._values.get(labels)
+        return series[-1] if series else 0
+
+    def _samples(self):
+        with self._lock:
+            values = [(key, list(series)) for key, series in self._values.items()]
+        lines = []
+        for key, series in sorted(values):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), series):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def unregister(self, name):
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time to produce a response, by route",
+    ("route", "method", "status"))
+TWILIO_REQUEST_SECONDS = Histogram(
+    "twilio_request_duration_seconds", "Twilio REST API call latency, by operation",
+    ("operation",))
+TWILIO_ERRORS = Counter(
+    "twilio_request_errors_total", "Twilio REST API calls that failed, by operation and HTTP status",
+    ("operation", "status"))
+STT_SECONDS = Histogram(
+    "stt_duration_seconds", "Recording download and transcription time", ("stage",))
+STT_ERRORS = Counter("stt_errors_total", "Failed recording downloads and transcriptions", ("stage",))
+GEMINI_REQUEST_SECONDS = Histogram("gemini_request_duration_seconds", "Gemini rating call latency")
+GEMINI_ERRORS = Counter("gemini_request_errors_total", "Gemini rating calls that failed")
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds", "SQL statement execution time, by statement type", ("statement",))
+# Read at scrape time; their callbacks are set by the app (see main.create_app)
+AGENTS = Gauge("dialer_agents", "Agents by status (available, busy)", ("status",))
+ACTIVE_CALLS = Gauge("dialer_active_calls", "Calls placed that have not reported a final status yet")
+STATUS_CALLBACKS_PENDING = Gauge("status_callbacks_pending", "Status callbacks queued for the database writer")
+
+# Twilio resource ids (CA..., RE..., CF...) in REST paths
+_SID = re.compile(r"^[A-Z]{2}[0-9a-f]{32}$")
+
+
+def twilio_operation(method, url):
+    """'POST .../Accounts/AC.../Calls.json' -> 'calls.create', 'GET .../Calls/CA....json' -> 'calls.fetch'"""
+    path = url.split("?", 1)[0].split("://", 1)[-1]
+    segments = [s[:-5] if s.endswith(".json") else s for s in path.split("/")[1:] if s]
+    if not segments:
+        return "unknown"
+    is_instance = bool(_SID.match(segments[-1]))
+    resources = [s for s in segments if not _SID.match(s) and not s[:1].isdigit()]
+    resource = resources[-1].lower() if resources else "unknown"
+    if is_instance:
+        action = {"GET": "fetch", "POST": "update", "DELETE": "delete"}.get(method.upper(), method.lower())
+    else:
+        action = {"GET": "list", "POST": "create"}.get(method.upper(), method.lower())
+    return f"{resource}.{action}"
+
+
+def statement_type(statement):
+    return statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("metrics_started")
+    if started:
+        DB_QUERY_SECONDS.observe(time.perf_counter() - started.pop(), statement_type(statement))
+
+
+def _handle_error(context):
+    started = context.connection.info.get("metrics_started") if context.connection is not None else None
+    if started:
+        DB_QUERY_SECONDS.observe(time.perf_counter() - started.pop(), "ERROR")
+
+
+def instrument_sqlalchemy():
+    """Time every SQL statement on every engine"""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Engine, "handle_error", _handle_error)
+
+
+def init_app(app):
+    """Time every Flask request by route (url rule) and instrument the database"""
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _note_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    # Recorded at teardown, which (unlike after_request) also runs when a view raised
+    @app.teardown_request
+    def _observe_request(exc):
+        started = g.pop("metrics_started", None)
+        if started is None:
+            return
+        status = g.pop("metrics_status", None)
+        if exc is not None or status is None:
+            status = 500
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, route, request.method, str(status))
+
+    instrument_sqlalchemy()
@@ -1,6 +1,12 @@
-from database.lead_database import  db, Agent   # import app, db, and model
-from main import app
-agents_data = [
+"""Create or upgrade the database schema and seed the default agents.
+
+    python migrations.py
+
+Run it once per deploy, before starting the web workers; running it again is safe.
+"""
+from database.lead_database import db, Agent, dialect_insert, ensure_schema, ensure_call_rollups
+
+DEFAULT_AGENTS = [
     {"agent_id": "AG001", "name": "Alice Johnson", "phone_number": "+1555010001", "responsibility": "Inbound Sales"},
     {"agent_id": "AG002", "name": "Bob Smith", "phone_number": "+1555010002", "responsibility": "Technical Support"},
     {"agent_id": "AG003", "name": "Charlie Davis", "phone_number": "+1555010003", "responsibility": "Customer Success"},
@@ -13,7 +19,24 @@ agents_data = [
     {"agent_id": "AG010", "name": "Julia Scott", "phone_number": "+1555010010", "responsibility": "Onboarding New Clients"}
 ]
 
-with app.app_context():
-    for agent in agents_data:
-        db.session.add(Agent(**agent))
+
+def seed_agents(agents=DEFAULT_AGENTS):
+    """Add the agents that don't exist yet (by agent_id); returns how many were added"""
+    insert = dialect_insert()
+    statement = insert(Agent).on_conflict_do_nothing(index_elements=["agent_id"]).returning(Agent.id)
+    added = len(db.session.execute(statement, agents).all())
     db.session.commit()
+    return added
+
+
+def migrate(app):
+    with app.app_context():
+        ensure_schema()
+        added = seed_agents()
+        ensure_call_rollups()
+    print(f"Schema is up to date; {added} agents added")
+
+
+if __name__ == "__main__":
+    from main import create_app
+    migrate(create_app(warm_up=False))
@@ -0,0 +1,122 @@
+import os
+import math
+import time
+import threading
+from collections import OrderedDict, deque
+
+
+FINAL_CALL_STATUSES = ("completed", "busy", "no-answer", "failed", "canceled")
+
+PREDICTIVE_SETTINGS = {
+    # Abandoned calls (a human answered but the agent was busy) / human-answered calls
+    "abandon_rate_ceiling": float(os.getenv("PREDICTIVE_ABANDON_RATE_CEILING", 0.03)),
+    "max_lines_per_agent": float(os.getenv("PREDICTIVE_MAX_LINES_PER_AGENT", 3)),
+    # Below this many outcomes the pacer dials one line per agent
+    "min_samples": int(os.getenv("PREDICTIVE_MIN_SAMPLES", 20)),
+}
+
+
+class DialingStats:
+    """Rolling outbound-call statistics fed by status callbacks and AMD results.
+
+    Keeps the last `window` call outcomes (human / machine / no-answer /
+    abandoned), ring times and handle times, all in O(1) per event.
+    """
+
+    def __init__(self, window=None, max_tracked_calls=10000):
+        self.window = window or int(os.getenv("PREDICTIVE_STATS_WINDOW", 200))
+        self._outcomes = deque(maxlen=self.window)
+        self._ring_times = deque(maxlen=self.window)
+        self._handle_times = deque(maxlen=self.window)
+        # call_sid -> {"placed_at", "answered_at", "outcome"}, oldest evicted first
+        self._calls = OrderedDict()
+        self._max_tracked_calls = max_tracked_calls
+        self._lock = threading.Lock()
+
+    def _call(self, call_sid):
+        call = self._calls.get(call_sid)
+        if call is None:
+            call = self._calls[call_sid] = {"placed_at": None, "answered_at": None, "outcome": None}
+            while len(self._calls) > self._max_tracked_calls:
+                self._calls.popitem(last=False)
+        return call
+
+    def record_placed(self, call_sid):
+        with self._lock:
+            self._call(call_sid)["placed_at"] = time.time()
+
+    def record_amd(self, call_sid, answered_by, abandoned=False):
+        """AnsweredBy from Twilio AMD: human, machine_*, fax or unknown"""
+        if answered_by == "human":
+            outcome = "abandoned" if abandoned else "human"
+        elif answered_by and answered_by.startswith("machine"):
+            outcome = "machine"
+        else:
+            outcome = "no_answer"
+        with self._lock:
+            call = self._call(call_sid)
+            if call["outcome"] is None:
+                call["outcome"] = outcome
+                self._outcomes.append(outcome)
+
+    def record_status(self, call_sid, status, duration=None):
+        with self._lock:
+            call = self._call(call_sid)
+            if status == "in-progress" and call["answered_at"] is None:
+                call["answered_at"] = time.time()
+                if call["placed_at"] is not None:
+                    self._ring_times.append(call["answered_at"] - call["placed_at"])
+            elif status in FINAL_CALL_STATUSES:
+                if call["outcome"] is None:
+                    # Never reached AMD: busy, unanswered, failed or answered without detection
+                    call["outcome"] = "human" if status == "completed" and call["answered_at"] else "no_answer"
+                    self._outcomes.append(call["outcome"])
+                if call["outcome"] == "human" and status == "completed":
+                    if duration is not None:
+                        self._handle_times.append(float(duration))
+                    elif call["answered_at"] is not None:
+                        self._handle_times.append(time.time() - call["answered_at"])
+                self._calls.pop(call_sid, None)
+
+    def snapshot(self):
+        with self._lock:
+            outcomes = list(self._outcomes)
+            ring_times = list(self._ring_times)
+            handle_times = list(self._handle_times)
+        total = len(outcomes)
+        humans = outcomes.count("human")
+        abandoned = outcomes.count("abandoned")
+        answered = humans + abandoned
+        return {
+            "samples": total,
+            "answer_rate": answered / total if total else None,
+            "machine_rate": outcomes.count("machine") / total if total else None,
+            "abandon_rate": abandoned / answered if answered else 0.0,
+            "average_ring_seconds": sum(ring_times) / len(ring_times) if ring_times else None,
+            "average_handle_seconds": sum(handle_times) / len(handle_times) if handle_times else None,
+        }
+
+
+def lines_per_agent(stats, settings):
+    """How many lines to dial per available agent for the given stats snapshot"""
+    if stats["samples"] < settings["min_samples"] or not stats["answer_rate"]:
+        return 1.0
+    lines = min(settings["max_lines_per_agent"], 1 / stats["answer_rate"])
+    ceiling = settings["abandon_rate_ceiling"]
+    if stats["abandon_rate"] > ceiling:
+        # Over the ceiling: back off in proportion to the overshoot
+        lines *= ceiling / stats["abandon_rate"]
+    return max(1.0, lines)
+
+
+def predictive_target(stats, available_agents, busy_agents, settings):
+    """Number of live calls a predictive campaign should keep up for its agents.
+
+    Busy agents count in part when their calls are expected to end within one
+    ring time, i.e. before a newly dialed customer would answer.
+    """
+    effective_agents = available_agents
+    ring, handle = stats["average_ring_seconds"], stats["average_handle_seconds"]
+    if busy_agents and ring and handle:
+        effective_agents += busy_agents * min(1.0, ring / handle)
+    return math.floor(effective_agents * lines_per_agent(stats, settings))
@@ -0,0 +1,176 @@
+import os
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from database.lead_database import db, PhoneCall, CallRating, log_call_changes
+from metrics import GEMINI_REQUEST_SECONDS, GEMINI_ERRORS
+from dotenv import load_dotenv
+
+load_dotenv()
+
+RATING_PROMPT = (
+    "You are a call quality analyzer. Analyze the following customer call transcript "
+    "and return a numeric rating from 1 to 10, where 10 is excellent, 1 is terrible. "
+    "Only return the number.\n\n"
+    "Transcript:\n{transcript}"
+)
+
+
+class GeminiModelClient:
+    """Rates prompts with Gemini; google-genai is only imported when this client is built"""
+
+    def __init__(self, api_key=None, model=None, timeout=None):
+        from google import genai
+        from google.genai import types
+        self.types = types
+        self.model = model or os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+        timeout = timeout or float(os.getenv("RATING_TIMEOUT_SECONDS", 30))
+        self.client = genai.Client(api_key=api_key or os.getenv('GEMINI_API'),
+                                   http_options=types.HttpOptions(timeout=int(timeout * 1000)))
+
+    def generate(self, prompt):
+        contents = [self.types.Content(role="user", parts=[self.types.Part(text=prompt)])]
+        response = self.client.models.generate_content(model=self.model, contents=contents)
+        return response.candidates[0].content.parts[0].text.strip()
+
+
+class StubModelClient:
+    """Offline stand-in: a stable rating derived from the prompt, optionally after a delay"""
+
+    model = "stub"
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+
+    def generate(self, prompt):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        return str(int(hashlib.sha256(prompt.encode()).hexdigest(), 16) % 10 + 1)
+
+
+def create_model_client():
+    """Model client selected by GEMINI_MODEL_CLIENT: gemini (default) or stub"""
+    if os.getenv("GEMINI_MODEL_CLIENT", "gemini").lower() == "stub":
+        return StubModelClient(delay=float(os.getenv("GEMINI_STUB_DELAY_SECONDS", 0)))
+    return GeminiModelClient()
+
+
+def transcript_hash(transcript):
+    return hashlib.sha256(transcript.encode()).hexdigest()
+
+
+def parse_rating(text):
+    """Model answer -> 1-10, or 0 when it is not a number"""
+    try:
+        return max(1, min(10, int(text)))
+    except (TypeError, ValueError):
+        return 0
+
+
+class RatingService:
+    """Call-quality ratings, cached by transcript hash in the `call_ratings` table.
+
+    Distinct uncached transcripts are rated concurrently (at most
+    RATING_CONCURRENCY model calls at once); identical transcripts, within a
+    batch or across concurrent requests, share one model call.
+    """
+
+    def __init__(self, app, model_client=None, max_concurrency=None, timeout=None):
+        self.app = app
+        self._model_client = model_client
+        self._client_lock = threading.Lock()
+        self.timeout = timeout or float(os.getenv("RATING_TIMEOUT_SECONDS", 30))
+        max_concurrency = max_concurrency or int(os.getenv("RATING_CONCURRENCY", 8))
+        self._pool = ThreadPoolExecutor(max_concurrency, thread_name_prefix="rating")
+        self._inflight = {}  # transcript hash -> Future
+        self._lock = threading.Lock()
+
+    @property
+    def model_client(self):
+        if self._model_client is None:
+            with self._client_lock:
+                if self._model_client is None:
+                    self._model_client = create_model_client()
+        return self._model_client
+
+    def _rate_uncached(self, digest, transcript):
+        try:
+            with GEMINI_REQUEST_SECONDS.time():
+                answer = self.model_client.generate(RATING_PROMPT.format(transcript=transcript))
+        except Exception:
+            GEMINI_ERRORS.inc()
+            raise
+        rating = parse_rating(answer)
+        with self.app.app_context():
+            db.session.merge(CallRating(transcript_hash=digest, rating=rating,
+                                        model=getattr(self.model_client, "model", None)))
+            db.session.commit()
+        return rating
+
+    def _submit(self, digest, transcript):
+        with self._lock:
+            future = self._inflight.get(digest)
+            if future is None:
+                future = self._inflight[digest] = self._pool.submit(self._rate_uncached, digest, transcript)
+                future.add_done_callback(lambda _, d=digest: self._forget(d))
+        return future
+
+    def _forget(self, digest):
+        with self._lock:
+            self._inflight.pop(digest, None)
+
+    def rate_many(self, items):
+        """Rate [{"transcript", "call_id"?, "call_sid"?}, ...]; one result per item, in order.
+
+        Ratings are copied onto the matching PhoneCall rows. Model failures and
+        timeouts come back as rating None with an error and are not cached.
+        """
+        digests = [transcript_hash(item["transcript"]) for item in items]
+        unique = list(dict.fromkeys(digests))
+        cached = {row.transcript_hash: row.rating for row in
+                  CallRating.query.filter(CallRating.transcript_hash.in_(unique))} if unique else {}
+
+        transcripts = dict(zip(digests, (item["transcript"] for item in items)))
+        futures = {d: self._submit(d, transcripts[d]) for d in unique if d not in cached}
+        if futures:
+            wait(futures.values(), timeout=self.timeout)
+
+        outcomes = {d: {"rating": rating, "cached": True} for d, rating in cached.items()}
+        for digest, future in futures.items():
+            if not future.done():
+                outcomes[digest] = {"rating": None, "cached": False, "error": "timed out"}
+            elif future.exception() is not None:
+                outcomes[digest] = {"rating": None, "cached": False, "error": str(future.exception())}
+            else:
+                outcomes[digest] = {"rating": future.result(), "cached": False}
+
+        results = [{"transcript_hash": digest, **outcomes[digest]} for digest in digests]
+        self._store_on_calls(items, results)
+        return results
+
+    def _store_on_calls(self, items, results):
+        by_id, by_sid = {}, {}
+        for item, result in zip(items, results):
+            if result["rating"] is None:
+                continue
+            if item.get("call_id") is not None:
+                by_id[int(item["call_id"])] = result["rating"]
+            elif item.get("call_sid"):
+                by_sid[item["call_sid"]] = result["rating"]
+        if not by_id and not by_sid:
+            return
+        calls = []
+        if by_id:
+            calls += PhoneCall.query.filter(PhoneCall.id.in_(list(by_id))).all()
+        if by_sid:
+            calls += PhoneCall.query.filter(PhoneCall.call_sid.in_(list(by_sid))).all()
+        for call in calls:
+            call.rating = by_id.get(call.id, by_sid.get(call.call_sid))
+        log_call_changes(call.id for call in calls)
+        db.session.commit()
+
+    def rate(self, transcript, call_id=None, call_sid=None):
+        return self.rate_many([{"transcript": transcript, "call_id": call_id, "call_sid": call_sid}])[0]
@@ -0,0 +1,368 @@
+import os
+import json
+from flask import Blueprint, request, jsonify, Response, render_template, abort, send_from_directory
+from campaign import DEFAULT_SETTINGS
+from voicemail_audio import VOICE_FOLDER
+from webhooks import WebhookError
+from services import services
+from metrics import REGISTRY, CONTENT_TYPE
+from database.lead_database import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+# Every route of the softphone app; the services they use are built on first use (see services.py)
+main_bp = Blueprint("main", __name__)
+
+MAX_RATING_BATCH = int(os.getenv("RATING_MAX_BATCH", 1000))
+MAX_VOICEMAIL_BATCH = int(os.getenv("VOICEMAIL_MAX_BATCH", 500))
+# Voicemail recordings never change under the same name; clients revalidate via ETag
+VOICEMAIL_CACHE_SECONDS = int(os.getenv("VOICEMAIL_CACHE_SECONDS", 30 * 24 * 3600))
+AGENT_STATUSES = ("available", "offline", "disabled")
+MAX_LEADS_PER_REQUEST = 1000
+
+@main_bp.route("/token", methods=["GET"])
+def get_token_route():
+    identity = request.values.get('agent_id')
+    if identity:
+        # A softphone coming online makes its agent routable
+        services.dialer.agent_online(identity)
+    token = services.token_service.get(identity)
+    if token is None:
+        return jsonify({"error": "Agent is disabled"}), 403
+    return jsonify(token=token)
+
+@main_bp.route("/make_call", methods=["POST"])
+def make_call_route():
+    data = request.get_json(force=True)
+    agent_id = data.get("agent_id")
+    customer_number = data.get("to")
+    if not agent_id or not customer_number:
+        abort(400, description="Missing 'agent_id' or 'to' in JSON body")
+    return services.dialer.make_call_from_agent(agent_id, customer_number, "")
+
+@main_bp.route("/api/campaigns", methods=["POST"])
+def create_campaign():
+    data = request.get_json(silent=True) or {}
+    leads, skipped = data.get("leads"), 0
+    if isinstance(leads, list):
+        # Do-not-call and recently dialed numbers are dropped before dialing
+        allowed = [lead for lead in leads if not services.lead_queue.is_blocked(_lead_number(lead))]
+        leads, skipped = allowed, len(leads) - len(allowed)
+        if not leads:
+            return jsonify({"error": "All leads are on the do-not-call list or were dialed recently",
+                            "skipped_leads": skipped}), 400
+    elif data.get("lead_count") and data.get("agent_ids"):
+        # Take the best leads from the lead queue
+        try:
+            count = min(int(data["lead_count"]), MAX_LEADS_PER_REQUEST)
+        except (TypeError, ValueError):
+            return jsonify({"error": "'lead_count' must be an integer"}), 400
+        try:
+            # Check the campaign before claiming: claimed leads stay locked for the redial cooldown
+            services.campaign_manager.validate(data["agent_ids"], data.get("settings"),
+                                               data.get("mode", "progressive"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        leads = [{"to": lead["phone_number"], "lead_id": lead["id"]} for lead in services.lead_queue.next(count)]
+        if not leads:
+            return jsonify({"error": "No callable leads in the queue"}), 400
+    try:
+        campaign = services.campaign_manager.create(
+            leads=leads,
+            agent_ids=data.get("agent_ids"),
+            caller_ids=data.get("caller_ids"),
+            voicemail_audio_url=data.get("voicemail_audio_url", ""),
+            settings=data.get("settings"),
+            mode=data.get("mode", "progressive"),
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    services.lead_queue.mark_dialed(_lead_number(lead) for lead in leads)
+    body = campaign.progress()
+    body["skipped_leads"] = skipped
+    return jsonify(body), 201
+
+def _lead_number(lead):
+    return lead.get("to") if isinstance(lead, dict) else lead
+
+@main_bp.route("/api/leads/import", methods=["POST"])
+def import_leads():
+    """CSV upload (multipart 'file' or a text/csv body) with a phone column and optional name, priority, dnc"""
+    upload = request.files.get("file")
+    try:
+        summary = services.lead_queue.import_csv(upload.stream if upload else request.stream)
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(summary), 201 if summary["imported"] else 200
+
+@main_bp.route("/api/leads/next", methods=["POST"])
+def next_leads():
+    """Claim the next leads to dial, highest priority first"""
+    data = request.get_json(silent=True) or {}
+    try:
+        count = min(max(int(data.get("count") or request.args.get("count") or 1), 1), MAX_LEADS_PER_REQUEST)
+    except ValueError:
+        return jsonify({"error": "'count' must be an integer"}), 400
+    return jsonify({"leads": services.lead_queue.next(count)})
+
+@main_bp.route("/api/leads/dnc", methods=["POST"])
+def add_do_not_call():
+    numbers = (request.get_json(silent=True) or {}).get("numbers")
+    if not isinstance(numbers, list) or not numbers:
+        return jsonify({"error": "'numbers' must be a non-empty list"}), 400
+    added, invalid = services.lead_queue.add_dnc(numbers)
+    return jsonify({"added": added, "invalid": invalid})
+
+@main_bp.route("/api/leads/stats", methods=["GET"])
+def lead_stats():
+    return jsonify(services.lead_queue.stats())
+
+# Live call queue: a snapshot of the newest calls, then every change as it is logged.
+# Reconnecting clients send Last-Event-ID and only get what they missed
+@main_bp.route("/api/calls/stream", methods=["GET"])
+def stream_calls():
+    try:
+        limit = min(max(int(request.args.get("limit", DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"error": "'limit' must be an integer"}), 400
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    return Response(services.change_feed.stream(limit, last_event_id), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@main_bp.route("/api/campaigns", methods=["GET"])
+def list_campaigns():
+    return jsonify(services.campaign_manager.list())
+
+@main_bp.route("/api/campaigns/<campaign_id>", methods=["GET"])
+def get_campaign(campaign_id):
+    campaign = services.campaign_manager.get(campaign_id)
+    if not campaign:
+        return jsonify({"error": "Unknown campaign"}), 404
+    return jsonify(campaign.progress(include_results=bool(request.args.get("results"))))
+
+@main_bp.route("/api/campaigns/<campaign_id>/stop", methods=["POST"])
+def stop_campaign(campaign_id):
+    campaign = services.campaign_manager.get(campaign_id)
+    if not campaign:
+        return jsonify({"error": "Unknown campaign"}), 404
+    campaign.stop()
+    return jsonify(campaign.progress())
+
+def _twilio_webhook(name):
+    """Answer a voice webhook with its TwiML; its REST calls run once the response is sent"""
+    try:
+        twiml, tasks = services.webhook_handlers.handle(name, request.values)
+    except WebhookError as e:
+        abort(e.status, description=str(e))
+    response = Response(twiml, mimetype="text/xml")
+    if tasks:
+        handlers = services.webhook_handlers
+        response.call_on_close(lambda: handlers.run_background(tasks))
+    return response
+
+@main_bp.route("/voice", methods=["POST", "GET"])
+def voice_webhook():
+    return _twilio_webhook("voice")
+
+@main_bp.route("/join", methods=["POST", "GET"])
+def join_webhook():
+    return _twilio_webhook("join")
+
+def _transcription_job_response(job, status_code=202):
+    body = job.to_dict()
+    body["poll_url"] = f"/api/transcription_jobs/{job.id}"
+    body["result_url"] = f"/api/transcription_jobs/{job.id}/result"
+    return jsonify(body), status_code
+
+@main_bp.route("/get_transcript/<call_sid>")
+def get_recording_sid(call_sid):
+    # Calls whose every recording was transcribed are answered straight from the transcript cache
+    if not request.args.get("refresh"):
+        cached = services.transcript_cache.get_complete_call(call_sid)
+        if cached:
+            return jsonify({"call_sid": call_sid, "recordings": cached, "cached": True})
+    # Otherwise transcription runs in the background (cached recordings are reused, not
+    # downloaded again); poll the returned job for the result
+    return _transcription_job_response(services.transcription_queue.submit(call_sid))
+
+@main_bp.route("/api/transcript_cache/stats", methods=["GET"])
+def transcript_cache_stats():
+    return jsonify(services.transcript_cache.stats())
+
+@main_bp.route("/api/transcription_jobs", methods=["POST"])
+def submit_transcription_job():
+    data = request.get_json(silent=True) or {}
+    call_sid = data.get("call_sid")
+    if not call_sid:
+        return jsonify({"error": "call_sid is required"}), 400
+    return _transcription_job_response(services.transcription_queue.submit(call_sid))
+
+@main_bp.route("/api/transcription_jobs/<job_id>", methods=["GET"])
+def get_transcription_job(job_id):
+    job = services.transcription_queue.get(job_id)
+    if not job:
+        return jsonify({"error": "Unknown job"}), 404
+    return _transcription_job_response(job, 200)
+
+@main_bp.route("/api/transcription_jobs/<job_id>/result", methods=["GET"])
+def get_transcription_job_result(job_id):
+    job = services.transcription_queue.get(job_id)
+    if not job:
+        return jsonify({"error": "Unknown job"}), 404
+    if job.status == "failed":
+        return jsonify({"error": job.error, "job_id": job.id}), 500
+    if job.status != "completed":
+        return _transcription_job_response(job)
+    recordings = json.loads(job.result or "[]")
+    if not recordings:
+        return jsonify({"error": "No recordings found"}), 404
+    return jsonify({"call_sid": job.call_sid, "recordings": recordings})
+
+@main_bp.route('/')
+def show_ui():
+    return render_template('index.html')
+
+@main_bp.route('/incoming_call', methods=['POST'])
+def handle_incoming_call():
+    return _twilio_webhook("incoming_call")
+
+def _require_private_key():
+    auth_header = request.headers.get('X-Private-Key')
+    if auth_header != services.dialer.private_key:
+        abort(403, description="Unauthorized access")
+
+@main_bp.route("/private/agent_status/<agent_id>", methods=["GET"])
+def get_agent_status_route(agent_id):
+    _require_private_key()
+    return jsonify(services.dialer.get_agent_status(agent_id))
+
+@main_bp.route("/private/agent_status/<agent_id>", methods=["POST"])
+def set_agent_status_route(agent_id):
+    _require_private_key()
+    status = (request.get_json(silent=True) or {}).get("status")
+    if status not in AGENT_STATUSES:
+        return jsonify({"error": f"'status' must be one of {', '.join(AGENT_STATUSES)}"}), 400
+    result = services.dialer.set_agent_status(agent_id, status)
+    if isinstance(result, tuple):
+        return jsonify(result[0]), result[1]
+    if status == "disabled":
+        # Its softphone can no longer fetch or be handed a cached token
+        services.token_service.invalidate(agent_id)
+    return jsonify(result)
+
+@main_bp.route("/private/token_stats", methods=["GET"])
+def token_stats_route():
+    _require_private_key()
+    return jsonify(services.token_service.stats())
+
+@main_bp.route("/handle_machine_detection", methods=["POST"])
+def handle_machine_detection_webhook():
+    return _twilio_webhook("machine_detection")
+    
+@main_bp.route("/call_status", methods=["POST"])
+def call_status_webhook():
+    # Acknowledge right away; rows, agents and campaign stats are updated by the background writer
+    services.status_writer.enqueue(request.values)
+    return ("", 204)
+
+@main_bp.route("/api/dialing_stats", methods=["GET"])
+def dialing_stats():
+    return jsonify(services.campaign_manager.stats.snapshot())
+
+@main_bp.route("/api/send_voicemail", methods=["POST"])
+def send_voicemail():
+    data = request.get_json()
+    to_number = data.get("to")
+    voicemail_key = data.get("voicemail")
+    return services.dialer.drop_voice_mail(to_number,voicemail_key)
+
+@main_bp.route("/api/send_voicemail/batch", methods=["POST"])
+def send_voicemail_batch():
+    """Drop one voicemail on many numbers: {"numbers": [...], "voicemail": "male", "caller_id"?}"""
+    data = request.get_json(silent=True) or {}
+    numbers = data.get("numbers")
+    if not isinstance(numbers, list) or not numbers:
+        return jsonify({"error": "'numbers' must be a non-empty list"}), 400
+    if len(numbers) > MAX_VOICEMAIL_BATCH:
+        return jsonify({"error": f"At most {MAX_VOICEMAIL_BATCH} numbers per batch"}), 400
+    numbers = [str(n).strip() for n in numbers]
+    unique = list(dict.fromkeys(n for n in numbers if n))
+    allowed = [n for n in unique if not services.lead_queue.is_blocked(n)]
+    caller_id = data.get("caller_id") or services.dialer.caller_id
+    # Shares the per-caller-ID call rate with running campaigns
+    bucket = services.campaign_manager.bucket_for(caller_id, DEFAULT_SETTINGS)
+    try:
+        batch_id = services.dialer.drop_voice_mails(allowed, data.get("voicemail"), caller_id=caller_id, bucket=bucket)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    services.lead_queue.mark_dialed(allowed)
+    # Calls go out at the caller ID's call rate; poll the batch for per-number results
+    body = services.dialer.voicemail_batch(batch_id)
+    body["skipped_duplicates"] = len(numbers) - len(unique)
+    body["skipped_blocked"] = len(unique) - len(allowed)
+    body["poll_url"] = f"/api/send_voicemail/batch/{batch_id}"
+    return jsonify(body), 202
+
+@main_bp.route("/api/send_voicemail/batch/<batch_id>", methods=["GET"])
+def get_voicemail_batch(batch_id):
+    batch = services.dialer.voicemail_batch(batch_id)
+    if batch is None:
+        return jsonify({"error": "Unknown batch"}), 404
+    return jsonify(batch)
+
+
+@main_bp.route('/ai_voice/<filename>')
+def serve_voice(filename):
+    # ETag / Last-Modified revalidation and Range requests come from conditional responses
+    response = send_from_directory(VOICE_FOLDER, filename, conditional=True, etag=True,
+                                   max_age=VOICEMAIL_CACHE_SECONDS)
+    response.cache_control.public = True
+    return response
+
+
+def _valid_call_id(call_id):
+    # phone_calls ids; JSON clients send them as numbers or digit strings
+    if isinstance(call_id, str):
+        return call_id.isdigit()
+    return call_id is None or (isinstance(call_id, int) and not isinstance(call_id, bool))
+
+@main_bp.route("/api/gemini_rating", methods=["POST"])
+def gemini_rating():
+    data = request.json
+    transcript = data.get("transcript", "")
+    if not transcript:
+        return jsonify({"rating": None}), 400
+    if not _valid_call_id(data.get("call_id")):
+        return jsonify({"error": "'call_id' must be an integer"}), 400
+
+    result = services.rating_service.rate(transcript, call_id=data.get("call_id"), call_sid=data.get("call_sid"))
+    if result["rating"] is None:
+        print("Error calling Gemini:", result.get("error"))
+        return jsonify({"rating": None}), 500
+    return jsonify({"rating": result["rating"], "cached": result["cached"]})
+
+@main_bp.route("/api/gemini_rating/batch", methods=["POST"])
+def gemini_rating_batch():
+    """Rate many transcripts at once: {"transcripts": ["...", {"transcript", "call_id" | "call_sid"}, ...]}"""
+    data = request.get_json(silent=True) or {}
+    items = data.get("transcripts")
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "'transcripts' must be a non-empty list"}), 400
+    if len(items) > MAX_RATING_BATCH:
+        return jsonify({"error": f"At most {MAX_RATING_BATCH} transcripts per batch"}), 400
+    items = [item if isinstance(item, dict) else {"transcript": item} for item in items]
+    if not all(isinstance(item.get("transcript"), str) and item["transcript"] for item in items):
+        return jsonify({"error": "Every item needs a non-empty 'transcript'"}), 400
+    if not all(_valid_call_id(item.get("call_id")) for item in items):
+        return jsonify({"error": "Every 'call_id' must be an integer"}), 400
+
+    results = services.rating_service.rate_many(items)
+    return jsonify({
+        "results": results,
+        "rated": sum(1 for r in results if r["rating"] is not None and not r["cached"]),
+        "cached": sum(1 for r in results if r["cached"]),
+        "failed": sum(1 for r in results if r["rating"] is None),
+    })
+
+@main_bp.route("/metrics", methods=["GET"])
+def metrics_route():
+    """Prometheus scrape endpoint (this worker's metrics)"""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
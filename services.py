@@ -0,0 +1,136 @@
+import os
+import threading
+from flask import current_app
+from werkzeug.local import LocalProxy
+
+
+class ServiceConfigError(RuntimeError):
+    """A service can't be built from the environment (e.g. a missing Twilio variable)"""
+
+
+class Services:
+    """Per-process singletons: the Twilio, Gemini and STT clients and the workers built on them.
+
+    Nothing is imported, built or started until first use, so creating the
+    app stays cheap and a misconfigured service only fails the routes that
+    need it. A forked worker builds its own instances instead of sharing its
+    parent's connections and threads.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._instances = {}
+        self._lock = threading.RLock()  # builders use other services
+        self._pid = os.getpid()
+
+    def _get(self, name, build):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._instances, self._pid = {}, os.getpid()
+        instance = self._instances.get(name)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(name)
+                if instance is None:
+                    instance = self._instances[name] = build()
+        return instance
+
+    def peek(self, name):
+        """The service if this process has built it already, else None (never builds)"""
+        return self._instances.get(name) if self._pid == os.getpid() else None
+
+    def built(self):
+        """Names of the services built in this process so far"""
+        return sorted(self._instances)
+
+    def warm_up(self):
+        """Build the services every worker needs, resuming their background work"""
+        from voicemail_audio import prepare_voicemail_audio
+        prepare_voicemail_audio()
+        self.lead_queue
+        self.webhook_handlers
+        self.token_service
+        self.transcription_queue
+
+    @property
+    def dialer(self):
+        return self._get("dialer", self._build_dialer)
+
+    def _build_dialer(self):
+        from dialer import DialerEngineDev
+        from database.lead_database import Agent
+        try:
+            dialer = DialerEngineDev()
+        except ValueError as e:
+            raise ServiceConfigError(str(e))
+        with self.app.app_context():
+            # Known agents are routable by responsibility; they go offline until their softphone asks for a token
+            for agent in Agent.query.all():
+                dialer.agents.register(agent.agent_id, agent.agent_id,
+                                       skills=[agent.responsibility] if agent.responsibility else (),
+                                       status="offline")
+        return dialer
+
+    @property
+    def campaign_manager(self):
+        from campaign import CampaignManager
+        return self._get("campaign_manager", lambda: CampaignManager(self.dialer))
+
+    @property
+    def status_writer(self):
+        from status_pipeline import StatusCallbackWriter
+        return self._get("status_writer", lambda: StatusCallbackWriter(self.app, self.dialer, self.campaign_manager))
+
+    @property
+    def webhook_handlers(self):
+        from webhooks import WebhookHandlers
+        return self._get("webhook_handlers", lambda: WebhookHandlers(self.dialer, self.campaign_manager))
+
+    @property
+    def token_service(self):
+        from token_service import TokenService
+        return self._get("token_service", lambda: TokenService(
+            self.dialer.sign_token,
+            is_allowed=lambda identity: self.dialer.agents.status(identity) != "disabled"))
+
+    @property
+    def lead_queue(self):
+        return self._get("lead_queue", self._build_lead_queue)
+
+    def _build_lead_queue(self):
+        from lead_queue import LeadQueue
+        lead_queue = LeadQueue(self.app)
+        with self.app.app_context():
+            lead_queue.rebuild()
+        return lead_queue
+
+    @property
+    def change_feed(self):
+        from change_feed import ChangeFeed
+        return self._get("change_feed", lambda: ChangeFeed(self.app))
+
+    @property
+    def transcript_cache(self):
+        from transcript_cache import TranscriptCache
+        return self._get("transcript_cache", lambda: TranscriptCache(self.app))
+
+    @property
+    def rating_service(self):
+        from rating_service import RatingService
+        return self._get("rating_service", lambda: RatingService(self.app))
+
+    @property
+    def transcription_queue(self):
+        return self._get("transcription_queue", self._build_transcription_queue)
+
+    def _build_transcription_queue(self):
+        from transcription_jobs import TranscriptionQueue
+        queue = TranscriptionQueue(self.app, self.dialer, cache=self.transcript_cache)
+        with self.app.app_context():
+            queue.resume_pending()
+        return queue
+
+
+# The services of the current app, for use in routes
+services = LocalProxy(lambda: current_app.extensions["services"])
@@ -1,48 +1,182 @@
 import os
-import requests
+import wave
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 import speech_recognition as sr
-from twilio.rest import Client
+from twilio_client import get_twilio_client, get_http_session, HTTP_TIMEOUT
+from metrics import STT_SECONDS, STT_ERRORS
 from dotenv import load_dotenv
 
 load_dotenv()
 
+try:
+    import audioop  # removed from the stdlib in Python 3.13, where audioop-lts provides it
+except ImportError:
+    audioop = None
+
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+# Segments are cut at the first silent window after MIN_SEGMENT_SECONDS,
+# and unconditionally at MAX_SEGMENT_SECONDS
+MIN_SEGMENT_SECONDS = float(os.getenv("STT_MIN_SEGMENT_SECONDS", 15))
+MAX_SEGMENT_SECONDS = float(os.getenv("STT_MAX_SEGMENT_SECONDS", 30))
+SILENCE_WINDOW_SECONDS = 0.02
+SILENCE_RMS = int(os.getenv("STT_SILENCE_RMS", 300))
+
+
 class SpeechToTextConverter:
-    def __init__(self):
+    def __init__(self, cache=None, segment_workers=None):
         self.ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID')
         self.AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN')
-        self.client = Client(self.ACCOUNT_SID, self.AUTH_TOKEN)
+        self.client = get_twilio_client()
         self.recognizer = sr.Recognizer()
+        # Optional TranscriptCache; without it every convert() downloads and transcribes
+        self.cache = cache
+        segment_workers = segment_workers or int(os.getenv("STT_SEGMENT_WORKERS", 4))
+        self._segment_pool = ThreadPoolExecutor(segment_workers, thread_name_prefix="stt-segment")
 
     def download_recording(self, recording_sid):
-        output_file = os.path.join(os.path.dirname(__file__), "recordings", f"{recording_sid}_recording.wav")
-        """Download a recording from Twilio by SID"""
+        """Stream a recording from Twilio by SID into a temp file; returns (path, sha256 of the audio)"""
+        try:
+            with STT_SECONDS.time("download"):
+                return self._download_recording(recording_sid)
+        except Exception:
+            STT_ERRORS.inc("download")
+            raise
+
+    def _download_recording(self, recording_sid):
         recording = self.client.recordings(recording_sid).fetch()
         recording_url = f"https://api.twilio.com{recording.uri.replace('.json', '.wav')}"
-        
-        response = requests.get(recording_url, auth=(self.client.username, self.client.password))
-        if response.status_code == 200:
-            with open(output_file, "wb") as f:
-                f.write(response.content)
-            print(f"Recording saved as {output_file}")
-            return output_file
-        else:
-            raise Exception(f"Failed to download recording: {response.text}")
 
-    def transcribe_recording(self, file_path):
-        """Convert recording to text using SpeechRecognition"""
-        with sr.AudioFile(file_path) as source:
-            audio_data = self.recognizer.record(source)
+        digest = hashlib.sha256()
+        session = get_http_session()
+        with session.get(recording_url, auth=(self.client.username, self.client.password),
+                         stream=True, timeout=HTTP_TIMEOUT) as response:
+            if response.status_code != 200:
+                raise Exception(f"Failed to download recording: {response.text}")
+            fd, output_file = tempfile.mkstemp(prefix=f"{recording_sid}_", suffix=".wav")
             try:
-                text = self.recognizer.recognize_google(audio_data)
-                return text
+                with os.fdopen(fd, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
+                        digest.update(chunk)
+                        f.write(chunk)
+            except Exception:
+                os.remove(output_file)
+                raise
+        return output_file, digest.hexdigest()
+
+    @staticmethod
+    def plan_segments(file_path):
+        """Split a WAV file into (start_frame, end_frame) segments, cutting on silence where possible"""
+        with wave.open(file_path, "rb") as wf:
+            rate, width, channels = wf.getframerate(), wf.getsampwidth(), wf.getnchannels()
+            total = wf.getnframes()
+            window = max(int(rate * SILENCE_WINDOW_SECONDS), 1)
+            min_frames, max_frames = int(rate * MIN_SEGMENT_SECONDS), int(rate * MAX_SEGMENT_SECONDS)
+
+            segments, start, position = [], 0, 0
+            while position < total:
+                frames = wf.readframes(window)
+                if not frames:
+                    break
+                position += len(frames) // (width * channels)
+                length = position - start
+                # Without audioop segments are only cut at MAX_SEGMENT_SECONDS
+                silent = audioop is not None and audioop.rms(frames, width) < SILENCE_RMS
+                if length >= max_frames or (length >= min_frames and silent):
+                    segments.append((start, position))
+                    start = position
+            if start < position:
+                segments.append((start, position))
+        return segments
+
+    def _recognize_segment(self, file_path, start, end):
+        """Transcribe frames [start, end) of a WAV file; "" when the segment has no speech"""
+        with wave.open(file_path, "rb") as wf:
+            rate, width, channels = wf.getframerate(), wf.getsampwidth(), wf.getnchannels()
+            wf.setpos(start)
+            frames = wf.readframes(end - start)
+        if channels == 2:
+            frames = audioop.tomono(frames, width, 0.5, 0.5)
+        try:
+            with STT_SECONDS.time("recognize_segment"):
+                return self.recognizer.recognize_google(sr.AudioData(frames, rate, width))
+        except sr.UnknownValueError:
+            return ""
+
+    def _recognize(self, file_path):
+        """Transcribe segments concurrently and stitch them back together in order.
+
+        Returns (text, segments) where segments carry their offsets in seconds.
+        Raises sr.RequestError when the STT service fails.
+        """
+        try:
+            with STT_SECONDS.time("transcribe"):
+                return self._recognize_file(file_path)
+        except sr.RequestError:
+            STT_ERRORS.inc("transcribe")
+            raise
+
+    def _recognize_file(self, file_path):
+        try:
+            with wave.open(file_path, "rb") as wf:
+                rate = wf.getframerate()
+            spans = self.plan_segments(file_path)
+        except (wave.Error, EOFError):
+            # Not plain PCM WAV; let SpeechRecognition read the whole file
+            with sr.AudioFile(file_path) as source:
+                audio_data = self.recognizer.record(source)
+            try:
+                return self.recognizer.recognize_google(audio_data), []
             except sr.UnknownValueError:
-                return "Could not understand audio"
-            except sr.RequestError as e:
-                return f"STT request failed: {e}"
+                return "Could not understand audio", []
 
-    def convert(self, recording_sid):
-        """Download + transcribe in one step"""
-        file_path = self.download_recording(recording_sid)
-        return self.transcribe_recording(file_path)
+        futures = [self._segment_pool.submit(self._recognize_segment, file_path, start, end)
+                   for start, end in spans]
+        segments = [
+            {"start": round(start / rate, 2), "end": round(end / rate, 2), "text": future.result()}
+            for (start, end), future in zip(spans, futures)
+        ]
+        text = " ".join(s["text"] for s in segments if s["text"])
+        return text or "Could not understand audio", segments
+
+    def transcribe_recording(self, file_path):
+        """Convert recording to text using SpeechRecognition"""
+        try:
+            return self._recognize(file_path)[0]
+        except sr.RequestError as e:
+            return f"STT request failed: {e}"
+
+    def convert_detailed(self, recording_sid, call_sid=None, url=None):
+        """Download + transcribe, served from the transcript cache when possible.
+
+        Returns {"transcript": text, "segments": [{"start", "end", "text"}, ...]}.
+        """
+        if self.cache is not None:
+            cached = self.cache.get_by_recording(recording_sid)
+            if cached is not None:
+                return cached
 
+        file_path, audio_hash = self.download_recording(recording_sid)
+        try:
+            cached = self.cache.get_by_hash(audio_hash, after_miss=True) if self.cache is not None else None
+            if cached is not None:
+                result = cached
+            else:
+                try:
+                    text, segments = self._recognize(file_path)
+                except sr.RequestError as e:
+                    # Transient failure, don't cache it
+                    return {"transcript": f"STT request failed: {e}", "segments": []}
+                result = {"transcript": text, "segments": segments}
+        finally:
+            os.remove(file_path)
 
+        if self.cache is not None:
+            self.cache.put(recording_sid, audio_hash, result["transcript"], segments=result["segments"],
+                           call_sid=call_sid, url=url)
+        return result
+
+    def convert(self, recording_sid, call_sid=None, url=None):
+        """Download + transcribe in one step"""
+        return self.convert_detailed(recording_sid, call_sid=call_sid, url=url)["transcript"]
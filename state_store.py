@@ -0,0 +1,317 @@
+import os
+import json
+import time
+import heapq
+import sqlite3
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# How often expired keys are swept by the memory and SQLite stores
+PURGE_INTERVAL_SECONDS = 60
+
+
+class MemoryStateStore:
+    """Per-process store for development and single-worker deployments.
+
+    Two structures, mirrored by every backend:
+      * a namespaced key/value map with optional TTLs
+      * namespaced ranked sets (member -> score) that pop lowest score first
+    """
+
+    def __init__(self):
+        self._values = {}  # namespace -> {key: (value, expires_at)}
+        self._ranked = {}  # namespace -> {member: score}
+        self._heaps = {}  # namespace -> [(score, member)], lazily cleaned
+        self._lock = threading.Lock()
+        self._last_purge = time.time()
+
+    def _live(self, item, now):
+        return item is not None and (item[1] is None or item[1] > now)
+
+    def _maybe_purge(self, now):
+        if now - self._last_purge >= PURGE_INTERVAL_SECONDS:
+            self._last_purge = now
+            for values in self._values.values():
+                for key in [k for k, (_, exp) in values.items() if exp is not None and exp <= now]:
+                    del values[key]
+
+    def get(self, namespace, key):
+        now = time.time()
+        with self._lock:
+            item = self._values.get(namespace, {}).get(key)
+            return item[0] if self._live(item, now) else None
+
+    def set(self, namespace, key, value, ttl=None):
+        now = time.time()
+        with self._lock:
+            self._values.setdefault(namespace, {})[key] = (value, now + ttl if ttl else None)
+            self._maybe_purge(now)
+
+    def add(self, namespace, key, value, ttl=None):
+        """Set only if absent (or expired); returns True if set"""
+        now = time.time()
+        with self._lock:
+            values = self._values.setdefault(namespace, {})
+            if self._live(values.get(key), now):
+                return False
+            values[key] = (value, now + ttl if ttl else None)
+            return True
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._values.get(namespace, {}).pop(key, None)
+
+    def expire(self, namespace, key, ttl):
+        now = time.time()
+        with self._lock:
+            values = self._values.get(namespace, {})
+            item = values.get(key)
+            if self._live(item, now):
+                values[key] = (item[0], now + ttl)
+
+    def count(self, namespace):
+        now = time.time()
+        with self._lock:
+            return sum(1 for item in self._values.get(namespace, {}).values() if self._live(item, now))
+
+    def rank_add(self, namespace, member, score):
+        with self._lock:
+            members = self._ranked.setdefault(namespace, {})
+            members[member] = score
+            heap = self._heaps.setdefault(namespace, [])
+            heapq.heappush(heap, (score, member))
+            if len(heap) > 2 * len(members) + 64:
+                # Drop stale entries left behind by rank_remove / re-adds
+                heap[:] = [(sc, m) for m, sc in members.items()]
+                heapq.heapify(heap)
+
+    def rank_remove(self, namespace, member):
+        """Returns True if the member was present (and this caller removed it)"""
+        with self._lock:
+            return self._ranked.get(namespace, {}).pop(member, None) is not None
+
+    def rank_pop(self, namespace):
+        """Remove and return the lowest-score member, or None"""
+        with self._lock:
+            members, heap = self._ranked.get(namespace, {}), self._heaps.get(namespace, [])
+            while heap:
+                score, member = heapq.heappop(heap)
+                # Skip entries that were removed or re-added with another score
+                if members.get(member) == score:
+                    del members[member]
+                    return member
+            return None
+
+    def rank_first(self, namespace):
+        """Lowest-score member without removing it, or None"""
+        with self._lock:
+            members, heap = self._ranked.get(namespace, {}), self._heaps.get(namespace, [])
+            while heap and members.get(heap[0][1]) != heap[0][0]:
+                heapq.heappop(heap)
+            return heap[0][1] if heap else None
+
+    def rank_score(self, namespace, member):
+        with self._lock:
+            return self._ranked.get(namespace, {}).get(member)
+
+    def rank_count(self, namespace):
+        with self._lock:
+            return len(self._ranked.get(namespace, {}))
+
+
+class SQLiteStateStore:
+    """Store shared by all processes on one host, in a WAL-mode SQLite file"""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        self._last_purge = 0
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS kv (ns TEXT, key TEXT, value TEXT, expires_at REAL, "
+                         "PRIMARY KEY (ns, key))")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_kv_expires_at ON kv (expires_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS ranked (ns TEXT, member TEXT, score REAL, "
+                         "PRIMARY KEY (ns, member))")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_ranked_ns_score ON ranked (ns, score)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _maybe_purge(self, conn, now):
+        if now - self._last_purge >= PURGE_INTERVAL_SECONDS:
+            self._last_purge = now
+            conn.execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+
+    def get(self, namespace, key):
+        row = self._conn().execute(
+            "SELECT value FROM kv WHERE ns = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, key, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, namespace, key, value, ttl=None):
+        now = time.time()
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO kv (ns, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                     (namespace, key, json.dumps(value), now + ttl if ttl else None))
+        self._maybe_purge(conn, now)
+
+    def add(self, namespace, key, value, ttl=None):
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM kv WHERE ns = ? AND key = ? AND expires_at <= ?", (namespace, key, now))
+            cursor = conn.execute("INSERT OR IGNORE INTO kv (ns, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                                  (namespace, key, json.dumps(value), now + ttl if ttl else None))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cursor.rowcount == 1
+
+    def delete(self, namespace, key):
+        self._conn().execute("DELETE FROM kv WHERE ns = ? AND key = ?", (namespace, key))
+
+    def expire(self, namespace, key, ttl):
+        self._conn().execute("UPDATE kv SET expires_at = ? WHERE ns = ? AND key = ?",
+                             (time.time() + ttl, namespace, key))
+
+    def count(self, namespace):
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM kv WHERE ns = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, time.time())).fetchone()[0]
+
+    def rank_add(self, namespace, member, score):
+        self._conn().execute("INSERT OR REPLACE INTO ranked (ns, member, score) VALUES (?, ?, ?)",
+                             (namespace, member, score))
+
+    def rank_remove(self, namespace, member):
+        cursor = self._conn().execute("DELETE FROM ranked WHERE ns = ? AND member = ?", (namespace, member))
+        return cursor.rowcount == 1
+
+    def rank_pop(self, namespace):
+        # RETURNING makes select + delete one atomic statement across processes
+        row = self._conn().execute(
+            "DELETE FROM ranked WHERE rowid = (SELECT rowid FROM ranked WHERE ns = ? ORDER BY score LIMIT 1) "
+            "RETURNING member", (namespace,)).fetchone()
+        return row[0] if row else None
+
+    def rank_first(self, namespace):
+        row = self._conn().execute("SELECT member FROM ranked WHERE ns = ? ORDER BY score LIMIT 1",
+                                   (namespace,)).fetchone()
+        return row[0] if row else None
+
+    def rank_score(self, namespace, member):
+        row = self._conn().execute("SELECT score FROM ranked WHERE ns = ? AND member = ?",
+                                   (namespace, member)).fetchone()
+        return row[0] if row else None
+
+    def rank_count(self, namespace):
+        return self._conn().execute("SELECT COUNT(*) FROM ranked WHERE ns = ?", (namespace,)).fetchone()[0]
+
+
+class RedisStateStore:
+    """Store shared across nodes. `client` is anything speaking the redis-py API
+    (redis.Redis, or a local stand-in such as fakeredis.FakeRedis).
+
+    Each namespace also keeps a sorted set of its keys scored by expiry time,
+    so count() is a ZCOUNT rather than a SCAN over the whole keyspace.
+    """
+
+    def __init__(self, client, prefix="dialer:"):
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, namespace, key):
+        return f"{self.prefix}{namespace}:{key}"
+
+    def _ranked_key(self, namespace):
+        return f"{self.prefix}ranked:{namespace}"
+
+    def _index_key(self, namespace):
+        return f"{self.prefix}keys:{namespace}"
+
+    def _expiry(self, ttl):
+        return time.time() + ttl if ttl else float("inf")
+
+    def get(self, namespace, key):
+        raw = self.client.get(self._key(namespace, key))
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, namespace, key, value, ttl=None):
+        pipe = self.client.pipeline()
+        pipe.set(self._key(namespace, key), json.dumps(value), px=int(ttl * 1000) if ttl else None)
+        pipe.zadd(self._index_key(namespace), {key: self._expiry(ttl)})
+        pipe.execute()
+
+    def add(self, namespace, key, value, ttl=None):
+        added = bool(self.client.set(self._key(namespace, key), json.dumps(value), nx=True,
+                                     px=int(ttl * 1000) if ttl else None))
+        if added:
+            self.client.zadd(self._index_key(namespace), {key: self._expiry(ttl)})
+        return added
+
+    def delete(self, namespace, key):
+        pipe = self.client.pipeline()
+        pipe.delete(self._key(namespace, key))
+        pipe.zrem(self._index_key(namespace), key)
+        pipe.execute()
+
+    def expire(self, namespace, key, ttl):
+        if self.client.pexpire(self._key(namespace, key), max(int(ttl * 1000), 1)):
+            self.client.zadd(self._index_key(namespace), {key: self._expiry(ttl)}, xx=True)
+
+    def count(self, namespace):
+        now = time.time()
+        pipe = self.client.pipeline()
+        # Drop keys Redis has already expired, then count the live ones
+        pipe.zremrangebyscore(self._index_key(namespace), "-inf", now)
+        pipe.zcard(self._index_key(namespace))
+        return pipe.execute()[1]
+
+    def rank_add(self, namespace, member, score):
+        self.client.zadd(self._ranked_key(namespace), {member: score})
+
+    def rank_remove(self, namespace, member):
+        return self.client.zrem(self._ranked_key(namespace), member) == 1
+
+    def rank_pop(self, namespace):
+        popped = self.client.zpopmin(self._ranked_key(namespace))
+        if not popped:
+            return None
+        member = popped[0][0]
+        return member.decode() if isinstance(member, bytes) else member
+
+    def rank_first(self, namespace):
+        first = self.client.zrange(self._ranked_key(namespace), 0, 0)
+        if not first:
+            return None
+        return first[0].decode() if isinstance(first[0], bytes) else first[0]
+
+    def rank_score(self, namespace, member):
+        return self.client.zscore(self._ranked_key(namespace), member)
+
+    def rank_count(self, namespace):
+        return self.client.zcard(self._ranked_key(namespace))
+
+
+def create_state_store(backend=None):
+    """Build the store selected by STATE_BACKEND: memory (default), sqlite or redis"""
+    backend = (backend or os.getenv("STATE_BACKEND", "memory")).lower()
+    if backend == "memory":
+        return MemoryStateStore()
+    if backend == "sqlite":
+        return SQLiteStateStore(os.getenv("STATE_SQLITE_PATH",
+                                          os.path.join(os.path.dirname(__file__), "instance", "state.db")))
+    if backend == "redis":
+        import redis  # optional dependency, only needed for this backend
+        return RedisStateStore(redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0")))
+    raise ValueError(f"Unknown STATE_BACKEND: {backend}")
@@ -161,68 +161,149 @@ function handleDrop(e) {
 }
 
 // --- API Functions ---
-async function fetchAndRenderCallQueue() {
-    try {
-        const response = await fetch('/api/calls');
-        if (!response.ok) {
-            throw new Error(`HTTP error! status: ${response.status}`);
+// The queue is kept in memory (call id -> call) and updated from the live feed;
+// the server only sends what changed, however many dashboards are open
+const QUEUE_SIZE = 100;
+const QUEUE_POLL_INTERVAL = 30000;
+const QUEUE_RECONNECT_GRACE = 10000;
+const queueCalls = new Map();
+let queueEtag = null;
+let queuePollTimer = null;
+let queueReconnectTimer = null;
+
+function applyQueueCalls(calls, replace = false) {
+    if (replace) {
+        queueCalls.clear();
+    }
+    calls.forEach(call => queueCalls.set(call.id, call));
+    renderCallQueue();
+}
+
+function latestCallFor(phoneNumber) {
+    let latest = null;
+    queueCalls.forEach(call => {
+        if (call.caller_number === phoneNumber && (!latest || call.call_timestamp > latest.call_timestamp ||
+            (call.call_timestamp === latest.call_timestamp && call.id > latest.id))) {
+            latest = call;
         }
-        const calls = await response.json();
-
-        callQueueTableBody.innerHTML = '';
-
-        if (calls.length > 0) {
-            noCallsMessage.style.display = 'none';
-
-            calls.forEach((call, index) => {
-                const row = document.createElement('tr');
-                row.classList.add('draggable-row');
-                row.setAttribute('draggable', 'true');
-                row.dataset.phoneNumber = call.caller_number;
-
-                const priority = index < 3 ? 'High' : index < 7 ? 'Medium' : 'Low';
-                const priorityClass = priority === 'High' ? 'badge-danger' :
-                    priority === 'Medium' ? 'badge-warning' : 'badge-secondary';
-
-                row.innerHTML = `
-                    <td class="font-mono">${call.caller_number}</td>
-                    <td>${getStatusBadge('pending')}</td>
-                    <td><span class="badge ${priorityClass}">${priority}</span></td>
-                    <td>
-                        <button class="btn btn-primary btn-sm call-direct-btn" data-phone-number="${call.caller_number}" style="padding: 6px 12px; font-size: 12px;">
-                            Call Now
-                        </button>
-                    </td>
-                `;
-                callQueueTableBody.appendChild(row);
-            });
+    });
+    return latest;
+}
 
-            document.querySelectorAll('.draggable-row').forEach(row => {
-                row.addEventListener('dragstart', handleDragStart);
-                row.addEventListener('dragend', handleDragEnd);
-            });
+function renderCallQueue() {
+    const calls = [...queueCalls.values()]
+        .sort((a, b) => b.call_timestamp.localeCompare(a.call_timestamp) || b.id - a.id)
+        .slice(0, QUEUE_SIZE);
+    if (queueCalls.size > calls.length) {
+        // Forget calls that dropped off the end of the queue
+        queueCalls.clear();
+        calls.forEach(call => queueCalls.set(call.id, call));
+    }
+    callQueueTableBody.innerHTML = '';
+
+    if (calls.length > 0) {
+        noCallsMessage.style.display = 'none';
+
+        calls.forEach((call, index) => {
+            const row = document.createElement('tr');
+            row.classList.add('draggable-row');
+            row.setAttribute('draggable', 'true');
+            row.dataset.phoneNumber = call.caller_number;
+
+            const priority = index < 3 ? 'High' : index < 7 ? 'Medium' : 'Low';
+            const priorityClass = priority === 'High' ? 'badge-danger' :
+                priority === 'Medium' ? 'badge-warning' : 'badge-secondary';
+
+            row.innerHTML = `
+                <td class="font-mono">${call.caller_number}</td>
+                <td>${getStatusBadge('pending')}</td>
+                <td><span class="badge ${priorityClass}">${priority}</span></td>
+                <td>
+                    <button class="btn btn-primary btn-sm call-direct-btn" data-phone-number="${call.caller_number}" style="padding: 6px 12px; font-size: 12px;">
+                        Call Now
+                    </button>
+                </td>
+            `;
+            callQueueTableBody.appendChild(row);
+        });
+
+        document.querySelectorAll('.draggable-row').forEach(row => {
+            row.addEventListener('dragstart', handleDragStart);
+            row.addEventListener('dragend', handleDragEnd);
+        });
 
-            document.querySelectorAll('.call-direct-btn').forEach(button => {
-                button.addEventListener('click', (e) => {
-                    const number = e.target.dataset.phoneNumber;
-                    phoneNumberInput.value = number;
-                    phoneNumberInput.removeAttribute('readonly');
-                    callNotesInput.value = callNotes[number] || '';
-                    if (isDeviceReady && agentId) {
-                        callBtn.click();
-                    }
-                });
+        document.querySelectorAll('.call-direct-btn').forEach(button => {
+            button.addEventListener('click', (e) => {
+                const number = e.target.dataset.phoneNumber;
+                phoneNumberInput.value = number;
+                phoneNumberInput.removeAttribute('readonly');
+                callNotesInput.value = callNotes[number] || '';
+                if (isDeviceReady && agentId) {
+                    callBtn.click();
+                }
             });
+        });
 
-        } else {
-            noCallsMessage.style.display = 'block';
+    } else {
+        noCallsMessage.style.display = 'block';
+    }
+}
+
+// Fallback when the live feed is unavailable: poll, but only download the list when it changed
+async function fetchAndRenderCallQueue() {
+    try {
+        const headers = queueEtag ? { 'If-None-Match': queueEtag } : {};
+        const response = await fetch(`/api/calls?limit=${QUEUE_SIZE}`, { headers, cache: 'no-store' });
+        if (response.status === 304) {
+            return;
+        }
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
         }
+        queueEtag = response.headers.get('ETag');
+        const { calls } = await response.json();
+        applyQueueCalls(calls, true);
     } catch (error) {
         log(`❌ Failed to fetch call queue: ${error}`, 'error');
         noCallsMessage.style.display = 'block';
     }
 }
 
+function startQueuePolling() {
+    if (!queuePollTimer) {
+        fetchAndRenderCallQueue();
+        queuePollTimer = setInterval(fetchAndRenderCallQueue, QUEUE_POLL_INTERVAL);
+    }
+}
+
+function connectCallQueueStream() {
+    if (!window.EventSource) {
+        startQueuePolling();
+        return;
+    }
+    const source = new EventSource(`/api/calls/stream?limit=${QUEUE_SIZE}`);
+    source.addEventListener('snapshot', (e) => applyQueueCalls(JSON.parse(e.data).calls, true));
+    source.addEventListener('changes', (e) => applyQueueCalls(JSON.parse(e.data).calls));
+    source.onopen = () => {
+        clearTimeout(queueReconnectTimer);
+        clearInterval(queuePollTimer);
+        queuePollTimer = null;
+    };
+    source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED) {
+            log('⚠️ Live call queue disconnected, falling back to polling', 'error');
+            startQueuePolling();
+            return;
+        }
+        // The server ends streams every few minutes and the browser reconnects by itself,
+        // resuming from the last event id; only poll if reconnecting takes unusually long
+        clearTimeout(queueReconnectTimer);
+        queueReconnectTimer = setTimeout(() => {
+            if (source.readyState !== EventSource.OPEN) startQueuePolling();
+        }, QUEUE_RECONNECT_GRACE);
+    };
+}
+
 async function removeFromQueue(phoneNumber) {
     try {
         const response = await fetch('/api/remove_lead', {
@@ -285,7 +366,7 @@ async function initTwilio() {
         let chosen_agent = agentSelect.value;
         log("🎤 Microphone access granted", "success");
 
-        const res = await fetch('/token');
+        const res = await fetch(`/token?agent_id=${encodeURIComponent(chosen_agent)}`);
         if (!res.ok) throw new Error('Failed to fetch token');
         const { token } = await res.json();
 
@@ -526,9 +607,12 @@ saveNotesBtn.addEventListener("click", async () => {
     }
 
     try {
-        const res = await fetch(`/api/calls`);
-        const calls = await res.json();
-        const user = calls.find(c => c.caller_number === phoneNumber);
+        let user = latestCallFor(phoneNumber);
+        if (!user) {
+            const res = await fetch(`/api/calls?caller_number=${encodeURIComponent(phoneNumber)}&limit=1`);
+            const { calls } = await res.json();
+            user = calls[0];
+        }
 
         if (!user) {
             log(`❌ No record found for number ${phoneNumber}`, "error");
@@ -550,6 +634,7 @@ saveNotesBtn.addEventListener("click", async () => {
         const data = await response.json();
 
         if (response.ok) {
+            applyQueueCalls([data.call]);
             log(`📝 Notes for ${phoneNumber} saved successfully`, "success");
         } else {
             log(`❌ Failed to save notes: ${data.error}`, "error");
@@ -562,9 +647,8 @@ saveNotesBtn.addEventListener("click", async () => {
 // --- Initialize Application ---
 document.addEventListener('DOMContentLoaded', () => {
     log("🚀 Caprae Capital Professional Softphone System Started");
-    fetchAndRenderCallQueue();
+    connectCallQueueStream();
     loadAgents();
-    setInterval(fetchAndRenderCallQueue, 30000);
 
     // Initial drag-drop listeners for the input field
     phoneNumberInput.addEventListener('dragover', handleDragOver);
@@ -622,13 +706,30 @@ async function getCallSatisfaction() {
     }
 
     try {
-        // 1️⃣ Fetch transcript from server
-        const transcriptRes = await fetch(`/get_transcript/${call_sid}`);
+        // 1️⃣ Cached transcripts come back directly; otherwise poll the queued job until it finishes
+        let transcriptRes = await fetch(`/get_transcript/${call_sid}`);
         if (!transcriptRes.ok) {
-            throw new Error(`Failed to fetch transcript: ${transcriptRes.statusText}`);
+            throw new Error(`Failed to queue transcript: ${transcriptRes.statusText}`);
+        }
+        if (transcriptRes.status === 202) {
+            const job = await transcriptRes.json();
+            log(`⏳ Transcription job ${job.job_id} queued`);
+
+            transcriptRes = await fetch(job.result_url);
+            while (transcriptRes.status === 202) {
+                await new Promise(resolve => setTimeout(resolve, 2000));
+                transcriptRes = await fetch(job.result_url);
+            }
         }
 
         const transcriptData = await transcriptRes.json();
+        if (transcriptRes.status === 404) {
+            log("⚠️ No recordings found for this call", "error");
+            return;
+        }
+        if (!transcriptRes.ok) {
+            throw new Error(`Failed to fetch transcript: ${transcriptData.error || transcriptRes.statusText}`);
+        }
         if (!transcriptData.recordings || transcriptData.recordings.length === 0) {
             log("⚠️ No recordings found for this call", "error");
             return;
@@ -641,7 +742,7 @@ async function getCallSatisfaction() {
         const ratingRes = await fetch("/api/gemini_rating", {
             method: "POST",
             headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({ transcript: transcriptText })
+            body: JSON.stringify({ transcript: transcriptText, call_sid })
         });
 
         if (!ratingRes.ok) {
@@ -0,0 +1,125 @@
+import os
+import queue
+import threading
+import datetime
+from database.lead_database import db, PhoneCall, call_snapshot, record_call_changes, log_call_changes
+from predictive import FINAL_CALL_STATUSES
+
+# Callbacks can arrive out of order; a row never moves back to an earlier status
+STATUS_ORDER = {"queued": 0, "initiated": 1, "ringing": 2, "in-progress": 3,
+                **{status: 4 for status in FINAL_CALL_STATUSES}}
+
+
+class StatusCallbackWriter:
+    """Write-behind ingestion of Twilio status callbacks.
+
+    The webhook only enqueues the event. A single background thread drains the
+    queue, releases agents and feeds the campaign manager as events arrive, and
+    upserts `PhoneCall` rows (by call_sid) in one transaction per batch.
+    """
+
+    def __init__(self, app, dialer, campaign_manager=None, batch_size=None, flush_interval=None):
+        self.app = app
+        self.dialer = dialer
+        self.campaign_manager = campaign_manager
+        self.batch_size = batch_size or int(os.getenv("STATUS_BATCH_SIZE", 200))
+        self.flush_interval = flush_interval or float(os.getenv("STATUS_FLUSH_INTERVAL_SECONDS", 0.25))
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.written = 0
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="status-writer", daemon=True)
+                    self._thread.start()
+
+    def enqueue(self, values):
+        """Queue one callback (the request form) for the writer; never touches the database"""
+        duration = values.get("CallDuration")
+        self._queue.put({
+            "call_sid": values.get("CallSid"),
+            "status": values.get("CallStatus"),
+            "duration": int(duration) if duration and duration.isdigit() else None,
+            "to": values.get("To"),
+        })
+        self._ensure_started()
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get(timeout=self.flush_interval))
+            except queue.Empty:
+                pass
+            try:
+                self._process(batch)
+            except Exception as e:
+                print("Status callback batch failed:", e)
+
+    def _apply_side_effects(self, event, metadata):
+        call_sid, status = event["call_sid"], event["status"]
+        if self.campaign_manager is not None:
+            self.campaign_manager.record_status(call_sid, status, event["duration"])
+        if status in FINAL_CALL_STATUSES:
+            agent_id = metadata.get("connected_agent")
+            if agent_id:
+                self.dialer._mark_agent_available(agent_id)
+            self.dialer.finish_call(call_sid)
+
+    def _process(self, batch):
+        latest = {}
+        for event in batch:
+            if not event["call_sid"] or not event["status"]:
+                continue
+            metadata = self.dialer.get_call_metadata(event["call_sid"])
+            event["agent_id"] = metadata.get("connected_agent") or metadata.get("agent_id")
+            try:
+                self._apply_side_effects(event, metadata)
+            except Exception as e:
+                print("Status callback handling failed:", event["call_sid"], e)
+            previous = latest.get(event["call_sid"])
+            if previous is None or STATUS_ORDER.get(event["status"], 0) >= STATUS_ORDER.get(previous["status"], 0):
+                latest[event["call_sid"]] = event
+        if latest:
+            with self.app.app_context():
+                self._write(latest)
+
+    def _write(self, latest):
+        """Upsert one row per call, and its rollup changes, in a single transaction"""
+        rows = {call.call_sid: call for call in
+                PhoneCall.query.filter(PhoneCall.call_sid.in_(list(latest)))}
+        changes, changed_calls = [], []
+        for call_sid, event in latest.items():
+            call = rows.get(call_sid)
+            if call is None:
+                to = event["to"] or ""
+                if to.startswith("client:"):
+                    # Agent softphone legs only release the agent, they are not customer calls
+                    continue
+                call = PhoneCall(call_sid=call_sid, caller_number=to[:20], use_name="",
+                                 call_timestamp=datetime.datetime.utcnow())
+                db.session.add(call)
+                before = None
+            elif STATUS_ORDER.get(event["status"], 0) < STATUS_ORDER.get(call.status, 0):
+                continue
+            else:
+                before = call_snapshot(call)
+            call.status = event["status"]
+            if event["duration"] is not None:
+                call.call_duration_seconds = event["duration"]
+            if event["agent_id"] and not call.agent_id:
+                call.agent_id = event["agent_id"][:20]
+            changes.append((before, call_snapshot(call)))
+            changed_calls.append(call)
+        record_call_changes(changes)
+        db.session.flush()  # assigns ids to the new rows
+        log_call_changes(call.id for call in changed_calls)
+        db.session.commit()
+        self.written += len(latest)
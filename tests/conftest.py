@@ -0,0 +1,28 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Dummy credentials: no test reaches Twilio
+for name in ("TWILIO_ACCOUNT_SID", "TWILIO_API_KEY_SID", "TWILIO_API_SECRET", "TWILIO_AUTH_TOKEN",
+             "TWILIO_TWIML_APP_SID", "TWILIO_CALLER_ID"):
+    os.environ.setdefault(name, "AC" + "0" * 32)
+os.environ.setdefault("PUBLIC_URL", "https://example.com")
+os.environ["STATE_BACKEND"] = "memory"
+os.environ["GEMINI_MODEL_CLIENT"] = "stub"
+
+
+@pytest.fixture
+def app(tmp_path):
+    from main import create_app
+    from migrations import migrate
+    app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'calls.db'}", "TESTING": True},
+                     warm_up=False)
+    migrate(app)
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,104 @@
+import time
+import threading
+import pytest
+from agent_registry import AgentRegistry
+from state_store import MemoryStateStore, SQLiteStateStore, RedisStateStore
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryStateStore()
+    if request.param == "sqlite":
+        return SQLiteStateStore(str(tmp_path / "state.db"))
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisStateStore(fakeredis.FakeRedis())
+
+
+def _race(count, target):
+    """Run target() on `count` threads released at once; returns their results"""
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def run(i):
+        barrier.wait()
+        results[i] = target()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_claims_of_one_agent_grant_it_once(store):
+    agents = AgentRegistry(store)
+    agents.register("AG1", "client:ag1")
+
+    results = _race(16, lambda: agents.claim_agent("AG1"))
+
+    assert results.count(True) == 1
+    assert agents.status("AG1") == "busy"
+
+
+def test_concurrent_claims_never_hand_out_an_agent_twice(store):
+    agents = AgentRegistry(store)
+    for i in range(4):
+        agents.register(f"AG{i}", f"client:ag{i}")
+
+    claimed = [result[0] for result in _race(12, agents.claim) if result]
+
+    assert sorted(claimed) == ["AG0", "AG1", "AG2", "AG3"]
+    assert agents.counts() == (0, 4)
+
+
+def test_release_makes_the_agent_claimable_again(store):
+    agents = AgentRegistry(store)
+    agents.register("AG1", "client:ag1")
+    agents.register("AG2", "client:ag2")
+
+    assert agents.claim() == ("AG1", "client:ag1")
+    assert agents.counts() == (1, 1)
+    assert agents.release("AG1")
+    assert not agents.release("AG1")
+    assert agents.counts() == (2, 0)
+    # AG2 has been idle longest now
+    assert agents.claim() == ("AG2", "client:ag2")
+
+
+def test_expired_claim_key_can_be_taken_again(store):
+    assert store.add("claim", "AG1", True, ttl=0.05)
+    assert not store.add("claim", "AG1", True, ttl=0.05)
+    assert store.count("claim") == 1
+
+    time.sleep(0.1)
+
+    assert store.count("claim") == 0
+    assert store.add("claim", "AG1", True, ttl=0.05)
+
+
+def test_count_tracks_sets_and_deletes(store):
+    store.set("claim", "AG1", True)
+    store.set("claim", "AG1", True)
+    assert store.add("claim", "AG2", True)
+    assert store.count("claim") == 2
+
+    store.delete("claim", "AG1")
+    store.delete("claim", "AG1")
+    assert store.count("claim") == 1
+    assert store.count("agent") == 0
+
+
+def test_redis_count_reads_its_key_index_instead_of_scanning(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis()
+    store = RedisStateStore(client)
+    monkeypatch.setattr(client, "scan_iter", None)
+    store.set("active_call", "CA1", True, ttl=60)
+    store.set("active_call", "CA2", True, ttl=0.05)
+    store.expire("active_call", "CA3", 60)
+
+    assert store.count("active_call") == 2
+    time.sleep(0.1)
+    assert store.count("active_call") == 1
@@ -0,0 +1,38 @@
+from collections import Counter
+from database.lead_database import PhoneCall
+from database.analytics import ANSWERED_STATUSES
+from status_pipeline import StatusCallbackWriter
+
+
+def _event(call_sid, status, duration=None):
+    return {"call_sid": call_sid, "status": status, "duration": duration, "to": "+15550001111"}
+
+
+def test_stats_match_the_calls_after_status_changes(app, client):
+    client.post("/api/add_call_records", json=[
+        {"caller_number": "+15550000001", "status": "completed", "duration": 30, "timestamp": "2026-01-01T09:00:00"},
+        {"caller_number": "+15550000002", "status": "no-answer", "timestamp": "2026-01-01T10:00:00"},
+        {"caller_number": "+15550000003", "status": "busy", "timestamp": "2026-01-02T09:00:00"},
+    ])
+    writer = StatusCallbackWriter(app, app.extensions["services"].dialer)
+    writer._process([_event("CA1", "ringing"), _event("CA2", "ringing")])
+    # CA1 moves ringing -> in-progress -> completed, across batches
+    writer._process([_event("CA1", "in-progress"), _event("CA2", "no-answer")])
+    writer._process([_event("CA1", "completed", duration=95)])
+
+    with app.app_context():
+        calls = [(call.call_timestamp.date().isoformat(), call.status, call.call_duration_seconds or 0)
+                 for call in PhoneCall.query]
+    answered = [call for call in calls if call[1] in ANSWERED_STATUSES]
+
+    summary = client.get("/api/stats/summary").get_json()
+    assert summary["calls"] == len(calls)
+    assert summary["answered"] == len(answered)
+    assert summary["talk_time_seconds"] == sum(duration for _, _, duration in answered)
+    assert summary["by_status"] == dict(Counter(status for _, status, _ in calls))
+
+    daily = {day["day"]: day for day in client.get("/api/stats/daily").get_json()["days"]}
+    assert {day: row["calls"] for day, row in daily.items()} == dict(Counter(day for day, _, _ in calls))
+    for day, row in daily.items():
+        assert row["by_status"] == dict(Counter(status for d, status, _ in calls if d == day))
+        assert row["talk_time_seconds"] == sum(duration for d, _, duration in answered if d == day)
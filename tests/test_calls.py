@@ -0,0 +1,88 @@
+import pytest
+
+TIMESTAMPS = ["2026-01-01T10:00:00", "2026-01-01T11:00:00", "2026-01-01T12:00:00"]
+
+
+@pytest.fixture
+def calls(client):
+    """21 calls, 7 per timestamp, alternating between two statuses"""
+    records = [{"caller_number": f"+1555000{i:04d}", "status": "completed" if i % 2 else "no-answer",
+                "timestamp": TIMESTAMPS[i % 3]} for i in range(21)]
+    assert client.post("/api/add_call_records", json=records).get_json()["inserted"] == 21
+    return records
+
+
+def _all_pages(client, **params):
+    seen, cursor = [], None
+    while True:
+        query = dict(params, cursor=cursor) if cursor else params
+        body = client.get("/api/calls", query_string=query).get_json()
+        seen.extend(body["calls"])
+        cursor = body["next_cursor"]
+        if not cursor:
+            return seen
+
+
+def test_paging_returns_every_call_once_across_shared_timestamps(client, calls):
+    seen = _all_pages(client, limit=4)
+
+    assert len(seen) == 21
+    assert len({call["id"] for call in seen}) == 21
+    keys = [(call["call_timestamp"], call["id"]) for call in seen]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_filters_apply_on_every_page(client, calls):
+    seen = _all_pages(client, limit=3, status="completed")
+
+    assert len(seen) == 10
+    assert {call["status"] for call in seen} == {"completed"}
+
+
+def test_malformed_cursor_is_rejected(client, calls):
+    response = client.get("/api/calls", query_string={"cursor": "not-a-cursor"})
+
+    assert response.status_code == 400
+    assert "cursor" in response.get_json()["error"]
+
+
+def test_etag_changes_when_the_calls_change(client, calls):
+    first = client.get("/api/calls")
+    etag = first.headers["ETag"]
+    assert client.get("/api/calls", headers={"If-None-Match": etag}).status_code == 304
+
+    client.post("/api/add_call_record", json={"caller_number": "+15559999999", "status": "completed"})
+
+    changed = client.get("/api/calls", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert changed.get_json()["calls"][0]["caller_number"] == "+15559999999"
+
+
+def test_bulk_insert_larger_than_a_chunk_inserts_every_row(app, client):
+    app.config["BULK_INSERT_CHUNK_SIZE"] = 10
+    records = [{"caller_number": f"+1555100{i:04d}", "status": "completed"} for i in range(25)]
+
+    response = client.post("/api/add_call_records", json=records)
+
+    assert response.status_code == 201
+    assert response.get_json() == {"received": 25, "inserted": 25, "failed": 0, "errors": []}
+    assert len(_all_pages(client, limit=1000)) == 25
+
+
+def test_bulk_insert_reports_invalid_rows_and_keeps_the_rest(client):
+    records = [
+        {"caller_number": "+15552000001", "status": "completed"},
+        {"status": "completed"},
+        {"caller_number": "+15552000003", "status": "completed", "duration": -5},
+        {"caller_number": "+15552000004", "status": "busy"},
+        "not a record",
+    ]
+
+    response = client.post("/api/add_call_records", query_string={"chunk_size": 2}, json=records)
+
+    body = response.get_json()
+    assert response.status_code == 201
+    assert (body["received"], body["inserted"], body["failed"]) == (5, 2, 3)
+    assert [error["index"] for error in body["errors"]] == [1, 2, 4]
+    assert {call["caller_number"] for call in _all_pages(client)} == {"+15552000001", "+15552000004"}
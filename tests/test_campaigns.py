@@ -0,0 +1,51 @@
+import datetime
+import campaign
+
+
+def _import_leads(client, *numbers):
+    csv = "phone_number\n" + "\n".join(numbers) + "\n"
+    assert client.post("/api/leads/import", data=csv, content_type="text/csv").status_code == 201
+
+
+def test_invalid_campaign_from_the_lead_queue_leaves_leads_unclaimed(client):
+    _import_leads(client, "+15550100001", "+15550100002")
+
+    response = client.post("/api/campaigns", json={"lead_count": 2, "agent_ids": ["AG001"], "mode": "bogus"})
+
+    assert response.status_code == 400
+    leads = client.post("/api/leads/next", json={"count": 2}).get_json()["leads"]
+    assert sorted(lead["phone_number"] for lead in leads) == ["+15550100001", "+15550100002"]
+
+
+def test_campaign_with_string_agent_ids_is_rejected(client):
+    response = client.post("/api/campaigns", json={"leads": ["+15550100001"], "agent_ids": "AG001"})
+
+    assert response.status_code == 400
+    assert "agent_ids" in response.get_json()["error"]
+
+
+def test_campaign_with_non_object_settings_is_rejected(client):
+    response = client.post("/api/campaigns", json={"leads": ["+15550100001"], "agent_ids": ["AG001"],
+                                                   "settings": [1, 2]})
+
+    assert response.status_code == 400
+    assert "settings" in response.get_json()["error"]
+
+
+class FinishedCampaign:
+    def __init__(self, campaign_id, finished_seconds_ago):
+        self.id = campaign_id
+        self.finished_at = datetime.datetime.utcnow() - datetime.timedelta(seconds=finished_seconds_ago)
+
+    def progress(self):
+        return {"id": self.id}
+
+
+def test_finished_campaigns_are_evicted_after_the_ttl_and_past_the_cap(monkeypatch):
+    monkeypatch.setattr(campaign, "FINISHED_CAMPAIGN_TTL_SECONDS", 3600)
+    monkeypatch.setattr(campaign, "MAX_FINISHED_CAMPAIGNS", 2)
+    manager = campaign.CampaignManager(dialer=None)
+    for campaign_id, age in (("expired", 7200), ("oldest", 30), ("older", 20), ("newest", 10)):
+        manager.campaigns[campaign_id] = FinishedCampaign(campaign_id, age)
+
+    assert sorted(c["id"] for c in manager.list()) == ["newest", "older"]
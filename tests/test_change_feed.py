@@ -0,0 +1,42 @@
+import json
+import time
+from change_feed import Subscriber
+from database.lead_database import db, PhoneCall, CallChange
+
+
+def test_stream_ends_after_its_maximum_lifetime(app):
+    feed = app.extensions["services"].change_feed
+    feed.max_stream_seconds = 0.3
+    started = time.monotonic()
+
+    events = list(feed.stream(limit=10))
+
+    assert time.monotonic() - started < 5
+    assert events[0].startswith("retry:")
+    assert any(event.startswith("id: ") and "event: snapshot" in event for event in events)
+    assert feed.subscriber_count() == 0
+
+
+def test_poll_sends_changes_committed_below_the_last_sent_seq(app, client):
+    client.post("/api/add_call_records", json=[{"caller_number": f"+1555300000{i}", "status": "completed"}
+                                              for i in range(3)])
+    feed = app.extensions["services"].change_feed
+    subscriber = Subscriber(10)
+    feed._subscribers.add(subscriber)
+    with app.app_context():
+        call_ids = [call.id for call in PhoneCall.query.order_by(PhoneCall.id)]
+        db.session.execute(db.delete(CallChange))
+        # seq 12 commits first; seq 11 belongs to a transaction still open
+        db.session.add(CallChange(seq=10, call_id=call_ids[0]))
+        db.session.add(CallChange(seq=12, call_id=call_ids[2]))
+        db.session.commit()
+        assert feed.poll() == 2
+
+        db.session.add(CallChange(seq=11, call_id=call_ids[1]))
+        db.session.commit()
+        assert feed.poll() == 1
+        assert feed.poll() == 0
+
+    events = [subscriber.queue.get_nowait() for _ in range(subscriber.queue.qsize())]
+    assert len(events) == 2
+    assert call_ids[1] in [call["id"] for call in json.loads(events[1].split("data: ", 1)[1])["calls"]]
@@ -0,0 +1,22 @@
+import pytest
+from metrics import HTTP_REQUEST_SECONDS
+
+
+def test_requests_are_timed_by_route_and_status(client):
+    before = HTTP_REQUEST_SECONDS.count("/api/transcript_cache/stats", "GET", "200")
+
+    client.get("/api/transcript_cache/stats")
+
+    assert HTTP_REQUEST_SECONDS.count("/api/transcript_cache/stats", "GET", "200") == before + 1
+
+
+def test_requests_whose_view_raised_are_timed_as_500(app):
+    def fail():
+        raise RuntimeError("boom")
+    app.add_url_rule("/fail", "fail", fail)
+    before = HTTP_REQUEST_SECONDS.count("/fail", "GET", "500")
+
+    with pytest.raises(RuntimeError):
+        app.test_client().get("/fail")
+
+    assert HTTP_REQUEST_SECONDS.count("/fail", "GET", "500") == before + 1
@@ -0,0 +1,20 @@
+def test_rating_rejects_a_non_numeric_call_id(client):
+    response = client.post("/api/gemini_rating", json={"transcript": "hello", "call_id": "abc"})
+
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+def test_rating_batch_rejects_a_non_numeric_call_id(client):
+    response = client.post("/api/gemini_rating/batch", json={"transcripts": [
+        {"transcript": "hello", "call_id": 1}, {"transcript": "bye", "call_id": "x1"}]})
+
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+def test_rating_with_a_numeric_call_id(client):
+    response = client.post("/api/gemini_rating", json={"transcript": "hello", "call_id": "1"})
+
+    assert response.status_code == 200
+    assert 1 <= response.get_json()["rating"] <= 10
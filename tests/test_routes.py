@@ -0,0 +1,4 @@
+def test_transcript_cache_stats(client):
+    response = client.get("/api/transcript_cache/stats")
+    assert response.status_code == 200
+    assert "misses" in response.get_json()
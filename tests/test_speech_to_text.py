@@ -0,0 +1,38 @@
+import wave
+import array
+import speech_to_text
+from speech_to_text import SpeechToTextConverter
+
+RATE = 8000
+
+
+def _write_wav(path, *parts):
+    """Mono 16-bit WAV of (seconds, amplitude) square-wave parts; amplitude 0 is silence"""
+    frames = array.array("h")
+    for seconds, amplitude in parts:
+        frames.extend([amplitude, -amplitude] * int(seconds * RATE / 2))
+    with wave.open(str(path), "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(RATE)
+        wf.writeframes(frames.tobytes())
+
+
+def test_segments_are_cut_at_silence(tmp_path):
+    path = tmp_path / "call.wav"
+    _write_wav(path, (20, 3000), (1, 0), (20, 3000))
+
+    segments = SpeechToTextConverter.plan_segments(str(path))
+
+    assert len(segments) == 2
+    assert 20 * RATE <= segments[0][1] <= 21 * RATE
+
+
+def test_segments_are_cut_at_the_maximum_without_audioop(tmp_path, monkeypatch):
+    monkeypatch.setattr(speech_to_text, "audioop", None)
+    path = tmp_path / "call.wav"
+    _write_wav(path, (20, 3000), (1, 0), (20, 3000))
+
+    segments = SpeechToTextConverter.plan_segments(str(path))
+
+    assert segments[0][1] >= speech_to_text.MAX_SEGMENT_SECONDS * RATE
@@ -0,0 +1,35 @@
+import pytest
+from database.lead_database import PhoneCall
+from status_pipeline import StatusCallbackWriter
+
+
+@pytest.fixture
+def writer(app):
+    """A writer whose batches are processed by the test rather than its thread"""
+    return StatusCallbackWriter(app, app.extensions["services"].dialer)
+
+
+def _event(call_sid, status, duration=None, to="+15550001111"):
+    return {"call_sid": call_sid, "status": status, "duration": duration, "to": to}
+
+
+def _rows(app, call_sid):
+    with app.app_context():
+        return [(call.status, call.call_duration_seconds)
+                for call in PhoneCall.query.filter_by(call_sid=call_sid)]
+
+
+def test_late_ringing_does_not_undo_completed(app, writer):
+    writer._process([_event("CA1", "ringing")])
+    writer._process([_event("CA1", "completed", duration=42)])
+    writer._process([_event("CA1", "ringing")])
+
+    assert _rows(app, "CA1") == [("completed", 42)]
+
+
+def test_callbacks_for_one_call_in_a_batch_upsert_one_row(app, writer):
+    writer._process([_event("CA2", "initiated"), _event("CA2", "ringing"),
+                     _event("CA2", "completed", duration=7), _event("CA2", "in-progress")])
+
+    assert _rows(app, "CA2") == [("completed", 7)]
+    assert writer.written == 1
@@ -0,0 +1,79 @@
+import threading
+import pytest
+import token_service
+from token_service import TokenService
+
+
+class Clock:
+    """Stands in for the time module: time() is moved by hand, sleep() parks the refresher thread"""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+    def sleep(self, seconds):
+        threading.Event().wait()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(token_service, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def signed():
+    return []
+
+
+@pytest.fixture
+def tokens(clock, signed):
+    def sign(identity, ttl):
+        signed.append(identity)
+        return f"{identity}-{len(signed)}"
+    return TokenService(sign, ttl=600, refresh_margin=60, refresh_interval=30)
+
+
+def test_token_is_reused_within_its_ttl(clock, tokens, signed):
+    first = tokens.get("AG1")
+    clock.now += 500
+
+    assert tokens.get("AG1") == first
+    assert signed == ["AG1"]
+    assert tokens.stats()["hits"] == 1
+
+
+def test_invalidate_forces_a_new_token(tokens, signed):
+    first = tokens.get("AG1")
+    tokens.invalidate("AG1")
+
+    assert tokens.get("AG1") != first
+    assert signed == ["AG1", "AG1"]
+
+
+def test_tokens_are_refreshed_before_they_expire(clock, tokens, signed):
+    first = tokens.get("AG1")
+    assert tokens.refresh_due() == 0
+
+    # Inside refresh_margin + refresh_interval of expiry, but not expired
+    clock.now += 520
+    assert tokens.refresh_due() == 1
+
+    refreshed = tokens.get("AG1")
+    assert refreshed != first
+    assert signed == ["AG1", "AG1"]
+    assert tokens.stats()["signed_on_request"] == 1
+
+
+def test_disallowed_identity_gets_no_token(clock, signed):
+    tokens = TokenService(lambda identity, ttl: signed.append(identity) or "token",
+                          is_allowed=lambda identity: identity != "AG2")
+
+    assert tokens.get("AG2") is None
+    assert signed == []
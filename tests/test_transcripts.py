@@ -0,0 +1,120 @@
+import threading
+from types import SimpleNamespace
+import pytest
+from database.lead_database import db
+
+
+@pytest.fixture
+def transcripts(app, monkeypatch):
+    """The app's services with Twilio's recording list and the job queue stubbed out"""
+    services = app.extensions["services"]
+    listed = []
+
+    def get_transcript(call_sid):
+        listed.append(call_sid)
+        return {"call_sid": call_sid, "recordings": []}
+
+    monkeypatch.setattr(services.dialer, "get_transcript", get_transcript)
+    submitted = []
+
+    class Job:
+        def to_dict(self):
+            return {"job_id": "job1", "status": "queued"}
+        id = "job1"
+
+    monkeypatch.setattr(services.transcription_queue, "submit", lambda call_sid: submitted.append(call_sid) or Job())
+    return services.transcript_cache, submitted, listed
+
+
+def test_completed_call_is_served_from_the_cache_alone(client, transcripts):
+    cache, submitted, listed = transcripts
+    cache.put("RE1", "hash1", "hello", call_sid="CA1")
+    cache.put("RE2", "hash2", "bye", call_sid="CA1")
+    assert cache.mark_call_complete("CA1", ["RE1", "RE2"])
+
+    response = client.get("/get_transcript/CA1")
+
+    assert response.status_code == 200
+    assert response.get_json()["cached"] is True
+    assert len(response.get_json()["recordings"]) == 2
+    assert not submitted and not listed
+
+
+def test_cached_call_without_a_completed_job_queues_a_job(client, transcripts):
+    cache, submitted, listed = transcripts
+    cache.put("RE1", "hash1", "hello", call_sid="CA1")
+    cache.put("RE2", "hash2", "bye", call_sid="CA1")
+
+    response = client.get("/get_transcript/CA1")
+
+    assert response.status_code == 202
+    assert submitted == ["CA1"]
+
+
+def test_call_is_not_marked_complete_while_a_recording_is_missing(client, transcripts):
+    cache, submitted, listed = transcripts
+    cache.put("RE1", "hash1", "hello", call_sid="CA1")
+
+    assert not cache.mark_call_complete("CA1", ["RE1", "RE2"])
+    assert client.get("/get_transcript/CA1").status_code == 202
+    assert submitted == ["CA1"]
+
+
+def test_miss_then_refill_counts_one_miss(transcripts):
+    cache, _, _ = transcripts
+    assert cache.get_by_recording("RE9") is None
+    assert cache.get_by_hash("hash9", after_miss=True) is None
+    cache.put("RE9", "hash9", "hi")
+
+    assert cache.stats()["misses"] == 1
+
+    assert cache.get_by_recording("RE8") is None
+    assert cache.get_by_hash("hash9", after_miss=True) is not None
+
+    stats = cache.stats()
+    assert stats["misses"] == 1
+    assert stats["memory_hits"] + stats["db_hits"] == 1
+
+
+@pytest.fixture
+def job_queue(app, monkeypatch):
+    """The transcription queue with its job pool replaced by a list of started job ids"""
+    transcription_queue = app.extensions["services"].transcription_queue
+    started = []
+    monkeypatch.setattr(transcription_queue, "_job_pool",
+                        SimpleNamespace(submit=lambda run, job_id: started.append(job_id)))
+    return transcription_queue, started
+
+
+def test_concurrent_submits_for_a_call_share_one_job(app, job_queue):
+    transcription_queue, started = job_queue
+    barrier = threading.Barrier(8)
+    job_ids = []
+
+    def submit():
+        with app.app_context():
+            barrier.wait()
+            job_ids.append(transcription_queue.submit("CA1").id)
+
+    threads = [threading.Thread(target=submit) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(job_ids) == 8
+    assert len(set(job_ids)) == 1
+    assert started == job_ids[:1]
+
+
+def test_finished_job_lets_a_new_one_be_queued(app, job_queue):
+    transcription_queue, started = job_queue
+    with app.app_context():
+        first = transcription_queue.submit("CA1")
+        first.status = "completed"
+        db.session.commit()
+
+        first_id, second_id = first.id, transcription_queue.submit("CA1").id
+
+    assert second_id != first_id
+    assert started == [first_id, second_id]
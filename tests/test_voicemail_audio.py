@@ -0,0 +1,22 @@
+import array
+import wave
+import voicemail_audio
+
+
+def _pcm16(*samples):
+    return array.array("h", samples).tobytes()
+
+
+def test_voicemails_are_served_as_wav_without_audioop(tmp_path, monkeypatch):
+    with wave.open(str(tmp_path / "male_voice.wav"), "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(16000)
+        wf.writeframes(_pcm16(0, 1000, -1000, 0))
+    monkeypatch.setattr(voicemail_audio, "audioop", None)
+
+    voicemail_audio.prepare_voicemail_audio(folder=str(tmp_path), audio_format="ulaw")
+
+    assert not (tmp_path / voicemail_audio.ulaw_filename("male_voice.wav")).exists()
+    assert voicemail_audio.voicemail_url("male", "https://example.com", folder=str(tmp_path),
+                                         audio_format="ulaw").endswith("/male_voice.wav")
@@ -0,0 +1,50 @@
+import pytest
+
+
+def test_join_with_human_amd_result_claims_the_calls_agent(app, client):
+    dialer = app.extensions["services"].dialer
+    dialer.agent_online("AG001")
+    dialer.update_call_metadata("CA1", conference_name="conf_AG001_1", agent_id="AG001")
+
+    response = client.post("/join", data={"Room": "conf_AG001_1", "CallSid": "CA1", "AnsweredBy": "human"})
+
+    assert response.status_code == 200
+    assert dialer.agents.status("AG001") == "busy"
+    assert dialer.get_call_metadata("CA1")["connected_agent"] == "AG001"
+
+
+def test_join_with_machine_amd_result_leaves_the_agent_available(app, client):
+    dialer = app.extensions["services"].dialer
+    dialer.agent_online("AG001")
+    dialer.update_call_metadata("CA2", conference_name="conf_AG001_2", agent_id="AG001")
+
+    client.post("/join", data={"Room": "conf_AG001_2", "CallSid": "CA2", "AnsweredBy": "machine_end_beep"})
+
+    assert dialer.agents.status("AG001") == "available"
+
+
+def test_join_with_machine_amd_result_plays_the_voicemail(client):
+    response = client.post("/join", data={"Room": "conf_AG001_3", "CallSid": "CA3", "AnsweredBy": "machine_end_beep",
+                                          "vm_audio_url": "https://example.com/vm.mp3"})
+
+    body = response.get_data(as_text=True)
+    assert "<Play>https://example.com/vm.mp3</Play>" in body
+    assert "<Conference" not in body
+
+
+def test_join_with_machine_amd_result_and_no_voicemail_hangs_up(client):
+    body = client.post("/join", data={"Room": "conf_AG001_4", "CallSid": "CA4",
+                                      "AnsweredBy": "machine_start"}).get_data(as_text=True)
+
+    assert "<Hangup" in body
+    assert "<Conference" not in body
+
+
+@pytest.mark.parametrize("answered_by", ["machine_start", "machine_end_beep", "machine_end_silence",
+                                         "machine_end_other"])
+def test_machine_detection_plays_the_voicemail_for_every_machine_result(client, answered_by):
+    response = client.post("/handle_machine_detection", data={
+        "Room": "conf_AG001_5", "CallSid": "CA5", "AnsweredBy": answered_by,
+        "vm_audio_url": "https://example.com/vm.mp3"})
+
+    assert "<Play>https://example.com/vm.mp3</Play>" in response.get_data(as_text=True)
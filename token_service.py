@@ -0,0 +1,134 @@
+import os
+import time
+import threading
+
+
+class TokenService:
+    """Signed Voice access tokens, cached per identity.
+
+    A cached token is served until REFRESH_MARGIN seconds before it expires,
+    so a client always gets a token with at least that much life left. A
+    background thread re-signs tokens of recently active identities before
+    they reach the margin, and forgets identities idle for a full TTL.
+    `is_allowed(identity)` is checked on every request and refresh, so a
+    disabled agent stops receiving tokens on every worker.
+    """
+
+    def __init__(self, sign, is_allowed=None, ttl=None, refresh_margin=None, refresh_interval=None):
+        self.sign = sign
+        self.is_allowed = is_allowed or (lambda identity: True)
+        self.ttl = ttl or int(os.getenv("TOKEN_TTL_SECONDS", 3600))
+        self.refresh_margin = refresh_margin or int(os.getenv("TOKEN_REFRESH_MARGIN_SECONDS", 300))
+        self.refresh_interval = refresh_interval or int(os.getenv("TOKEN_REFRESH_INTERVAL_SECONDS", 30))
+        # identity -> {"token", "expires_at", "last_used"}
+        self._tokens = {}
+        self._lock = threading.Lock()
+        self._identity_locks = {}
+        self._thread = None
+        self._stats = {"hits": 0, "signed_on_request": 0, "refreshed": 0, "invalidated": 0,
+                       "sign_seconds": 0.0, "signatures": 0}
+
+    def _ensure_refresher(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._refresh_loop, name="token-refresher", daemon=True)
+                    self._thread.start()
+
+    def _sign(self, identity):
+        started = time.perf_counter()
+        token = self.sign(identity, self.ttl)
+        elapsed = time.perf_counter() - started
+        entry = {"token": token, "expires_at": time.time() + self.ttl, "last_used": time.time()}
+        with self._lock:
+            previous = self._tokens.get(identity)
+            if previous:
+                entry["last_used"] = previous["last_used"]
+            self._tokens[identity] = entry
+            self._stats["signatures"] += 1
+            self._stats["sign_seconds"] += elapsed
+        return entry
+
+    def _fresh(self, entry, now):
+        return entry is not None and entry["expires_at"] - now > self.refresh_margin
+
+    def get(self, identity):
+        """Signed token for identity; None if the identity is not allowed a token"""
+        if not self.is_allowed(identity):
+            self.invalidate(identity)
+            return None
+        self._ensure_refresher()
+        now = time.time()
+        with self._lock:
+            entry = self._tokens.get(identity)
+            if self._fresh(entry, now):
+                entry["last_used"] = now
+                self._stats["hits"] += 1
+                return entry["token"]
+            identity_lock = self._identity_locks.setdefault(identity, threading.Lock())
+        # One signature per identity even when its softphone reconnects many times at once
+        with identity_lock:
+            with self._lock:
+                entry = self._tokens.get(identity)
+                if self._fresh(entry, now):
+                    entry["last_used"] = now
+                    self._stats["hits"] += 1
+                    return entry["token"]
+            entry = self._sign(identity)
+            with self._lock:
+                entry["last_used"] = now
+                self._stats["signed_on_request"] += 1
+            return entry["token"]
+
+    def invalidate(self, identity):
+        with self._lock:
+            if self._tokens.pop(identity, None) is not None:
+                self._stats["invalidated"] += 1
+            self._identity_locks.pop(identity, None)
+
+    def refresh_due(self):
+        """Re-sign tokens that will hit the refresh margin before the next pass; returns how many"""
+        now = time.time()
+        horizon = now + self.refresh_margin + self.refresh_interval
+        with self._lock:
+            idle = [i for i, e in self._tokens.items() if now - e["last_used"] > self.ttl]
+            due = [i for i, e in self._tokens.items() if e["expires_at"] <= horizon and i not in idle]
+        for identity in idle:
+            self.invalidate(identity)
+        refreshed = 0
+        for identity in due:
+            if not self.is_allowed(identity):
+                self.invalidate(identity)
+                continue
+            self._sign(identity)
+            refreshed += 1
+        with self._lock:
+            self._stats["refreshed"] += refreshed
+        return refreshed
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            try:
+                self.refresh_due()
+            except Exception as e:
+                print("Token refresh failed:", e)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            cached = len(self._tokens)
+        average = stats["sign_seconds"] / stats["signatures"] if stats["signatures"] else 0.0
+        requests = stats["hits"] + stats["signed_on_request"]
+        return {
+            "cached_identities": cached,
+            "requests": requests,
+            "hits": stats["hits"],
+            "hit_rate": stats["hits"] / requests if requests else None,
+            "signed_on_request": stats["signed_on_request"],
+            "refreshed_in_background": stats["refreshed"],
+            "invalidated": stats["invalidated"],
+            "average_sign_ms": average * 1000,
+            # Signing work the request path avoided thanks to cache hits
+            "signing_ms_saved": stats["hits"] * average * 1000,
+        }
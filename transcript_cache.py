@@ -0,0 +1,129 @@
+import os
+import json
+import threading
+from collections import OrderedDict
+from database.lead_database import db, TranscriptCacheEntry
+
+
+class TranscriptCache:
+    """Transcripts keyed by recording SID and by audio hash.
+
+    A size-bounded in-memory LRU sits in front of the `transcript_cache`
+    table. Looking up by SID avoids the download altogether; looking up by the
+    sha256 of the audio avoids re-transcribing the same audio under another SID.
+    """
+
+    def __init__(self, app, max_entries=None):
+        self.app = app
+        self.max_entries = max_entries or int(os.getenv("TRANSCRIPT_CACHE_SIZE", 1024))
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def _lru_get(self, key):
+        with self._lock:
+            result = self._lru.get(key)
+            if result is not None:
+                self._lru.move_to_end(key)
+                self.memory_hits += 1
+            return result
+
+    def _lru_put(self, key, result):
+        with self._lock:
+            self._lru[key] = result
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    def _lookup(self, key, column, value, after_miss=False):
+        """{"transcript", "segments"} for a key, or None.
+
+        after_miss: a second try for a recording that just missed by SID, so it
+        is the same lookup; a hit turns that miss into a hit, a miss isn't counted again.
+        """
+        result = self._lru_get(key)
+        if result is None:
+            with self.app.app_context():
+                entry = TranscriptCacheEntry.query.filter(column == value).first()
+                result = entry.result() if entry else None
+            with self._lock:
+                if result is not None:
+                    self.db_hits += 1
+                elif not after_miss:
+                    self.misses += 1
+            if result is not None:
+                self._lru_put(key, result)
+        if result is not None and after_miss:
+            with self._lock:
+                self.misses -= 1
+        return result
+
+    def get_by_recording(self, recording_sid):
+        return self._lookup(f"sid:{recording_sid}", TranscriptCacheEntry.recording_sid, recording_sid)
+
+    def get_by_hash(self, audio_hash, after_miss=False):
+        return self._lookup(f"hash:{audio_hash}", TranscriptCacheEntry.audio_hash, audio_hash, after_miss)
+
+    def get_call(self, call_sid):
+        """All cached recordings of a call, as /get_transcript results"""
+        with self.app.app_context():
+            entries = (TranscriptCacheEntry.query
+                       .filter(TranscriptCacheEntry.call_sid == call_sid)
+                       .order_by(TranscriptCacheEntry.created_at)
+                       .all())
+            return [entry.to_dict() for entry in entries]
+
+    def get_complete_call(self, call_sid):
+        """The call's cached recordings if a job transcribed all of them, else None"""
+        with self.app.app_context():
+            entries = (TranscriptCacheEntry.query
+                       .filter(TranscriptCacheEntry.call_sid == call_sid)
+                       .order_by(TranscriptCacheEntry.created_at)
+                       .all())
+            if not entries or not all(entry.call_recordings for entry in entries) or \
+                    len(entries) < entries[0].call_recordings:
+                return None
+            return [entry.to_dict() for entry in entries]
+
+    def mark_call_complete(self, call_sid, recording_sids):
+        """Record that these are all of the call's recordings; only if every one of them is cached"""
+        recording_sids = set(recording_sids)
+        with self.app.app_context():
+            updated = (TranscriptCacheEntry.query
+                       .filter(TranscriptCacheEntry.recording_sid.in_(recording_sids))
+                       .update({"call_sid": call_sid, "call_recordings": len(recording_sids)},
+                               synchronize_session=False))
+            if recording_sids and updated == len(recording_sids):
+                db.session.commit()
+                return True
+            db.session.rollback()
+            return False
+
+    def put(self, recording_sid, audio_hash, transcript, segments=None, call_sid=None, url=None):
+        with self.app.app_context():
+            db.session.merge(TranscriptCacheEntry(
+                recording_sid=recording_sid,
+                call_sid=call_sid,
+                audio_hash=audio_hash,
+                url=url,
+                transcript=transcript,
+                segments=json.dumps(segments or []),
+            ))
+            db.session.commit()
+        result = {"transcript": transcript, "segments": segments or []}
+        self._lru_put(f"sid:{recording_sid}", result)
+        self._lru_put(f"hash:{audio_hash}", result)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.db_hits + self.misses
+            return {
+                "entries_in_memory": len(self._lru),
+                "max_entries": self.max_entries,
+                "memory_hits": self.memory_hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.db_hits) / lookups, 4) if lookups else None,
+            }
@@ -0,0 +1,114 @@
+import os
+import json
+import uuid
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from database.lead_database import db, TranscriptionJob, PENDING_JOB_WHERE, dialect_insert
+
+
+class TranscriptionQueue:
+    """Background transcription of call recordings.
+
+    Jobs are persisted in the `transcription_jobs` table so they can be polled
+    from any worker. A job fetches the recording list of a call and transcribes
+    all of its recordings in parallel on a separate pool.
+    """
+
+    # A job left "running" longer than this was orphaned by a dead worker
+    STALE_JOB_SECONDS = 30 * 60
+
+    def __init__(self, app, dialer, cache=None, max_workers=None, recording_workers=None):
+        self.app = app
+        self.dialer = dialer
+        self.cache = cache
+        max_workers = max_workers or int(os.getenv("TRANSCRIPTION_WORKERS", 4))
+        recording_workers = recording_workers or int(os.getenv("TRANSCRIPTION_RECORDING_WORKERS", 8))
+        # Two pools so a job waiting on its recordings never starves them of threads
+        self._job_pool = ThreadPoolExecutor(max_workers, thread_name_prefix="transcribe-job")
+        self._recording_pool = ThreadPoolExecutor(recording_workers, thread_name_prefix="transcribe-rec")
+        self._converter = None
+        self._converter_lock = threading.Lock()
+
+    @property
+    def converter(self):
+        if self._converter is None:
+            with self._converter_lock:
+                if self._converter is None:
+                    # speech_recognition and the Twilio client are only imported once needed
+                    from speech_to_text import SpeechToTextConverter
+                    self._converter = SpeechToTextConverter(cache=self.cache)
+        return self._converter
+
+    def submit(self, call_sid):
+        """Enqueue a job for call_sid, reusing one that is already pending"""
+        while True:
+            # The pending-job unique index makes this atomic: concurrent submits get the same job
+            statement = (dialect_insert()(TranscriptionJob)
+                         .values(id=uuid.uuid4().hex, call_sid=call_sid, status="queued")
+                         .on_conflict_do_nothing(index_elements=["call_sid"], index_where=PENDING_JOB_WHERE)
+                         .returning(TranscriptionJob.id))
+            job_id = db.session.execute(statement).scalar()
+            db.session.commit()
+            if job_id is not None:
+                self._job_pool.submit(self._run, job_id)
+                return db.session.get(TranscriptionJob, job_id)
+            job = TranscriptionJob.query.filter(TranscriptionJob.call_sid == call_sid, PENDING_JOB_WHERE).first()
+            if job:
+                return job
+            # The pending job finished in between; queue a new one
+
+    def get(self, job_id):
+        return db.session.get(TranscriptionJob, job_id)
+
+    def resume_pending(self):
+        """Re-submit queued jobs and jobs orphaned in "running" (call once at startup)"""
+        stale_before = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.STALE_JOB_SECONDS)
+        (TranscriptionJob.query
+         .filter(TranscriptionJob.status == "running", TranscriptionJob.started_at < stale_before)
+         .update({"status": "queued"}, synchronize_session=False))
+        db.session.commit()
+        job_ids = [job_id for (job_id,) in
+                   db.session.query(TranscriptionJob.id).filter(TranscriptionJob.status == "queued")]
+        for job_id in job_ids:
+            self._job_pool.submit(self._run, job_id)
+        return len(job_ids)
+
+    def _claim(self, job_id):
+        # Atomic queued -> running, so a job resumed by several workers runs once
+        claimed = (TranscriptionJob.query
+                   .filter(TranscriptionJob.id == job_id, TranscriptionJob.status == "queued")
+                   .update({"status": "running", "started_at": datetime.datetime.utcnow()},
+                           synchronize_session=False))
+        db.session.commit()
+        return claimed == 1
+
+    def _transcribe(self, call_sid, recording):
+        result = {"recording_sid": recording["recording_sid"], "url": recording["url"]}
+        try:
+            result.update(self.converter.convert_detailed(recording["recording_sid"],
+                                                          call_sid=call_sid, url=recording["url"]))
+        except Exception as e:
+            result.update({"transcript": None, "segments": [], "error": str(e)})
+        return result
+
+    def _run(self, job_id):
+        with self.app.app_context():
+            if not self._claim(job_id):
+                return
+            job = db.session.get(TranscriptionJob, job_id)
+            try:
+                recordings = self.dialer.get_transcript(job.call_sid)["recordings"]
+                futures = [self._recording_pool.submit(self._transcribe, job.call_sid, rec) for rec in recordings]
+                results = [f.result() for f in futures]
+                job.result = json.dumps(results)
+                job.status = "completed"
+                if self.cache is not None and recordings and not any("error" in r for r in results):
+                    # Later lookups of this call are answered from the cache without asking Twilio
+                    self.cache.mark_call_complete(job.call_sid, [r["recording_sid"] for r in recordings])
+            except Exception as e:
+                print("Transcription job failed:", job_id, e)
+                job.status = "failed"
+                job.error = str(e)[:500]
+            job.finished_at = datetime.datetime.utcnow()
+            db.session.commit()
@@ -0,0 +1,89 @@
+import os
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from twilio.rest import Client
+from twilio.http.http_client import TwilioHttpClient
+from metrics import TWILIO_REQUEST_SECONDS, TWILIO_ERRORS, twilio_operation
+from dotenv import load_dotenv
+
+load_dotenv()
+
+HTTP_POOL_SIZE = int(os.getenv("TWILIO_HTTP_POOL_SIZE", 32))
+HTTP_RETRIES = int(os.getenv("TWILIO_HTTP_RETRIES", 3))
+HTTP_TIMEOUT = float(os.getenv("TWILIO_HTTP_TIMEOUT", 15))
+
+_lock = threading.Lock()
+_session = None
+_client = None
+
+
+class InstrumentedHttpClient(TwilioHttpClient):
+    """TwilioHttpClient that records latency and errors per REST operation (calls.create, recordings.list, ...)"""
+
+    def request(self, method, url, *args, **kwargs):
+        operation = twilio_operation(method, url)
+        started = time.perf_counter()
+        try:
+            response = super().request(method, url, *args, **kwargs)
+        except Exception:
+            TWILIO_ERRORS.inc(operation, "exception")
+            raise
+        finally:
+            TWILIO_REQUEST_SECONDS.observe(time.perf_counter() - started, operation)
+        if response.status_code >= 400:
+            TWILIO_ERRORS.inc(operation, str(response.status_code))
+        return response
+
+
+def _reset_after_fork():
+    # A forked worker opens its own connections instead of sharing its parent's sockets
+    global _lock, _session, _client
+    _lock, _session, _client = threading.Lock(), None, None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _build_session():
+    # Only idempotent requests are retried; a retried calls.create could dial twice
+    retry = Retry(
+        total=HTTP_RETRIES,
+        backoff_factor=0.5,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD", "DELETE"}),
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_http_session():
+    """Process-wide keep-alive requests.Session shared by the Twilio client and recording downloads"""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def get_twilio_client():
+    """Process-wide Twilio REST client on top of the pooled session"""
+    global _client
+    if _client is None:
+        session = get_http_session()
+        with _lock:
+            if _client is None:
+                http_client = InstrumentedHttpClient(pool_connections=True, timeout=HTTP_TIMEOUT)
+                http_client.session = session
+                _client = Client(
+                    os.getenv("TWILIO_ACCOUNT_SID"),
+                    os.getenv("TWILIO_AUTH_TOKEN"),
+                    http_client=http_client,
+                )
+    return _client
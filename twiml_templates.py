@@ -0,0 +1,97 @@
+import re
+import inspect
+from twilio.twiml.voice_response import VoiceResponse
+
+HOLD_MUSIC_URL = "http://twimlets.com/holdmusic?Bucket=com.twilio.music.classical"
+
+_PLACEHOLDER = "@@twiml:{}@@"
+_PLACEHOLDER_RE = re.compile(r"@@twiml:(\w+)@@")
+
+
+def escape(value):
+    """Escape a value for XML text or a double/single-quoted attribute"""
+    return (str(value).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+            .replace('"', "&quot;").replace("'", "&apos;"))
+
+
+class TwimlTemplate:
+    """A TwiML response shape serialized once, with its parameters filled in per request.
+
+    `build` takes the parameters by name and returns a VoiceResponse. It is
+    called a single time with placeholder strings; the XML is split around
+    them so render() is only string joins plus escaping of the values.
+    """
+
+    def __init__(self, build):
+        names = list(inspect.signature(build).parameters)
+        xml = str(build(**{name: _PLACEHOLDER.format(name) for name in names}))
+        pieces = _PLACEHOLDER_RE.split(xml)
+        self._literals = pieces[0::2]
+        self._names = pieces[1::2]
+
+    def render(self, **values):
+        out = [self._literals[0]]
+        for name, literal in zip(self._names, self._literals[1:]):
+            value = values.get(name)
+            out.append("" if value is None else escape(value))
+            out.append(literal)
+        return "".join(out)
+
+
+def _conference(room, **attributes):
+    resp = VoiceResponse()
+    resp.dial().conference(room, **attributes)
+    return resp
+
+
+def _say_hangup(message):
+    resp = VoiceResponse()
+    resp.say(message)
+    resp.hangup()
+    return resp
+
+
+def _play_hangup(url):
+    resp = VoiceResponse()
+    resp.play(url)
+    resp.hangup()
+    return resp
+
+
+def _play(url):
+    resp = VoiceResponse()
+    resp.play(url)
+    return resp
+
+
+def _say(message):
+    resp = VoiceResponse()
+    resp.say(message)
+    return resp
+
+
+def _say_play_hangup(message, url):
+    resp = VoiceResponse()
+    resp.say(message)
+    resp.play(url)
+    resp.hangup()
+    return resp
+
+
+# Customer or agent joining an existing conference
+CONFERENCE = TwimlTemplate(lambda room: _conference(room))
+JOIN_CONFERENCE = TwimlTemplate(lambda room: _conference(
+    room, start_conference_on_enter=True, end_conference_on_exit=True, record=False))
+AGENT_CONFERENCE = TwimlTemplate(lambda room: _conference(
+    room, start_conference_on_enter=True, end_conference_on_exit=True))
+# Caller waiting on hold music until the agent's softphone joins
+HOLD_CONFERENCE = TwimlTemplate(lambda room: _conference(
+    room, start_conference_on_enter=True, wait_url=HOLD_MUSIC_URL))
+HOLD_CONFERENCE_UNTIL_EXIT = TwimlTemplate(lambda room: _conference(
+    room, start_conference_on_enter=True, end_conference_on_exit=True, wait_url=HOLD_MUSIC_URL))
+
+SAY = TwimlTemplate(_say)
+SAY_HANGUP = TwimlTemplate(_say_hangup)
+PLAY = TwimlTemplate(_play)
+PLAY_HANGUP = TwimlTemplate(_play_hangup)
+SAY_PLAY_HANGUP = TwimlTemplate(_say_play_hangup)
@@ -0,0 +1,82 @@
+import os
+import wave
+import struct
+from dotenv import load_dotenv
+
+load_dotenv()
+
+try:
+    import audioop  # removed from the stdlib in Python 3.13, where audioop-lts provides it
+except ImportError:
+    audioop = None
+
+VOICE_FOLDER = os.path.join(os.path.dirname(__file__), "ai_voice")
+VOICEMAIL_FILES = {
+    "male": "male_voice.wav",
+    "female": "female_voice.wav",
+}
+# "wav" serves the recordings as they are; "ulaw" serves 8 kHz mono mu-law copies,
+# the format the phone network plays anyway, at a fraction of the size
+VOICEMAIL_FORMAT = os.getenv("VOICEMAIL_FORMAT", "wav").lower()
+TELEPHONY_RATE = 8000
+WAVE_FORMAT_MULAW = 7
+
+
+def ulaw_filename(filename):
+    return f"{os.path.splitext(filename)[0]}_8k_ulaw.wav"
+
+
+def transcode_to_ulaw(source, destination):
+    """Write an 8 kHz mono mu-law WAV copy of a PCM WAV file"""
+    with wave.open(source, "rb") as wf:
+        rate, width, channels = wf.getframerate(), wf.getsampwidth(), wf.getnchannels()
+        frames = wf.readframes(wf.getnframes())
+    if channels == 2:
+        frames = audioop.tomono(frames, width, 0.5, 0.5)
+    if rate != TELEPHONY_RATE:
+        frames, _ = audioop.ratecv(frames, width, 1, rate, TELEPHONY_RATE, None)
+    data = audioop.lin2ulaw(frames, width)
+
+    # The wave module only writes PCM, so the (non-PCM) header is written by hand:
+    # fmt chunk with cbSize, plus the fact chunk non-PCM formats require
+    fmt = struct.pack("<HHIIHHH", WAVE_FORMAT_MULAW, 1, TELEPHONY_RATE, TELEPHONY_RATE, 1, 8, 0)
+    fact = struct.pack("<I", len(data))
+    padding = b"\x00" if len(data) % 2 else b""
+    riff_size = 4 + (8 + len(fmt)) + (8 + len(fact)) + (8 + len(data) + len(padding))
+    tmp = destination + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(b"RIFF" + struct.pack("<I", riff_size) + b"WAVE")
+        f.write(b"fmt " + struct.pack("<I", len(fmt)) + fmt)
+        f.write(b"fact" + struct.pack("<I", len(fact)) + fact)
+        f.write(b"data" + struct.pack("<I", len(data)) + data + padding)
+    os.replace(tmp, destination)
+
+
+def prepare_voicemail_audio(folder=VOICE_FOLDER, audio_format=VOICEMAIL_FORMAT):
+    """Transcode the voicemail recordings when the ulaw format is selected (skips up-to-date copies)"""
+    if audio_format != "ulaw":
+        return
+    if audioop is None:
+        print("audioop is not available (pip install audioop-lts), serving voicemails as wav")
+        return
+    for filename in VOICEMAIL_FILES.values():
+        source = os.path.join(folder, filename)
+        destination = os.path.join(folder, ulaw_filename(filename))
+        if not os.path.exists(source):
+            continue
+        if os.path.exists(destination) and os.path.getmtime(destination) >= os.path.getmtime(source):
+            continue
+        try:
+            transcode_to_ulaw(source, destination)
+        except (wave.Error, EOFError) as e:
+            print(f"Could not transcode {filename}, serving it as is:", e)
+
+
+def voicemail_url(voice, base_url, folder=VOICE_FOLDER, audio_format=VOICEMAIL_FORMAT):
+    """Public URL of a voicemail recording; raises ValueError for unknown voices"""
+    filename = VOICEMAIL_FILES.get(voice)
+    if filename is None:
+        raise ValueError(f"Unknown voicemail: {voice}")
+    if audio_format == "ulaw" and os.path.exists(os.path.join(folder, ulaw_filename(filename))):
+        filename = ulaw_filename(filename)
+    return f"{base_url.rstrip('/')}/ai_voice/{filename}"
@@ -0,0 +1,110 @@
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import twiml_templates as twiml
+
+
+class WebhookError(Exception):
+    """Bad webhook request; carries the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class WebhookHandlers:
+    """Twilio voice webhooks, independent of the web framework serving them.
+
+    Each handler takes the request parameters and returns (twiml, tasks).
+    Handlers only touch the state store; outbound Twilio REST calls are
+    returned as tasks, which the caller runs on a background pool once the
+    TwiML has been sent, so a slow REST API never holds up the caller.
+    """
+
+    # Request path -> handler method
+    ROUTES = {
+        "/voice": "voice",
+        "/join": "join",
+        "/incoming_call": "incoming_call",
+        "/handle_machine_detection": "machine_detection",
+    }
+
+    def __init__(self, dialer, campaign_manager, max_workers=None):
+        self.dialer = dialer
+        self.campaign_manager = campaign_manager
+        max_workers = max_workers or int(os.getenv("WEBHOOK_TASK_WORKERS", 16))
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="webhook-task")
+
+    def voice(self, params):
+        return self.dialer.softphone_twiml(params.get("To"), params.get("CallSid"))
+
+    def join(self, params):
+        room = params.get("Room")
+        if not room:
+            raise WebhookError("Missing Room parameter")
+        answered_by = params.get("AnsweredBy")
+        if answered_by:
+            # place_call runs AMD synchronously, so its result arrives here rather than at the fallback
+            call_sid = params.get("CallSid")
+            abandoned = self.campaign_manager.record_amd(call_sid, answered_by)
+            if answered_by == "human":
+                self._connect_agent(call_sid, abandoned)
+            elif answered_by.startswith("machine") or answered_by == "fax":
+                return self._unanswered_twiml(answered_by, params.get("vm_audio_url")), []
+        return self.dialer.generate_join_twiml(room), []
+
+    def incoming_call(self, params):
+        call_sid = params.get("CallSid")
+        agent = self.dialer._claim_available_agent()
+        conference_name = f"incoming_conf_{call_sid}"
+        tasks = []
+        if agent:
+            agent_id, client_identity = agent
+            tasks.append(lambda: self.dialer.dial_agent_into_conference(
+                agent_id, client_identity, conference_name, customer_call_sid=call_sid))
+        return twiml.HOLD_CONFERENCE.render(room=conference_name), tasks
+
+    def machine_detection(self, params):
+        answered_by = params.get("AnsweredBy")
+        vm_audio_url = params.get("vm_audio_url")
+        conference_name = params.get("Room")
+        call_sid = params.get("CallSid")
+        abandoned = self.campaign_manager.record_amd(call_sid, answered_by)
+
+        if answered_by == "human":
+            self._connect_agent(call_sid, abandoned)
+            return twiml.CONFERENCE.render(room=conference_name), []
+        return self._unanswered_twiml(answered_by, vm_audio_url), []
+
+    def _unanswered_twiml(self, answered_by, vm_audio_url):
+        """Voicemail for an answering machine (machine_start, machine_end_beep, ...), else hang up"""
+        if answered_by and answered_by.startswith("machine") and vm_audio_url:
+            return twiml.PLAY_HANGUP.render(url=vm_audio_url)
+        return twiml.SAY_HANGUP.render(message="The call could not be completed.")
+
+    def _connect_agent(self, call_sid, abandoned):
+        """Mark the agent a human-answered call was placed for busy, unless it already is"""
+        metadata = self.dialer.get_call_metadata(call_sid)
+        agent_id = metadata.get('agent_id')
+        if metadata.get('connected_agent') or not agent_id or abandoned:
+            return
+        if self.dialer.agents.claim_agent(agent_id):
+            # Released by /call_status when this call ends
+            self.dialer.update_call_metadata(call_sid, connected_agent=agent_id)
+
+    def handle(self, name, params):
+        return getattr(self, name)(params)
+
+    def _run_task(self, task):
+        try:
+            task()
+        except Exception as e:
+            print("Webhook background task failed:", e)
+
+    def run_background(self, tasks):
+        for task in tasks:
+            self._executor.submit(self._run_task, task)
+
+    async def handle_async(self, name, params):
+        # Handlers may hit a shared (SQLite / Redis) state store, so keep them off the event loop
+        return await asyncio.to_thread(self.handle, name, params)
@@ -0,0 +1,11 @@
+"""WSGI entry point: `gunicorn wsgi:app` (run `python migrations.py` first).
+
+gunicorn.conf.py runs threaded (gthread) workers, which the live call
+stream needs: each open dashboard holds a thread.
+
+Every worker builds its own services; don't combine this with --preload,
+which would create the app, and start its warm-up thread, before forking.
+"""
+from main import create_app
+
+app = create_app()